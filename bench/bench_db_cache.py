@@ -0,0 +1,64 @@
+"""
+Microbenchmark for the master's read path.
+
+Runs the full (unconditional) /api/manifest response and the dashboard page
+through Flask's test client against a throwaway database and prints
+requests/sec. Set SIGNAGE_DB_CACHE=0 to measure with the in-memory snapshot
+disabled.
+
+    python bench/bench_db_cache.py [--videos 200] [--seconds 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'master'))
+
+
+def measure(client, path, seconds, headers=None):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        r = client.get(path, headers=headers or {})
+        assert r.status_code in (200, 304), r.status_code
+        count += 1
+    return count / seconds
+
+
+def run_benchmark(num_videos, seconds):
+    workdir = tempfile.mkdtemp(prefix='signage-bench-')
+    os.chdir(workdir)  # DB_PATH is relative to the working directory
+
+    import app as master_app
+    import database
+
+    for i in range(num_videos):
+        database.add_video(f'video_{i:04d}.mp4', rotation=(i % 4) * 90)
+    database.set_playlist([v['id'] for v in database.get_all_videos()[:20]])
+
+    client = master_app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['logged_in'] = True
+
+    etag = client.get('/api/manifest').headers.get('ETag')
+    results = {
+        'manifest_full_rps': measure(client, '/api/manifest', seconds),
+        'manifest_304_rps': measure(client, '/api/manifest', seconds, {'If-None-Match': etag}),
+        'dashboard_rps': measure(client, '/', seconds),
+    }
+
+    print(f"videos={num_videos} cache={os.environ.get('SIGNAGE_DB_CACHE', '1')}")
+    for name, rps in results.items():
+        print(f"  {name:<20} {rps:10.1f} req/s")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--videos', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+    run_benchmark(args.videos, args.seconds)
@@ -0,0 +1,124 @@
+"""
+Concurrent download benchmark: many screens syncing a new video at once.
+
+Uploads one file of --size-mb to a fresh master, then has --clients
+processes download it simultaneously from /media/<blob>, the way agents do
+after a manifest change. Every other client fetches in two Range requests,
+like an agent resuming a dropped download. Compares the Flask development
+server (app.py) with the production entry point (wsgi.py under gunicorn).
+
+Reports aggregate throughput, per-client download time and the CPU time the
+master's processes used, as JSON.
+
+    python bench/bench_downloads.py [--clients 24] [--size-mb 100] [--workers 4]
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+import requests
+
+from bench_e2e import Harness, git_commit, percentiles, process_cpu_seconds
+
+READ_SIZE = 1024 * 1024
+
+
+def download(job):
+    """Runs in a client process; returns (seconds, sha256)."""
+    url, size, ranged = job
+    hasher = hashlib.sha256()
+    started = time.perf_counter()
+    ranges = [(0, size // 2 - 1), (size // 2, size - 1)] if ranged else [None]
+    for byte_range in ranges:
+        headers = {'Range': 'bytes=%d-%d' % byte_range} if byte_range else {}
+        with requests.get(url, headers=headers, stream=True, timeout=60) as r:
+            assert r.status_code == (206 if byte_range else 200), r.status_code
+            for chunk in r.iter_content(READ_SIZE):
+                hasher.update(chunk)
+    return time.perf_counter() - started, hasher.hexdigest()
+
+
+def tree_cpu_seconds(pid):
+    """CPU time of a process and its direct children (gunicorn workers)."""
+    pids = [pid]
+    for entry in os.listdir('/proc') if os.path.isdir('/proc') else []:
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        pids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    times = [process_cpu_seconds(p) for p in pids]
+    return sum(t for t in times if t is not None) if times[0] is not None else None
+
+
+def run_server(name, script, args, options, source):
+    h = Harness(tempfile.mkdtemp(prefix='signage-dl-'), 0)
+    try:
+        h.start_master(script, args)
+        with open(source, 'rb') as f:
+            h.session.post(f'{h.url}/api/upload', files={'file': ('big.mp4', f, 'video/mp4')}).raise_for_status()
+        video = requests.get(f'{h.url}/api/manifest').json()['all_videos'][0]
+        jobs = [(h.url + video['url'], video['size'], n % 2 == 1) for n in range(options.clients)]
+
+        cpu_before = tree_cpu_seconds(h.master.pid)
+        with multiprocessing.Pool(options.clients) as pool:
+            started = time.perf_counter()
+            results = pool.map(download, jobs)
+            elapsed = time.perf_counter() - started
+        cpu_after = tree_cpu_seconds(h.master.pid)
+
+        assert all(sha == video['sha256'] for _, sha in results), 'corrupt download'
+        total = video['size'] * options.clients
+        return {
+            'server': name,
+            'elapsed': round(elapsed, 2),
+            'aggregate_mb_s': round(total / elapsed / 1e6, 1),
+            'client_seconds': percentiles([t for t, _ in results]),
+            'master_cpu_seconds': round(cpu_after - cpu_before, 2) if cpu_before is not None else None,
+        }
+    finally:
+        h.stop()
+
+
+def run_benchmark(options):
+    source = os.path.join(tempfile.mkdtemp(prefix='signage-dl-src-'), 'big.mp4')
+    with open(source, 'wb') as f:
+        for _ in range(options.size_mb):
+            f.write(os.urandom(1024 * 1024))
+
+    servers = {
+        'dev': ('app.py', []),
+        'gunicorn': ('wsgi.py', ['--workers', str(options.workers)]),  # binds to $PORT
+    }
+    results = []
+    for name in options.servers:
+        script, args = servers[name]
+        results.append(run_server(name, script, args, options, source))
+    os.remove(source)
+    return {
+        'commit': git_commit(),
+        'timestamp': int(time.time()),
+        'params': {'clients': options.clients, 'size_mb': options.size_mb, 'workers': options.workers},
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=24)
+    parser.add_argument('--size-mb', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--servers', nargs='+', default=['dev', 'gunicorn'], choices=['dev', 'gunicorn'])
+    parser.add_argument('--output', help='also write the JSON results here')
+    options = parser.parse_args()
+    results = run_benchmark(options)
+    print(json.dumps(results, indent=2))
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,315 @@
+"""
+End-to-end benchmark: a real master plus N agents driving stub mpvs.
+
+Starts master/app.py and N copies of client/agent.py in a throwaway
+directory, each agent playing through bench/fake_mpv.py, which records every
+playback command with a timestamp. Then measures:
+
+  latency_ms        dashboard action (pause toggle, rotate) -> command seen by
+                    each player, p50/p99/max over all agents and actions
+  manifest_rps      /api/manifest throughput, full responses and 304s
+  master_cpu        master CPU % per connected agent while idle (Linux only)
+  playlist_gap_ms   end-file -> next start-file gap in playlist mode, plus
+                    how many times an agent rebuilt the playlist
+
+Results are printed as JSON (and written to --output) together with the
+commit they were measured at, so runs can be compared across commits.
+
+    python bench/bench_e2e.py [--agents 4] [--actions 20] [--output e2e.json]
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_MPV = os.path.join(ROOT, 'bench', 'fake_mpv.py')
+CLIP_DURATION = 0.5  # seconds each fake video "plays" in the playlist test
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def pick(p):
+        return round(values[min(len(values) - 1, int(p / 100 * len(values)))], 2)
+    return {'p50': pick(50), 'p99': pick(99), 'max': round(values[-1], 2), 'n': len(values)}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def process_cpu_seconds(pid):
+    """utime + stime of a process from /proc, or None off Linux."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def read_records(path):
+    try:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return []
+
+
+class Harness:
+    def __init__(self, workdir, num_agents):
+        self.workdir = workdir
+        self.num_agents = num_agents
+        self.port = free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.master = None
+        self.agents = []
+        self.session = requests.Session()
+
+    def _spawn(self, args, env, log_name):
+        log = open(os.path.join(self.workdir, log_name), 'w')
+        # Own process group, so the agent's mpv goes down with it
+        return subprocess.Popen([sys.executable, *args], cwd=self.workdir, env=env, stdout=log,
+                                stderr=subprocess.STDOUT, start_new_session=True)
+
+    def start_master(self, script='app.py', args=()):
+        """Runs master/app.py (or e.g. wsgi.py with worker args) on self.port."""
+        env = dict(os.environ, PORT=str(self.port), UPLOAD_FOLDER=os.path.join(self.workdir, 'media'))
+        self.master = self._spawn([os.path.join(ROOT, 'master', script), *args], env, 'master.log')
+        deadline = time.time() + 15
+        while time.time() < deadline:
+            try:
+                requests.get(f'{self.url}/login', timeout=1)
+                break
+            except requests.exceptions.ConnectionError:
+                time.sleep(0.1)
+        else:
+            raise RuntimeError('master did not come up, see master.log')
+        self.session.post(f'{self.url}/login', data={'pin': '1234'})
+
+    def upload_videos(self, count):
+        ids = []
+        for i in range(count):
+            content = os.urandom(64 * 1024)
+            r = self.session.post(f'{self.url}/api/upload',
+                                  files={'file': (f'clip_{i}.mp4', content, 'video/mp4')})
+            r.raise_for_status()
+        for video in requests.get(f'{self.url}/api/manifest').json()['all_videos']:
+            ids.append(video['id'])
+        return ids
+
+    def record_path(self, i):
+        return os.path.join(self.workdir, f'agent-{i}.jsonl')
+
+    def start_agents(self, extra_env=None):
+        """`extra_env(i)` may return more environment for agent i."""
+        for i in range(self.num_agents):
+            env = dict(os.environ,
+                       MASTER_URL=self.url,
+                       CLIENT_ID=f'agent-{i}',
+                       CLIENT_VIDEO_DIR=os.path.join(self.workdir, f'agent-{i}'),
+                       MPV_BIN=f'"{sys.executable}" "{FAKE_MPV}"',
+                       MPV_IPC_PATH=os.path.join(self.workdir, f'agent-{i}.sock'),
+                       DISPLAY=':0',  # windowed start path, no DRM probing
+                       FAKE_MPV_STARTUP='0.05',
+                       FAKE_MPV_DURATION=str(CLIP_DURATION),
+                       FAKE_MPV_RECORD=self.record_path(i))
+            env.update(extra_env(i) if extra_env else {})
+            self.agents.append(self._spawn([os.path.join(ROOT, 'client', 'agent.py')], env, f'agent-{i}.log'))
+
+    def wait_for_agents(self, timeout=30):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            clients = self.session.get(f'{self.url}/api/clients').json()['clients']
+            playing = [c for c in clients if c['online'] and c['current_video'] != 'Stopped']
+            if len(playing) >= self.num_agents:
+                return
+            time.sleep(0.2)
+        raise RuntimeError('agents did not start playing, see agent-*.log')
+
+    def set_state(self, **state):
+        self.session.post(f'{self.url}/api/state', json=state).raise_for_status()
+
+    def wait_for_command(self, since, match, timeout=5):
+        """Per-agent latency (ms) until a recorded command satisfies `match`."""
+        latencies = {}
+        deadline = time.time() + timeout
+        while len(latencies) < self.num_agents and time.time() < deadline:
+            for i in range(self.num_agents):
+                if i in latencies:
+                    continue
+                for rec in read_records(self.record_path(i)):
+                    if rec['t'] >= since and 'command' in rec and match(rec['command']):
+                        latencies[i] = (rec['t'] - since) * 1000
+                        break
+            time.sleep(0.01)
+        return list(latencies.values()), self.num_agents - len(latencies)
+
+    def stop(self):
+        for proc in self.agents + [self.master]:
+            if proc is None:
+                continue
+            try:
+                os.killpg(proc.pid, signal.SIGTERM)
+            except OSError:
+                proc.terminate()
+        for proc in self.agents + [self.master]:
+            if proc is not None:
+                try:
+                    proc.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+
+
+def measure_latency(h, video_id, actions):
+    by_kind = {'pause': [], 'rotate': []}
+    missed = 0
+    paused = False
+    rotation = 0
+    for n in range(actions):
+        time.sleep(0.1)
+        since = time.time()
+        if n % 2 == 0:
+            paused = not paused
+            h.set_state(paused=paused)
+            value = 'yes' if paused else 'no'
+            lat, miss = h.wait_for_command(
+                since, lambda c: c[:2] == ['set_property', 'pause'] and c[2] == value)
+            by_kind['pause'] += lat
+        else:
+            rotation = (rotation + 90) % 360
+            h.session.post(f'{h.url}/api/rotate/{video_id}', json={'rotation': rotation}).raise_for_status()
+            value = str(rotation)
+            lat, miss = h.wait_for_command(
+                since, lambda c: c[:2] == ['set_property', 'video-rotate'] and c[2] == value)
+            by_kind['rotate'] += lat
+        missed += miss
+    if paused:
+        h.set_state(paused=False)
+    result = {kind: percentiles(values) for kind, values in by_kind.items()}
+    result['all'] = percentiles(by_kind['pause'] + by_kind['rotate'])
+    result['missed'] = missed
+    return result
+
+
+def measure_cpu(h, seconds):
+    before = process_cpu_seconds(h.master.pid)
+    if before is None:
+        return None
+    time.sleep(seconds)
+    used = process_cpu_seconds(h.master.pid) - before
+    return {
+        'percent_total': round(used / seconds * 100, 2),
+        'percent_per_client': round(used / seconds * 100 / h.num_agents, 3),
+    }
+
+
+def measure_manifest(url, seconds, concurrency):
+    etag = requests.get(f'{url}/api/manifest').headers.get('ETag')
+
+    def hammer(headers, counts):
+        s = requests.Session()
+        n = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            r = s.get(f'{url}/api/manifest', headers=headers)
+            assert r.status_code in (200, 304), r.status_code
+            n += 1
+        counts.append(n)
+
+    result = {}
+    for name, headers in (('full', {}), ('not_modified', {'If-None-Match': etag})):
+        counts = []
+        threads = [threading.Thread(target=hammer, args=(headers, counts)) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        result[name] = round(sum(counts) / seconds, 1)
+    return result
+
+
+def measure_playlist(h, ids, seconds):
+    since = time.time()
+    h.session.post(f'{h.url}/api/playlist', json={'video_ids': ids}).raise_for_status()
+    h.set_state(mode='playlist')
+    time.sleep(seconds)
+    gaps = []
+    rebuilds = 0
+    for i in range(h.num_agents):
+        records = [r for r in read_records(h.record_path(i)) if r['t'] >= since]
+        loads = [r for r in records if r.get('command', [None])[0] == 'playlist-clear'
+                 or (r.get('command', [None])[0] == 'loadfile' and r['command'][2:3] != ['append'])]
+        rebuilds += max(0, len(loads) - 1)  # the first one is the switch to playlist mode
+        if loads:
+            records = [r for r in records if r['t'] >= loads[0]['t']]
+        last_end = None
+        for rec in records:
+            if rec.get('event') == 'end-file':
+                last_end = rec['t']
+            elif rec.get('event') == 'start-file' and last_end is not None:
+                gaps.append((rec['t'] - last_end) * 1000)
+                last_end = None
+    return {'gap_ms': percentiles(gaps), 'rebuilds': rebuilds}
+
+
+def run_benchmark(args):
+    workdir = tempfile.mkdtemp(prefix='signage-e2e-')
+    h = Harness(workdir, args.agents)
+    try:
+        h.start_master()
+        ids = h.upload_videos(args.videos)
+        h.set_state(mode='single', current_video_id=ids[0], paused=False)
+        h.start_agents()
+        h.wait_for_agents()
+
+        results = {
+            'commit': git_commit(),
+            'timestamp': int(time.time()),
+            'params': {'agents': args.agents, 'videos': args.videos, 'actions': args.actions,
+                       'seconds': args.seconds, 'concurrency': args.concurrency},
+            'latency_ms': measure_latency(h, ids[0], args.actions),
+            'master_cpu': measure_cpu(h, args.seconds),
+            'manifest_rps': measure_manifest(h.url, args.seconds, args.concurrency),
+            'playlist': measure_playlist(h, ids, max(args.seconds, CLIP_DURATION * len(ids) * 3)),
+        }
+    finally:
+        h.stop()
+    results['workdir'] = workdir
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agents', type=int, default=4)
+    parser.add_argument('--videos', type=int, default=3)
+    parser.add_argument('--actions', type=int, default=20, help='dashboard actions to time')
+    parser.add_argument('--seconds', type=float, default=3, help='length of the CPU and throughput runs')
+    parser.add_argument('--concurrency', type=int, default=8, help='manifest client threads')
+    parser.add_argument('--output', help='also write the JSON results here')
+    args = parser.parse_args()
+    results = run_benchmark(args)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
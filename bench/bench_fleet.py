@@ -0,0 +1,351 @@
+"""
+Fleet load simulator: hundreds of virtual agents against a running master.
+
+Each virtual agent follows client/agent.py: it fetches its client manifest
+(view=client&client_id=) once, then polls /api/manifest/delta with the
+version it holds and folds the answers in with the agent's apply_manifest()
+(--full-manifest polls /api/manifest with If-None-Match instead, like agents
+with MANIFEST_DELTA=0; with --events it holds /api/events open and only
+fetches when told). It posts /api/status on change and every
+STATUS_INTERVAL seconds, and now and then downloads a video from its
+manifest. Optional dashboard writers (--writes) toggle state to create
+write contention.
+
+Everything runs on one asyncio loop with a minimal keep-alive HTTP/1.1
+client, so no extra dependencies are needed. Reports per-endpoint request
+rate, latency percentiles and errors, and, given --master-log, how many
+"database is locked" errors the master logged during the run.
+
+    python bench/bench_fleet.py --url http://localhost:5000 --clients 300 \\
+        [--interval 0.5] [--events] [--writes 2] [--duration 60] [--output fleet.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from urllib.parse import urlsplit
+
+from bench_e2e import ROOT, percentiles
+
+sys.path.append(ROOT)
+from client.agent import apply_manifest
+
+STATUS_INTERVAL = 5  # same heartbeat cadence as the agent
+LOCK_ERROR = 'database is locked'
+
+
+class HttpError(Exception):
+    pass
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection; reconnects after errors."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def _open(self):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def _send(self, method, path, headers, body):
+        await self._open()
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}']
+        lines += [f'{k}: {v}' for k, v in headers.items()]
+        if body is not None:
+            lines.append(f'Content-Length: {len(body)}')
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + (body or b''))
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise HttpError('connection closed')
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        return status, response_headers
+
+    async def _read_body(self, headers, discard=False):
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                data = await self.reader.readexactly(size)
+                await self.reader.readline()
+                if not discard:
+                    chunks.append(data)
+            return b''.join(chunks)
+        if 'content-length' in headers:
+            remaining = int(headers['content-length'])
+            chunks = []
+            while remaining:
+                data = await self.reader.read(min(remaining, 256 * 1024))
+                if not data:
+                    raise HttpError('short body')
+                remaining -= len(data)
+                if not discard:
+                    chunks.append(data)
+            return b''.join(chunks)
+        body = await self.reader.read()
+        self.close()
+        return body
+
+    async def request(self, method, path, headers=None, body=None, discard=False):
+        """Returns (status, headers, body)."""
+        try:
+            status, response_headers = await self._send(method, path, headers or {}, body)
+            data = await self._read_body(response_headers, discard)
+            if response_headers.get('connection', '').lower() == 'close':
+                self.close()
+            return status, response_headers, data
+        except (OSError, asyncio.IncompleteReadError, ValueError, HttpError):
+            self.close()
+            raise
+
+    async def stream_lines(self, path):
+        """Yields lines of a streaming (SSE) response until it ends."""
+        status, headers = await self._send('GET', path, {'Accept': 'text/event-stream'}, None)
+        if status != 200:
+            raise HttpError(f'events returned {status}')
+        chunked = headers.get('transfer-encoding', '').lower() == 'chunked'
+        buffer = b''
+        while True:
+            if chunked:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    return
+                buffer += await self.reader.readexactly(size)
+                await self.reader.readline()
+            else:
+                data = await self.reader.read(4096)
+                if not data:
+                    return
+                buffer += data
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                yield line.decode(errors='replace').rstrip('\r')
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {}  # endpoint -> [ms]
+        self.errors = {}  # endpoint -> {reason: count}
+        self.bytes = 0
+
+    def ok(self, endpoint, started):
+        self.latencies.setdefault(endpoint, []).append((time.perf_counter() - started) * 1000)
+
+    def error(self, endpoint, reason):
+        bucket = self.errors.setdefault(endpoint, {})
+        bucket[reason] = bucket.get(reason, 0) + 1
+
+    async def call(self, endpoint, conn, method, path, ok=(200,), **kwargs):
+        started = time.perf_counter()
+        try:
+            status, headers, body = await conn.request(method, path, **kwargs)
+        except Exception as e:
+            self.error(endpoint, type(e).__name__)
+            return None, None, None
+        if status in ok:
+            self.ok(endpoint, started)
+        else:
+            self.error(endpoint, str(status))
+        return status, headers, body
+
+    def report(self, elapsed):
+        endpoints = {}
+        for name in sorted(set(self.latencies) | set(self.errors)):
+            lat = self.latencies.get(name, [])
+            errors = self.errors.get(name, {})
+            total = len(lat) + sum(errors.values())
+            endpoints[name] = {
+                'requests': total,
+                'rps': round(total / elapsed, 1),
+                'latency_ms': percentiles(lat),
+                'errors': errors,
+                'error_rate': round(sum(errors.values()) / total, 4) if total else 0,
+            }
+        return endpoints
+
+
+class VirtualAgent:
+    def __init__(self, n, args, stats, deadline):
+        url = urlsplit(args.url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.client_id = f'sim-{n:04d}'
+        self.args = args
+        self.stats = stats
+        self.deadline = deadline
+        self.conn = Connection(self.host, self.port)
+        self.changed = asyncio.Event()
+        self.model = {'version': None, 'group': None, 'state': {}, 'videos': {}, 'playlist': [], 'schedule': []}
+        self.now_playing = 'Stopped'
+        self.last_status = None
+        self.last_status_at = 0
+
+    async def fetch_manifest(self):
+        query = f'view=client&client_id={self.client_id}'
+        version = self.model['version']
+        if version is not None and not self.args.full_manifest:
+            status, _, body = await self.stats.call('manifest_delta', self.conn, 'GET',
+                                                    f'/api/manifest/delta?{query}&since={version}', ok=(200, 304))
+        else:
+            headers = {'If-None-Match': f'W/"{version}"'} if version is not None else {}
+            status, _, body = await self.stats.call('manifest', self.conn, 'GET', f'/api/manifest?{query}',
+                                                    ok=(200, 304), headers=headers)
+        if status == 200:
+            apply_manifest(self.model, json.loads(body))
+            videos = list(self.model['videos'].values())
+            if videos and random.random() < self.args.download_chance:
+                await self.download(random.choice(videos))
+            self.now_playing = videos[0]['filename'] if videos else 'Stopped'
+
+    async def download(self, video):
+        # Separate connection, like the agent's sync worker
+        conn = Connection(self.host, self.port)
+        try:
+            status, _, body = await self.stats.call('download', conn, 'GET', video['url'], discard=True)
+            if status == 200 and video.get('size'):
+                self.stats.bytes += video['size']
+        finally:
+            conn.close()
+
+    async def post_status(self):
+        now = time.monotonic()
+        if self.now_playing == self.last_status and now - self.last_status_at < STATUS_INTERVAL:
+            return
+        body = json.dumps({
+            'client_id': self.client_id,
+            'current_video': self.now_playing,
+            'position': round(random.uniform(0, 60), 2),
+            'player_state': 'playing',
+            'sync': {'wanted': 0, 'ready': 0, 'pending': 0, 'failed': 0, 'active': []},
+        }).encode()
+        status, _, _ = await self.stats.call('status', self.conn, 'POST', '/api/status',
+                                             headers={'Content-Type': 'application/json'}, body=body)
+        if status == 200:
+            self.last_status = self.now_playing
+            self.last_status_at = now
+
+    async def listen(self):
+        while time.monotonic() < self.deadline:
+            conn = Connection(self.host, self.port)
+            try:
+                async for line in conn.stream_lines('/api/events'):
+                    if line.startswith('event: manifest'):
+                        self.changed.set()
+            except Exception as e:
+                self.stats.error('events', type(e).__name__)
+            finally:
+                conn.close()
+            self.changed.set()
+            await asyncio.sleep(1)
+
+    async def run(self):
+        # Stagger start-up like screens booting over a few seconds
+        await asyncio.sleep(random.uniform(0, self.args.ramp))
+        listener = asyncio.ensure_future(self.listen()) if self.args.events else None
+        last_fetch = 0
+        try:
+            while time.monotonic() < self.deadline:
+                if not listener or self.changed.is_set() or time.monotonic() - last_fetch >= 30:
+                    self.changed.clear()
+                    last_fetch = time.monotonic()
+                    await self.fetch_manifest()
+                await self.post_status()
+                try:
+                    await asyncio.wait_for(self.changed.wait(), self.args.interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if listener:
+                listener.cancel()
+            self.conn.close()
+
+
+async def dashboard_writer(args, stats, deadline):
+    """Logs in and toggles paused/rotation like someone working the dashboard."""
+    url = urlsplit(args.url)
+    conn = Connection(url.hostname, url.port or 80)
+    _, headers, _ = await conn.request('POST', '/login', body=f'pin={args.pin}'.encode(),
+                                       headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    cookie = headers.get('set-cookie', '').split(';')[0]
+    auth = {'Cookie': cookie, 'Content-Type': 'application/json'}
+    paused = False
+    try:
+        while time.monotonic() < deadline:
+            paused = not paused
+            await stats.call('write', conn, 'POST', '/api/state', headers=auth,
+                             body=json.dumps({'paused': paused}).encode())
+            await asyncio.sleep(random.expovariate(args.writes))
+    finally:
+        conn.close()
+
+
+def count_lock_errors(path, offset):
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            return f.read().decode(errors='ignore').count(LOCK_ERROR)
+    except OSError:
+        return None
+
+
+async def run(args):
+    stats = Stats()
+    log_offset = os.path.getsize(args.master_log) if args.master_log and os.path.exists(args.master_log) else 0
+    started = time.monotonic()
+    deadline = started + args.duration
+    tasks = [VirtualAgent(n, args, stats, deadline).run() for n in range(args.clients)]
+    tasks += [dashboard_writer(args, stats, deadline) for _ in range(1 if args.writes else 0)]
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+    return {
+        'params': {k: v for k, v in vars(args).items() if k != 'output'},
+        'elapsed': round(elapsed, 2),
+        'endpoints': stats.report(elapsed),
+        'downloaded_bytes': stats.bytes,
+        'database_locked': count_lock_errors(args.master_log, log_offset) if args.master_log else None,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=30, help='seconds')
+    parser.add_argument('--interval', type=float, default=0.5, help="poll interval, like the agent's CHECK_INTERVAL")
+    parser.add_argument('--events', action='store_true', help='hold /api/events open instead of polling')
+    parser.add_argument('--full-manifest', action='store_true',
+                        help='poll the full manifest instead of deltas (agents with MANIFEST_DELTA=0)')
+    parser.add_argument('--download-chance', type=float, default=0.05,
+                        help='chance a changed manifest triggers a download')
+    parser.add_argument('--writes', type=float, default=0, help='dashboard state changes per second')
+    parser.add_argument('--pin', default='1234')
+    parser.add_argument('--ramp', type=float, default=5, help='spread client start-up over this many seconds')
+    parser.add_argument('--master-log', help="master's log file, to count 'database is locked' errors")
+    parser.add_argument('--output', help='also write the JSON results here')
+    args = parser.parse_args()
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
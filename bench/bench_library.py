@@ -0,0 +1,71 @@
+"""
+Library listing at scale: full list vs. indexed pages, search and lookups.
+
+Fills a scratch database with --videos rows through master/database.py and
+times (median of --repeat runs, cold snapshot cache each time, as after any
+write) what the dashboard and delete route used to do against what they do
+now. JSON output.
+
+    python bench/bench_library.py [--videos 5000]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'master'))
+import database
+
+from bench_e2e import git_commit
+
+WORDS = ['summer', 'winter', 'promo', 'menu', 'board', 'lobby', 'sale', 'intro', 'loop', 'brand']
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        with database._cache_lock:
+            database._invalidate()
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def run(num_videos, repeat):
+    database.DB_PATH = os.path.join(tempfile.mkdtemp(prefix='signage-lib-'), 'signage.db')
+    database.init_db()
+    for i in range(num_videos):
+        name = '_'.join(random.sample(WORDS, 3)) + f'_{i}.mp4'
+        database.add_video(name, size=random.randint(1, 10 ** 9), sha256=f'{i:064x}', blob=f'{i:064x}.mp4')
+    target = num_videos // 2
+    return {
+        'list_all_ms': timed(database.get_all_videos, repeat),
+        'first_page_ms': timed(lambda: database.list_videos(0, 48), repeat),
+        'page_by_name_ms': timed(lambda: database.list_videos(num_videos // 2, 48, 'name', False), repeat),
+        'search_ms': timed(lambda: database.list_videos(0, 48, search='summer pro'), repeat),
+        'lookup_scan_ms': timed(lambda: next(v for v in database.get_all_videos() if v['id'] == target), repeat),
+        'lookup_by_id_ms': timed(lambda: database.get_video(target), repeat),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--videos', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='also write the JSON results here')
+    args = parser.parse_args()
+    results = {
+        'commit': git_commit(),
+        'timestamp': int(time.time()),
+        'timings': run(args.videos, args.repeat),
+        'params': {'videos': args.videos, 'fts': database._fts},
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,83 @@
+"""
+Manifest size and client apply cost: full manifest vs. /api/manifest/delta.
+
+Fills a fresh master with --videos small videos, all in the playlist, then
+for a few typical dashboard edits compares the bytes a screen downloads and
+the time the agent spends applying them (client.agent.apply_manifest), for
+the full manifest and for a delta since the previous version. JSON output.
+
+    python bench/bench_manifest_delta.py [--videos 300]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import requests
+
+from bench_e2e import Harness, git_commit
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from client.agent import apply_manifest
+
+
+def apply_cost(model, data, repeat=200):
+    """Microseconds per apply_manifest() call (on copies of the model)."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        apply_manifest({'version': model['version'], 'state': dict(model['state']),
+                        'videos': dict(model['videos']), 'playlist': list(model['playlist'])}, data)
+    return round((time.perf_counter() - started) / repeat * 1e6, 1)
+
+
+def run(num_videos):
+    h = Harness(tempfile.mkdtemp(prefix='signage-delta-'), 0)
+    try:
+        h.start_master()
+        ids = h.upload_videos(num_videos)
+        h.session.post(f'{h.url}/api/playlist', json={'video_ids': ids}).raise_for_status()
+        h.set_state(mode='playlist', paused=False)
+
+        edits = {
+            'pause': lambda: h.session.post(f'{h.url}/api/state', json={'paused': True}),
+            'rotate_one': lambda: h.session.post(f'{h.url}/api/rotate/{ids[0]}', json={'rotation': 90}),
+            'reorder_playlist': lambda: h.session.post(f'{h.url}/api/playlist', json={'video_ids': ids[::-1]}),
+        }
+        model = {'version': None, 'state': {}, 'videos': {}, 'playlist': []}
+        apply_manifest(model, requests.get(f'{h.url}/api/manifest').json())
+        results = {}
+        for name, edit in edits.items():
+            edit().raise_for_status()
+            full = requests.get(f'{h.url}/api/manifest')
+            delta = requests.get(f'{h.url}/api/manifest/delta', params={'since': model['version']})
+            results[name] = {
+                'full_bytes': len(full.content),
+                'delta_bytes': len(delta.content),
+                'full_apply_us': apply_cost(model, full.json()),
+                'delta_apply_us': apply_cost(model, delta.json()),
+            }
+            apply_manifest(model, delta.json())
+            assert model['videos'] == {v['id']: v for v in full.json()['all_videos']}, 'delta diverged'
+            assert model['playlist'] == [item['id'] for item in full.json()['playlist']], 'delta diverged'
+        return results
+    finally:
+        h.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--videos', type=int, default=300)
+    parser.add_argument('--output', help='also write the JSON results here')
+    args = parser.parse_args()
+    results = {
+        'commit': git_commit(),
+        'timestamp': int(time.time()),
+        'params': {'videos': args.videos},
+        'edits': run(args.videos),
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
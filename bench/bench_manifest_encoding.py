@@ -0,0 +1,105 @@
+"""
+Manifest bytes and agent CPU per poll for each encoding.
+
+Fills a fresh master with --videos videos (all in the playlist) and fetches
+the full manifest in the dashboard view and in the compact client view
+(?view=client), each uncompressed, gzipped and, if the brotli module is
+installed, brotli-compressed. For each variant it reports the bytes on the
+wire and the CPU time the agent spends per poll turning them into its model
+(decompress + JSON decode + client.agent.apply_manifest). JSON output.
+
+    python bench/bench_manifest_encoding.py [--videos 500]
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+
+import requests
+
+from bench_e2e import Harness, git_commit
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from client.agent import apply_manifest
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DECODERS = {
+    'identity': lambda body: body,
+    'gzip': gzip.decompress,
+    'br': brotli.decompress if brotli else None,
+}
+
+CLIENT_FIELDS = ('id', 'filename', 'rotation', 'size', 'sha256', 'url', 'duration')
+
+
+def fetch_raw(url, params, encoding):
+    """(raw body bytes, Content-Encoding) without letting requests decode it."""
+    r = requests.get(url, params=params, headers={'Accept-Encoding': encoding}, stream=True)
+    r.raise_for_status()
+    return r.raw.read(decode_content=False), r.headers.get('Content-Encoding', 'identity')
+
+
+def client_cpu_us(body, encoding, repeat):
+    """CPU microseconds per poll: decode the body and fold it into a fresh model."""
+    started = time.process_time()
+    for _ in range(repeat):
+        data = json.loads(DECODERS[encoding](body))
+        apply_manifest({'version': None, 'state': {}, 'videos': {}, 'playlist': []}, data)
+    return round((time.process_time() - started) / repeat * 1e6, 1)
+
+
+def run(num_videos, repeat):
+    h = Harness(tempfile.mkdtemp(prefix='signage-enc-'), 0)
+    try:
+        h.start_master()
+        ids = h.upload_videos(num_videos)
+        h.session.post(f'{h.url}/api/playlist', json={'video_ids': ids}).raise_for_status()
+        h.set_state(mode='playlist')
+
+        encodings = ['identity', 'gzip'] + (['br'] if brotli else [])
+        results = []
+        reference = None
+        for view, params in (('dashboard', {}), ('client', {'view': 'client'})):
+            for accept in encodings:
+                body, encoding = fetch_raw(f'{h.url}/api/manifest', params, accept)
+                model = {'version': None, 'state': {}, 'videos': {}, 'playlist': []}
+                apply_manifest(model, json.loads(DECODERS[encoding](body)))
+                # Same playback model either way (the dashboard view has extra fields)
+                used = (model['state'], model['playlist'],
+                        {i: {k: v[k] for k in CLIENT_FIELDS} for i, v in model['videos'].items()})
+                reference = reference or used
+                assert used == reference, f'{view}/{encoding} decodes to a different model'
+                results.append({
+                    'view': view,
+                    'encoding': encoding,
+                    'bytes_per_poll': len(body),
+                    'agent_cpu_us_per_poll': client_cpu_us(body, encoding, repeat),
+                })
+        return results
+    finally:
+        h.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--videos', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=200, help='decodes timed per variant')
+    parser.add_argument('--output', help='also write the JSON results here')
+    args = parser.parse_args()
+    results = {
+        'commit': git_commit(),
+        'timestamp': int(time.time()),
+        'params': {'videos': args.videos, 'brotli': brotli is not None},
+        'variants': run(args.videos, args.repeat),
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
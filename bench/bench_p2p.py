@@ -0,0 +1,87 @@
+"""
+Peer-to-peer distribution benchmark on loopback.
+
+Starts a master and N agents (each with its own PEER_PORT), waits for them
+to settle, then uploads a new video of --size-mb, adds it to the playlist
+and times how long until every agent holds a verified copy. Agents report how many bytes they got
+from the master and from peers, so the result shows how much of the fan-out
+the master still carried. Run once with peers and once without for a
+baseline.
+
+    python bench/bench_p2p.py [--agents 6] [--size-mb 64] [--no-baseline]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from bench_e2e import Harness, free_port, git_commit
+
+
+def distribute(num_agents, size_mb, peer_to_peer, timeout):
+    h = Harness(tempfile.mkdtemp(prefix='signage-p2p-'), num_agents)
+    try:
+        h.start_master()
+        ids = h.upload_videos(1)
+        h.set_state(mode='single', current_video_id=ids[0], paused=False)
+        h.start_agents(lambda i: {'PEER_PORT': str(free_port())} if peer_to_peer else {})
+        h.wait_for_agents()
+
+        started = time.time()
+        content = os.urandom(size_mb * 1024 * 1024)
+        r = h.session.post(f'{h.url}/api/upload', files={'file': ('new.mp4', content, 'video/mp4')})
+        r.raise_for_status()
+        # Manifests only list what a screen can play, so queue it
+        h.session.post(f'{h.url}/api/playlist', json={'video_ids': [r.json()['id']]}).raise_for_status()
+        uploaded = time.time()
+
+        deadline = uploaded + timeout
+        while time.time() < deadline:
+            clients = h.session.get(f'{h.url}/api/clients').json()['clients']
+            done = [c for c in clients if (c.get('sync') or {}).get('ready') == 2]
+            if len(done) == num_agents:
+                break
+            time.sleep(0.2)
+        finished = time.time()
+        time.sleep(5.5)  # one more heartbeat with final byte counts
+
+        clients = h.session.get(f'{h.url}/api/clients').json()['clients']
+        from_master = sum(((c.get('sync') or {}).get('bytes_from') or {}).get('master', 0) for c in clients)
+        from_peers = sum(((c.get('sync') or {}).get('bytes_from') or {}).get('peer', 0) for c in clients)
+        total = len(content) * num_agents
+        return {
+            'peer_to_peer': peer_to_peer,
+            'completed': len(done),
+            'seconds_to_all': round(finished - uploaded, 2),
+            'upload_seconds': round(uploaded - started, 2),
+            # Without peers agents use a plain download that isn't counted; it is all master
+            'master_share': round(from_master / total, 3) if peer_to_peer else 1.0,
+            'bytes_from_master': from_master if peer_to_peer else total,
+            'bytes_from_peers': from_peers,
+        }
+    finally:
+        h.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agents', type=int, default=6)
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--no-baseline', action='store_true', help='skip the run without peers')
+    parser.add_argument('--output', help='also write the JSON results here')
+    args = parser.parse_args()
+    runs = [distribute(args.agents, args.size_mb, True, args.timeout)]
+    if not args.no_baseline:
+        runs.append(distribute(args.agents, args.size_mb, False, args.timeout))
+    results = {
+        'commit': git_commit(),
+        'timestamp': int(time.time()),
+        'params': {'agents': args.agents, 'size_mb': args.size_mb},
+        'runs': runs,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
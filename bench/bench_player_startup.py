@@ -0,0 +1,89 @@
+"""
+Startup benchmark for the mpv wrapper, using the stub in bench/fake_mpv.py.
+
+Measures the time from Player.play() on a stopped player until mpv reports
+it is playing, for a cold boot that has to probe past a failing output mode,
+a boot with the mode cached, a desktop (windowed) start, and a restart
+signal with and without the warm standby. The stub takes FAKE_MPV_STARTUP
+seconds to open its IPC socket, standing in for mpv's own init time.
+
+    python bench/bench_player_startup.py [--runs 5] [--startup 0.3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+
+def time_to_playing(player, video):
+    started = time.perf_counter()
+    player.play(video)
+    while player.get_property('idle-active') is not False:
+        time.sleep(0.005)
+    return time.perf_counter() - started
+
+
+def run_benchmark(runs, startup):
+    workdir = tempfile.mkdtemp(prefix='signage-bench-')
+    os.environ['MPV_BIN'] = f'"{sys.executable}" "{os.path.join(ROOT, "bench", "fake_mpv.py")}"'
+    os.environ['MPV_IPC_PATH'] = os.path.join(workdir, 'mpv.sock')
+    os.environ['FAKE_MPV_STARTUP'] = str(startup)
+    os.environ['FAKE_MPV_DURATION'] = '60'
+    os.environ['FAKE_MPV_FAIL'] = 'gpu-fast'  # first probe fails like on a Pi without KMS
+    from shared import player as player_mod
+
+    def cold(headless, cached):
+        if headless:
+            os.environ.pop('DISPLAY', None)
+            os.environ.pop('WAYLAND_DISPLAY', None)
+        else:
+            os.environ['DISPLAY'] = ':0'
+        player_mod.MPV_MODE_CACHE = os.path.join(workdir, 'mode')
+        if not cached and os.path.exists(player_mod.MPV_MODE_CACHE):
+            os.remove(player_mod.MPV_MODE_CACHE)
+        player = player_mod.Player()
+        try:
+            return time_to_playing(player, 'a.mp4')
+        finally:
+            player.stop()
+
+    def restart(standby):
+        player_mod.MPV_WARM_STANDBY = standby
+        player = player_mod.Player()
+        try:
+            time_to_playing(player, 'a.mp4')
+            time.sleep(startup * 2 + 0.5)  # let the standby come up
+            player.stop()
+            return time_to_playing(player, 'b.mp4')
+        finally:
+            player.stop()
+            player._kill_standby()
+            player_mod.MPV_WARM_STANDBY = False
+
+    # (name, fn, fixed sleeps the old startup code spent before playing)
+    scenarios = [
+        ('cold boot, probing modes', lambda: cold(True, False), 2.0),
+        ('cold boot, cached mode', lambda: cold(True, True), 2.0),
+        ('desktop start', lambda: cold(False, False), 3.0),
+        ('restart, cold', lambda: restart(False), 2.0),
+        ('restart, warm standby', lambda: restart(True), 2.0),
+    ]
+    cold(True, False)  # seed the mode cache
+    print(f'stub mpv init time: {startup:.2f}s, {runs} runs each (median)')
+    print(f'{"scenario":<28} {"time to playing":>16} {"old fixed sleeps":>17}')
+    for name, fn, old_sleep in scenarios:
+        times = [fn() for _ in range(runs)]
+        print(f'{name:<28} {statistics.median(times):>15.3f}s {old_sleep:>16.1f}s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--startup', type=float, default=0.3, help='stub mpv init time in seconds')
+    args = parser.parse_args()
+    run_benchmark(args.runs, args.startup)
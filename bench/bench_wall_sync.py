@@ -0,0 +1,140 @@
+"""
+Video wall skew: how far apart N screens play the same playlist.
+
+Runs a master and --agents agents whose stub mpvs (bench/fake_mpv.py) run
+at slightly different speeds (+-FAKE_MPV_RATE spread given by --drift, like
+screens whose clocks and decoders disagree), with bench/fake_ffprobe.py on
+the master so the clips have durations. The playlist is played first the
+normal way (each screen starts when it hears of the change) and then with
+wall sync on. Throughout, the benchmark reads every player's position over
+its IPC socket a few times a second and reports the spread between the
+screens, plus how far apart the synchronized starts landed. JSON output.
+
+    python bench/bench_wall_sync.py [--agents 4] [--seconds 20] [--drift 0.002]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from bench_e2e import ROOT, Harness, git_commit, percentiles, read_records
+
+sys.path.append(ROOT)
+from shared.player import MpvIpc
+
+FAKE_FFPROBE = os.path.join(ROOT, 'bench', 'fake_ffprobe.py')
+SAMPLE_INTERVAL = 0.2
+
+
+def wait_for_durations(h, ids, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        videos = h.session.get(f'{h.url}/api/videos', params={'limit': len(ids)}).json()['videos']
+        if all(v['duration'] for v in videos):
+            return
+        time.sleep(0.2)
+    raise RuntimeError('master did not probe the clips, see master.log')
+
+
+def sample_positions(players, durations):
+    """Each player's offset into the playlist loop, all moved to one instant."""
+    starts = [sum(durations[:i]) for i in range(len(durations))]
+    reference = time.time()
+    positions = []
+    for ipc in players:
+        before = time.time()
+        index = (ipc.command(['get_property', 'playlist-pos']) or {}).get('data')
+        position = (ipc.command(['get_property', 'time-pos']) or {}).get('data')
+        if index is None or position is None or not 0 <= index < len(durations):
+            return None
+        positions.append(starts[index] + position - ((before + time.time()) / 2 - reference))
+    return positions
+
+
+def skew(positions, total):
+    """Spread (max - min) of loop offsets, taking the loop point into account."""
+    first = positions[0]
+    relative = [(p - first + total / 2) % total - total / 2 for p in positions]
+    return max(relative) - min(relative)
+
+
+def measure_skew(players, durations, seconds):
+    total = sum(durations)
+    spreads = []
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        positions = sample_positions(players, durations)
+        if positions:
+            spreads.append(skew(positions, total) * 1000)
+        time.sleep(SAMPLE_INTERVAL)
+    return {'skew_ms': percentiles(spreads), 'last_skew_ms': round(spreads[-1], 2) if spreads else None}
+
+
+def start_spread(h, since):
+    """How far apart the players were unpaused for the synchronized start (ms)."""
+    times = []
+    for i in range(h.num_agents):
+        unpauses = [r['t'] for r in read_records(h.record_path(i))
+                    if r['t'] >= since and r.get('command') == ['set_property', 'pause', 'no']]
+        if unpauses:
+            times.append(unpauses[0])
+    return round((max(times) - min(times)) * 1000, 2) if len(times) == h.num_agents else None
+
+
+def run(args):
+    os.environ['FFPROBE'] = f'"{sys.executable}" "{FAKE_FFPROBE}"'
+    os.environ['FAKE_FFPROBE_DURATION'] = str(args.clip)
+    h = Harness(tempfile.mkdtemp(prefix='signage-wall-'), args.agents)
+    try:
+        h.start_master()
+        ids = h.upload_videos(args.videos)
+        wait_for_durations(h, ids)
+        h.session.post(f'{h.url}/api/playlist', json={'video_ids': ids}).raise_for_status()
+        h.set_state(mode='single', current_video_id=ids[0], paused=False, wall_sync=False)
+
+        # Screens whose playback runs up to +-drift/2 fast or slow
+        spread = [i / (args.agents - 1) - 0.5 if args.agents > 1 else 0 for i in range(args.agents)]
+        h.start_agents(lambda i: {'FAKE_MPV_DURATION': str(args.clip),
+                                  'FAKE_MPV_RATE': str(1 + args.drift * spread[i])})
+        h.wait_for_agents()
+        players = [MpvIpc(os.path.join(h.workdir, f'agent-{i}.sock')) for i in range(args.agents)]
+        durations = [args.clip] * len(ids)
+
+        h.set_state(mode='playlist')
+        time.sleep(1)
+        results = {'unsynced': measure_skew(players, durations, args.seconds)}
+
+        since = time.time()
+        h.set_state(wall_sync=True)
+        time.sleep(args.settle)
+        results['synced'] = measure_skew(players, durations, args.seconds)
+        results['synced']['start_spread_ms'] = start_spread(h, since)
+        for ipc in players:
+            ipc.close()
+        return results
+    finally:
+        h.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agents', type=int, default=4)
+    parser.add_argument('--videos', type=int, default=2)
+    parser.add_argument('--clip', type=float, default=10, help='seconds each clip plays')
+    parser.add_argument('--drift', type=float, default=0.002, help='playback rate spread between screens')
+    parser.add_argument('--seconds', type=float, default=20, help='length of each measurement')
+    parser.add_argument('--settle', type=float, default=3, help='seconds after enabling sync before measuring')
+    parser.add_argument('--output', help='also write the JSON results here')
+    args = parser.parse_args()
+    results = {
+        'commit': git_commit(),
+        'timestamp': int(time.time()),
+        'params': vars(args),
+        'results': run(args),
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,45 @@
+"""
+Helpers shared by the root verify_*.py scripts: labelled checks, polling,
+and an in-process master on a throwaway database (bench_e2e.Harness runs
+real processes instead).
+"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def check(label, got, expected):
+    if got != expected:
+        raise AssertionError(f'{label}: got {got!r}, expected {expected!r}')
+    print(f'  ok  {label}')
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def master_client(prefix):
+    """
+    Imports master/app.py on a fresh database and media store in a new
+    temporary directory (also made the working directory), with transcoding
+    and thumbnails off. Returns (workdir, database, app module, test client
+    logged in with the default PIN).
+    """
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    os.chdir(workdir)
+    os.environ.update(UPLOAD_FOLDER=os.path.join(workdir, 'media'), TRANSCODE='0', FFPROBE='no-ffprobe')
+    sys.path.insert(0, os.path.join(ROOT, 'master'))
+    import database
+    database.DB_PATH = os.path.join(workdir, 'signage.db')
+    import app as master
+    web = master.app.test_client()
+    web.post('/login', data={'pin': '1234'})
+    return workdir, database, master, web
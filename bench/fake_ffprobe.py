@@ -0,0 +1,20 @@
+"""
+Stub ffprobe for benchmarks: reports every file as a FAKE_FFPROBE_DURATION
+second (default 5) 1080p H.264 video, so the master records durations
+(and skips transcoding) for the random bytes the benchmarks upload.
+
+    FFPROBE="python bench/fake_ffprobe.py"
+"""
+import json
+import os
+
+
+def main():
+    print(json.dumps({
+        'streams': [{'codec_name': 'h264', 'width': 1920, 'height': 1080, 'pix_fmt': 'yuv420p'}],
+        'format': {'duration': os.environ.get('FAKE_FFPROBE_DURATION', '5'), 'bit_rate': '8000000'},
+    }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+Stub mpv for benchmarks and smoke tests (no video output, Unix sockets only).
+
+Accepts the same command line the player builds, serves the JSON IPC
+protocol on --input-ipc-server and fakes playback: every file "plays" for
+FAKE_MPV_DURATION seconds, then mpv's end-file / playlist-pos / idle-active
+events fire as they would for real. Point the player at it with
+
+    MPV_BIN="python bench/fake_mpv.py"
+
+Environment:
+    FAKE_MPV_STARTUP   seconds before the IPC socket appears (default 0.3)
+    FAKE_MPV_DURATION  seconds each file plays (default 5)
+    FAKE_MPV_RATE      how fast its clock runs relative to real time
+                       (default 1; e.g. 1.002 for a screen that drifts ahead)
+    FAKE_MPV_FAIL      comma separated modes (gpu-fast, gpu-safe, drm) that
+                       log a DRM failure after starting, like a Pi without KMS
+    FAKE_MPV_RECORD    file to append a JSON line to for every command that
+                       changes playback (loadfile, set_property, ...) and every
+                       start-file/end-file, each with a wall-clock timestamp
+"""
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+DRM_ERROR = 'Failed to commit atomic request'
+QUIET_COMMANDS = {'get_property', 'observe_property'}  # not recorded
+
+
+def option(args, name, default=None):
+    for a in args:
+        if a.startswith(f'--{name}='):
+            return a.split('=', 1)[1]
+    return default
+
+
+def mode_of(args):
+    if option(args, 'vo') == 'drm':
+        return 'drm'
+    if option(args, 'gpu-dumb-mode') == 'yes':
+        return 'gpu-safe'
+    return 'gpu-fast' if option(args, 'gpu-context') == 'drm' else 'window'
+
+
+class FakeMpv:
+    def __init__(self, duration, record=None, rate=1.0):
+        self.duration = duration
+        self.rate = rate
+        self.record_file = open(record, 'a', buffering=1) if record else None
+        self.lock = threading.RLock()
+        self.conns = []  # (socket, {observe id: property})
+        self.props = {
+            'idle-active': True, 'pause': False, 'playlist-pos': -1, 'time-pos': None, 'speed': 1.0,
+            'loop-file': 'no', 'loop-playlist': 'no', 'video-rotate': '0', 'force-window': 'yes',
+        }
+        self.playlist = []
+        self.generation = 0
+        self.started = None  # when position `offset` was reached (monotonic)
+        self.offset = 0.0
+
+    def record(self, **entry):
+        if self.record_file:
+            self.record_file.write(json.dumps(dict(entry, t=time.time())) + '\n')
+
+    def send(self, conn, msg):
+        try:
+            conn.sendall((json.dumps(msg) + '\n').encode())
+        except OSError:
+            pass
+
+    def emit(self, msg):
+        for conn, observed in list(self.conns):
+            if msg.get('event') == 'property-change':
+                for oid, name in observed.items():
+                    if name == msg['name']:
+                        self.send(conn, dict(msg, id=oid))
+            else:
+                self.send(conn, msg)
+
+    def set(self, name, value):
+        if self.props.get(name) != value:
+            self.props[name] = value
+            self.emit({'event': 'property-change', 'name': name, 'data': value})
+
+    def position(self, now=None):
+        """Seconds into the current file: advances at speed * rate unless paused."""
+        if self.started is None:
+            return None
+        if self.props['pause']:
+            return self.offset
+        return self.offset + ((now or time.monotonic()) - self.started) * self.props['speed'] * self.rate
+
+    def rebase(self, offset=None):
+        """Pins the position (to `offset`, or where it is) before pause/speed/seek change."""
+        if self.started is not None:
+            now = time.monotonic()
+            self.offset = self.position(now) if offset is None else min(max(offset, 0.0), self.duration)
+            self.started = now
+
+    def schedule_end(self):
+        """(Re)arms the end-of-file timer for the current position, speed and pause."""
+        self.generation += 1
+        if self.started is None or self.props['pause']:
+            return
+        remaining = (self.duration - self.position()) / (self.props['speed'] * self.rate)
+        end = time.monotonic() + max(remaining, 0)
+        timer = threading.Timer(max(remaining, 0), self.finish,
+                                args=(self.props['playlist-pos'], self.generation, end))
+        timer.daemon = True
+        timer.start()
+
+    def start(self, pos, at=None):
+        self.started = at or time.monotonic()  # loops continue from the exact end time
+        self.offset = 0.0
+        self.set('playlist-pos', pos)
+        self.set('idle-active', False)
+        self.record(event='start-file', file=self.playlist[pos], pos=pos)
+        self.emit({'event': 'start-file', 'playlist_entry_id': pos + 1})
+        self.emit({'event': 'file-loaded'})
+        self.schedule_end()
+
+    def finish(self, pos, generation, end):
+        with self.lock:
+            if generation != self.generation:
+                return  # replaced, paused, seeked or sped up meanwhile
+            self.record(event='end-file', file=self.playlist[pos], pos=pos)
+            self.emit({'event': 'end-file', 'reason': 'eof', 'playlist_entry_id': pos + 1})
+            if self.props['loop-file'] == 'inf':
+                return self.start(pos, end)
+            nxt = pos + 1
+            if nxt >= len(self.playlist):
+                if self.props['loop-playlist'] != 'inf' or not self.playlist:
+                    self.stop()
+                    return
+                nxt = 0
+            self.start(nxt, end)
+
+    def stop(self):
+        self.generation += 1
+        self.started = None
+        self.set('playlist-pos', -1)
+        self.set('idle-active', True)
+        self.emit({'event': 'idle'})
+
+    def get(self, name):
+        if name == 'time-pos':
+            position = self.position()
+            return None if position is None else round(position, 4)
+        if name == 'duration':
+            return None if self.started is None else self.duration
+        if name == 'playlist-count':
+            return len(self.playlist)
+        if name == 'path':
+            pos = self.props['playlist-pos']
+            return self.playlist[pos] if 0 <= pos < len(self.playlist) else None
+        return self.props.get(name)
+
+    def execute(self, cmd, observed):
+        name = cmd[0]
+        if name not in QUIET_COMMANDS:
+            self.record(command=cmd)
+        if name == 'get_property':
+            return self.get(cmd[1])
+        if name == 'set_property':
+            value = cmd[2]
+            if cmd[1] == 'pause':
+                value = value in (True, 'yes')
+            if cmd[1] in ('pause', 'speed'):
+                self.rebase()
+                self.set(cmd[1], float(value) if cmd[1] == 'speed' else value)
+                self.schedule_end()
+            elif cmd[1] == 'time-pos':
+                self.rebase(float(value))
+                self.schedule_end()
+            elif cmd[1] == 'playlist-pos':
+                if 0 <= int(value) < len(self.playlist):
+                    self.start(int(value))
+            else:
+                self.set(cmd[1], value)
+        elif name == 'seek':
+            position = self.position()
+            if position is not None:
+                absolute = 'absolute' in (cmd[2] if len(cmd) > 2 else 'relative')
+                self.rebase(float(cmd[1]) if absolute else position + float(cmd[1]))
+                self.schedule_end()
+        elif name == 'observe_property':
+            observed[cmd[1]] = cmd[2]
+            self.emit({'event': 'property-change', 'name': cmd[2], 'data': self.get(cmd[2])})
+        elif name == 'loadfile':
+            mode = cmd[2] if len(cmd) > 2 else 'replace'
+            if mode == 'replace':
+                self.playlist = [cmd[1]]
+                self.start(0)
+            else:
+                self.playlist.append(cmd[1])
+                if self.props['idle-active']:
+                    self.start(len(self.playlist) - 1)
+        elif name == 'playlist-clear':
+            pos = self.props['playlist-pos']
+            self.playlist = self.playlist[pos:pos + 1] if pos >= 0 else []
+            if pos >= 0:
+                self.props['playlist-pos'] = 0
+        elif name == 'stop':
+            self.playlist = []
+            self.stop()
+        elif name == 'quit':
+            os._exit(0)
+        return None
+
+    def serve(self, conn):
+        observed = {}
+        self.conns.append((conn, observed))
+        for line in conn.makefile('rb'):
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                continue
+            with self.lock:
+                data = self.execute(msg['command'], observed)
+            reply = {'error': 'success', 'data': data}
+            if 'request_id' in msg:
+                reply['request_id'] = msg['request_id']
+            self.send(conn, reply)
+
+
+def main(args):
+    ipc_path = option(args, 'input-ipc-server')
+    log_path = option(args, 'log-file')
+    mode = mode_of(args)
+    time.sleep(float(os.environ.get('FAKE_MPV_STARTUP', 0.3)))
+
+    if log_path:
+        with open(log_path, 'w') as f:
+            f.write(f'[cplayer] fake mpv starting ({mode})\n')
+            if mode in os.environ.get('FAKE_MPV_FAIL', '').split(','):
+                f.write(f'[vo/gpu/drm] {DRM_ERROR}: Invalid argument\n')
+
+    if os.path.exists(ipc_path):
+        os.remove(ipc_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(ipc_path)
+    server.listen(8)
+    player = FakeMpv(float(os.environ.get('FAKE_MPV_DURATION', 5)), os.environ.get('FAKE_MPV_RECORD'),
+                     float(os.environ.get('FAKE_MPV_RATE', 1)))
+    while True:
+        conn, _ = server.accept()
+        threading.Thread(target=player.serve, args=(conn,), daemon=True).start()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
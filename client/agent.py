@@ -1,116 +1,292 @@
 import sys
 import os
 import time
+import socket
+import threading
 import requests
 import logging
 
 # Add parent dir to path to import shared modules
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from shared.player import Player
+from client.sync import SyncWorker
+from client.peers import PeerNetwork, PEER_PORT
+from client.wall import WallClock, WallSync
+from shared.schedule import Schedule
 
 # Configuration
 MASTER_URL = os.environ.get('MASTER_URL', 'http://localhost:5000')
-CLIENT_VIDEO_DIR = os.path.join(os.path.dirname(__file__), 'videos')
+CLIENT_VIDEO_DIR = os.environ.get('CLIENT_VIDEO_DIR', os.path.join(os.path.dirname(__file__), 'videos'))
+CLIENT_ID = os.environ.get('CLIENT_ID') or socket.gethostname()
 CHECK_INTERVAL = 0.5  # Reduced for near-instant responsiveness (0.5s is safe for local network)
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Push channel: hold /api/events open and only fetch the manifest when the
+# master announces a change. Falls back to polling every CHECK_INTERVAL while
+# the stream is down. Set EVENT_STREAM=0 to always poll.
+USE_EVENT_STREAM = os.environ.get('EVENT_STREAM', '1') != '0'
+MANIFEST_REFRESH_INTERVAL = 30  # safety re-check even when the stream is quiet
+EVENT_READ_TIMEOUT = 40  # master sends a keepalive every 15s
+STATUS_INTERVAL = 5  # heartbeat cadence when nothing changes
+# Once we hold a manifest, ask only for what changed since its version.
+# Set MANIFEST_DELTA=0 to always fetch the full manifest.
+USE_MANIFEST_DELTA = os.environ.get('MANIFEST_DELTA', '1') != '0'
+MANIFEST_STATE_FIELDS = ('mode', 'current_single_id', 'paused', 'restart_id', 'wall_sync', 'sync_start')
 
-def ensure_dir_exists(path):
-    if not os.path.exists(path):
-        os.makedirs(path)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def sync_files(remote_videos):
+class ManifestEvents(threading.Thread):
     """
-    Downloads missing videos from master.
-    Returns True if any file was downloaded (implies we might need to refresh).
+    Listens on the master's Server-Sent Events stream and sets `changed`
+    (and wakes the control loop) whenever a new manifest version is announced.
     """
-    ensure_dir_exists(CLIENT_VIDEO_DIR)
-    local_files = set(os.listdir(CLIENT_VIDEO_DIR))
-    remote_map = {v['filename']: v for v in remote_videos}
-    remote_filenames = set(remote_map.keys())
-    
-    changed = False
 
-    # Download missing
-    for fname in remote_filenames:
-        if fname not in local_files:
-            logging.info(f"Downloading new video: {fname}")
-            try:
-                url = f"{MASTER_URL}/static/videos/{fname}"
-                r = requests.get(url, stream=True)
-                if r.status_code == 200:
-                    with open(os.path.join(CLIENT_VIDEO_DIR, fname), 'wb') as f:
-                        for chunk in r.iter_content(chunk_size=8192):
-                            f.write(chunk)
-                    changed = True
-                else:
-                    logging.error(f"Failed to download {fname}: {r.status_code}")
-            except Exception as e:
-                logging.error(f"Download error: {e}")
+    def __init__(self, changed, wake):
+        super().__init__(daemon=True)
+        self.changed = changed
+        self.wake = wake
+        self.connected = False
 
-    # Cleanup extra (Optional: strict sync)
-    for fname in local_files:
-        if fname not in remote_filenames:
-            logging.info(f"Removing old video: {fname}")
+    def _notify(self):
+        self.changed.set()
+        self.wake.set()
+
+    def run(self):
+        backoff = 1
+        while True:
             try:
-                os.remove(os.path.join(CLIENT_VIDEO_DIR, fname))
-            except OSError:
-                pass
+                with requests.get(f"{MASTER_URL}/api/events", stream=True,
+                                  timeout=(2, EVENT_READ_TIMEOUT)) as r:
+                    if r.status_code != 200:
+                        raise requests.exceptions.RequestException(f"events returned {r.status_code}")
+                    logging.info("Event stream connected.")
+                    self.connected = True
+                    backoff = 1
+                    # Anything may have changed while we were disconnected
+                    self._notify()
+                    for line in r.iter_lines(chunk_size=None, decode_unicode=True):
+                        if line and line.startswith('event: manifest'):
+                            self._notify()
+            except Exception as e:
+                logging.debug(f"Event stream error: {e}")
+            if self.connected:
+                logging.warning("Event stream dropped, falling back to polling.")
+            self.connected = False
+            self._notify()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
 
-    return changed
+def apply_manifest(model, data):
+    """
+    Folds a full manifest (either view) or a delta from /api/manifest/delta
+    into `model` ({'version', 'group', 'state', 'videos': {id: video},
+    'playlist': [ids], 'schedule': [rules]}). The client view lists only the
+    videos our screen group needs. Returns (videos changed, playlist changed).
+    """
+    model['version'] = data['version']
+    if 'group' in data:
+        model['group'] = data['group']
+    model['state'].update({k: data[k] for k in MANIFEST_STATE_FIELDS if k in data})
+    if 'schedule' in data:
+        model['schedule'] = data['schedule']
+    if 'video_table' in data:
+        fields = data['video_table']['fields']
+        videos = [dict(zip(fields, row)) for row in data['video_table']['rows']]
+        model['videos'] = {v['id']: v for v in videos}
+        model['playlist'] = data['playlist']
+        return True, True
+    if data.get('delta') is None:
+        model['videos'] = {v['id']: v for v in data['all_videos']}
+        model['playlist'] = [item['id'] for item in data['playlist']]
+        return True, True
+    for v in data['videos']:
+        model['videos'][v['id']] = v
+    for video_id in data['deleted']:
+        model['videos'].pop(video_id, None)
+    if 'playlist' in data:
+        model['playlist'] = data['playlist']
+    return bool(data['videos'] or data['deleted']), 'playlist' in data
 
 def main():
     player = Player()
     
     current_mode = None
     current_single_id = None
-    playlist_index = 0
+    playlist_items = None
     was_paused = False
     last_restart_id = '0'
+
+    # Last manifest accepted from the master, kept up to date from deltas.
+    # While the master answers 304 we keep driving the state machine from
+    # these without re-parsing.
+    model = {'version': None, 'group': None, 'state': {}, 'videos': {}, 'playlist': [], 'schedule': []}
+    # Dayparting rules from the manifest, evaluated against our own clock so
+    # scheduled switches happen on time even while the master is unreachable
+    schedule = Schedule([])
+    active_rule = None
+    rule_since = None
+    next_transition = None
+    # Video wall mode: started on first use, then drives the player whenever
+    # the content can be played on the shared timeline
+    wall = None
+    server_mode = None
+    server_single_id = None
+    server_paused = False
+    video_map = {}
+    new_playlist = []
+    last_manifest_check = 0
+    last_status = None
+    last_status_at = 0
+    playing_track = None
+    touched_track = None
+
+    # `wake` cuts the tick short: set when the manifest changed, a download
+    # finished or mpv finished a file. `refresh` means re-fetch the manifest.
+    wake = threading.Event()
+    refresh = threading.Event()
+    player.on_event('end-file', lambda _: wake.set())
+    # Downloads run on the sync worker; with PEER_PORT set they come from
+    # other screens where possible, and we serve ours to them
+    peers = PeerNetwork(MASTER_URL, CLIENT_ID) if PEER_PORT else None
+    sync = SyncWorker(MASTER_URL, CLIENT_VIDEO_DIR, wake, peers=peers)
+    sync.start()
+    if peers:
+        peers.start(sync)
+    events = None
+    if USE_EVENT_STREAM:
+        events = ManifestEvents(refresh, wake)
+        events.start()
     
-    logging.info(f"Starting Client Agent for Master: {MASTER_URL}")
+    logging.info(f"Starting Client Agent '{CLIENT_ID}' for Master: {MASTER_URL}")
 
     while True:
         try:
-            # Poll Master
-            r = requests.get(f"{MASTER_URL}/api/manifest", timeout=2)
-            if r.status_code == 200:
-                data = r.json()
+            # With a live event stream we only ask for the manifest when told
+            # to (or on the slow safety timer); otherwise poll every tick.
+            r = data = None
+            if (events is None or not events.connected or refresh.is_set()
+                    or time.monotonic() - last_manifest_check >= MANIFEST_REFRESH_INTERVAL):
+                refresh.clear()
+                last_manifest_check = time.monotonic()
+                # Poll Master (conditional: 304 means nothing changed)
+                params = {'client_id': CLIENT_ID, 'view': 'client'}
+                try:
+                    if USE_MANIFEST_DELTA and model['version'] is not None:
+                        params['since'] = model['version']
+                        r = requests.get(f"{MASTER_URL}/api/manifest/delta", params=params, timeout=2)
+                    else:
+                        headers = {'If-None-Match': f'W/"{model["version"]}"'} if model['version'] is not None else {}
+                        r = requests.get(f"{MASTER_URL}/api/manifest", headers=headers, params=params, timeout=2)
+                    if r.status_code == 200:
+                        data = r.json()
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    # Unreachable, stalled or garbled: keep playing (and
+                    # following the schedule) from the last manifest
+                    logging.warning(f"Manifest fetch from Master failed: {e}")
+                    r = None
+            manifest_changed = data is not None
+            videos_changed = playlist_changed = False
+            if manifest_changed:
+                first, group = model['version'] is None, model['group']
+                videos_changed, playlist_changed = apply_manifest(model, data)
+                state = model['state']
+                if first or model['group'] != group:
+                    logging.info(f"Screen group: {model['group'] or 'none'}")
                 
                 # 0. Check Restart
-                remote_restart = data.get('restart_id', '0')
+                remote_restart = state.get('restart_id', '0')
                 if remote_restart != '0' and remote_restart != last_restart_id:
                     if last_restart_id != '0':
                         logging.info("Restart signal received. Hard stopping player.")
                         player.stop()
                     last_restart_id = remote_restart
 
-                # 1. Sync Files
-                sync_files(data['all_videos'])
-                
-                # 2. Determine State
-                server_mode = data['mode']
-                server_single_id = int(data['current_single_id']) if data['current_single_id'] else None
-                server_paused = data.get('paused', False)
-                
-                # Update Playlist logic
-                video_map = {v['id']: v for v in data['all_videos']}
-                new_playlist = []
-                for item in data['playlist']:
-                    vid = video_map.get(item['id'])
-                    if vid:
-                        new_playlist.append(vid)
+                server_paused = state.get('paused', False)
+                video_map = model['videos']
+                if 'schedule' in data:
+                    schedule = Schedule(model['schedule'])
+                if peers:
+                    peers.seed(data.get('peers', {}))
+            elif r is not None and r.status_code != 304:
+                logging.warning(f"Master returned {r.status_code}")
+
+            if model['version'] is not None:
+                # 1. Determine State: an active schedule rule overrides the
+                # dashboard's mode (re-evaluated only at transitions)
+                rule, next_transition = schedule.current()
+                rule_changed = rule is not active_rule
+                if rule_changed:
+                    logging.info(f"Schedule: {rule['name'] or rule['id'] if rule else 'dashboard mode'} "
+                                 f"until {time.strftime('%a %H:%M:%S', time.localtime(next_transition))}")
+                    active_rule = rule
+                    rule_since = schedule.active_since(time.time()) if rule else None
+                state = model['state']
+                if rule:
+                    server_mode, server_single_id, playlist_ids = rule['mode'], rule['video_id'], rule['playlist']
+                else:
+                    server_mode = state['mode']
+                    server_single_id = int(state['current_single_id']) if state['current_single_id'] else None
+                    playlist_ids = model['playlist']
+
+                # Update Playlist logic (only when a delta or the schedule touched it)
+                if videos_changed or playlist_changed or rule_changed:
+                    new_playlist = [video_map[i] for i in playlist_ids if i in video_map]
+
+                # 2. Sync Files (in the background, what's needed now first,
+                # then what the schedule shows next)
+                if manifest_changed or rule_changed:
+                    if server_mode == 'single':
+                        needed = [server_single_id]
+                    else:
+                        needed = [v['id'] for v in new_playlist]
+                    upcoming, _ = schedule.evaluate(next_transition)
+                    if upcoming:
+                        needed += [upcoming['video_id']] if upcoming['mode'] == 'single' else upcoming['playlist']
+                    sync.update(list(video_map.values()), needed)
+
+            if server_mode is not None:
+                # --- Video wall: the shared timeline, once every file is here.
+                # Scheduled content runs from when its rule took over.
+                timeline = None
+                if state.get('wall_sync'):
+                    tracks = [video_map.get(server_single_id)] if server_mode == 'single' else new_playlist
+                    anchor = rule_since if active_rule else state.get('sync_start')
+                    if tracks and anchor and all(t and sync.is_ready(t) for t in tracks):
+                        if all(t.get('duration') for t in tracks):
+                            timeline = [(sync.path(t), t['rotation'], t['duration']) for t in tracks]
+                        elif manifest_changed or rule_changed:
+                            logging.warning("Wall sync needs video durations (ffprobe on the master); playing unsynced")
+                if timeline is not None:
+                    if wall is None:
+                        clock = WallClock(MASTER_URL)
+                        clock.start()
+                        wall = WallSync(player, clock)
+                        wall.start()
+                    wall.follow(timeline, anchor, server_paused)
+                    current_mode = 'wall'
+                    tracks_by_path = {sync.path(t): t for t in tracks}
+                    item = player.current_playlist_item()
+                    playing_track = tracks_by_path.get(item[0]) if item else tracks[0]
+                elif wall is not None and wall.active:
+                    # Back to driving the player from here
+                    wall.follow(None)
+                    current_mode = None
+                    playlist_items = None
+                    was_paused = None
 
                 # --- Handle Play/Pause ---
-                if server_paused != was_paused:
+                if timeline is None and server_paused != was_paused:
                     logging.info(f"Setting pause: {server_paused}")
                     player.set_pause(server_paused)
                     was_paused = server_paused
 
                 # --- State Machine ---
+                # Only videos the sync worker has verified are ever played
                 
+                if timeline is not None:
+                    pass  # WallSync plays it
+
                 # Case A: Single Video Mode
-                if server_mode == 'single':
+                elif server_mode == 'single':
                     target_vid = video_map.get(server_single_id)
                     if target_vid:
                         # Logic to switch video or rotation
@@ -122,66 +298,77 @@ def main():
                         elif not player.is_playing() and not server_paused:
                              should_play = True
                         
-                        if should_play:
+                        if should_play and sync.is_ready(target_vid):
                             logging.info(f"Switching to Single: {target_vid['filename']}")
-                            path = os.path.join(CLIENT_VIDEO_DIR, target_vid['filename'])
-                            player.play(path, target_vid['rotation'], loop=True)
+                            player.play(sync.path(target_vid), target_vid['rotation'], loop=True)
+                            playing_track = target_vid
                             
                             current_mode = 'single'
                             current_single_id = server_single_id
                 
-                # Case B: Playlist Mode
+                # Case B: Playlist Mode (mpv owns the playlist and advances
+                # gaplessly; we only reload it when the list changes)
                 elif server_mode == 'playlist':
+                    ready_playlist = [t for t in new_playlist if sync.is_ready(t)]
                     if not new_playlist:
                         player.stop()
+                        playing_track = None
+                        playlist_items = None
                         current_mode = 'playlist'
-                    else:
+                    elif ready_playlist:
+                        items = [(sync.path(t), t['rotation']) for t in ready_playlist]
                         if current_mode != 'playlist':
                             logging.info("Switching to Playlist mode")
+                        if (current_mode != 'playlist' or items != playlist_items
+                                or (not player.is_playing() and not server_paused)):
+                            player.play_playlist(items)
+                            playlist_items = items
                             current_mode = 'playlist'
-                            playlist_index = 0
-                            
-                            # Initial play
-                            track = new_playlist[playlist_index % len(new_playlist)]
-                            path = os.path.join(CLIENT_VIDEO_DIR, track['filename'])
-                            player.play(path, track['rotation'], loop=False)
-                            playlist_index += 1
-                        
-                        # Monitor for transition: either not playing OR specifically idle
-                        elif not player.is_playing() and not server_paused:
-                            # It's idle (finished playing)
-                            track = new_playlist[playlist_index % len(new_playlist)]
-                            logging.info(f"Playlist auto-advance: {track['filename']}")
-                            path = os.path.join(CLIENT_VIDEO_DIR, track['filename'])
-                            player.play(path, track['rotation'], loop=False)
-                            playlist_index += 1
+                        tracks_by_path = {sync.path(t): t for t in ready_playlist}
+                        item = player.current_playlist_item()
+                        playing_track = tracks_by_path.get(item[0]) if item else None
             
                 # --- Report Status to Master ---
                 playing_filename = "Stopped"
-                if player.is_playing():
-                    if server_mode == 'single' and target_vid:
-                        playing_filename = target_vid['filename']
-                    elif server_mode == 'playlist' and len(new_playlist) > 0:
-                        # For playlist, we need to know which one is actually playing
-                        # Since we track index, we use the one before the increment (or current)
-                        # Actually playlist_index is incremented AFTER play()
-                        track = new_playlist[(playlist_index - 1) % len(new_playlist)]
-                        playing_filename = track['filename']
+                playing = player.is_playing()
+                if playing and playing_track:
+                    playing_filename = playing_track['filename']
+                    if playing_track is not touched_track:
+                        sync.touch(playing_track)  # keeps it longest in the cache
+                        touched_track = playing_track
                 
-                try:
-                    requests.post(f"{MASTER_URL}/api/status", json={'current_video': playing_filename}, timeout=1)
-                except:
-                    pass # Don't block loop if status fails
-
-            else:
-                logging.warning(f"Master returned {r.status_code}")
+                # Only post on change or as a periodic heartbeat
+                if playing_filename != last_status or time.monotonic() - last_status_at >= STATUS_INTERVAL:
+                    if not (player.process and player.process.poll() is None):
+                        player_state = 'not-running'
+                    elif not playing:
+                        player_state = 'idle'
+                    else:
+                        player_state = 'paused' if server_paused else 'playing'
+                    status = {
+                        'client_id': CLIENT_ID,
+                        'current_video': playing_filename,
+                        'position': player.get_property('time-pos') if playing else None,
+                        'player_state': player_state,
+                        'sync': sync.progress(),
+                    }
+                    try:
+                        requests.post(f"{MASTER_URL}/api/status", json=status, timeout=1)
+                        last_status = playing_filename
+                        last_status_at = time.monotonic()
+                    except:
+                        pass # Don't block loop if status fails
 
-        except requests.exceptions.ConnectionError:
-            logging.warning("Connection to Master failed...")
         except Exception as e:
             logging.error(f"Agent Loop Error: {e}", exc_info=True)
             
-        time.sleep(CHECK_INTERVAL)
+        # Returns early on manifest changes, finished downloads and mpv end-file,
+        # and in time for the next scheduled switch
+        timeout = CHECK_INTERVAL
+        if next_transition is not None:
+            timeout = min(timeout, max(next_transition - time.time(), 0))
+        wake.wait(timeout)
+        wake.clear()
 
 if __name__ == '__main__':
     main()
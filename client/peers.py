@@ -0,0 +1,272 @@
+"""
+Peer-to-peer video distribution between screens on the same LAN.
+
+With PEER_PORT set, an agent serves the videos it has verified (and the
+verified prefix of one it is still downloading) over plain HTTP, and fetches
+new videos piece by piece from the peers the master lists instead of all
+from the master. Every piece is checked against the master's per-piece
+hashes, so a bad or stale peer only costs a retry, never a corrupt file.
+
+When a new video is published everyone starts at piece 0 at once. A screen
+that sees a peer level with it and a lower client id waits for that peer
+(up to PEER_WAIT) instead of going to the master, so the master sends each
+piece roughly once and the fleet passes it along.
+"""
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from client.sync import local_name, part_name
+
+PEER_PORT = int(os.environ.get('PEER_PORT', 0))  # 0 = no peer-to-peer
+PEER_MAX_UPLOADS = int(os.environ.get('PEER_MAX_UPLOADS', 4))  # concurrent pieces served
+PEER_WAIT = 5  # seconds to wait for a peer ahead of us before using the master
+PEER_POLL = 0.2
+PEER_SAMPLE = 8  # peers probed per piece
+PEER_REFRESH = 2  # seconds a peer list from the master is trusted
+PEER_TIMEOUT = (1, 10)  # connect, read
+PROBE_TIMEOUT = 0.5
+
+
+class _PeerHandler(BaseHTTPRequestHandler):
+    """GET/HEAD /content/<sha256>, with Range. Headers say how much we have."""
+
+    def _source(self):
+        parts = self.path.split('?')[0].strip('/').split('/')
+        if len(parts) != 2 or parts[0] != 'content':
+            return None
+        return self.server.sync.peer_file(parts[1])
+
+    def _headers(self, status, source, length=None, extra=()):
+        path, available, size = source
+        self.send_response(status)
+        self.send_header('X-Available', str(available))
+        self.send_header('X-Client-Id', self.server.client_id)
+        self.send_header('Content-Length', str(length or 0))
+        for name, value in extra:
+            self.send_header(name, value)
+        self.end_headers()
+
+    def do_HEAD(self):
+        source = self._source()
+        if source is None:
+            self.send_error(404)
+            return
+        self._headers(200, source)
+
+    def do_GET(self):
+        source = self._source()
+        if source is None:
+            self.send_error(404)
+            return
+        path, available, size = source
+        start, end = 0, size - 1
+        range_header = self.headers.get('Range', '')
+        if range_header.startswith('bytes='):
+            first, _, last = range_header[6:].partition('-')
+            start, end = int(first), int(last) if last else size - 1
+        if end >= available or start > end:
+            self._headers(416, source)
+            return
+        if not self.server.uploads.acquire(blocking=False):
+            self._headers(503, source)  # busy; the client tries another peer
+            return
+        try:
+            # Open first: a part file is renamed into place when it completes
+            with open(path, 'rb') as f:
+                length = end - start + 1
+                self._headers(206 if range_header else 200, source, length,
+                              [('Content-Range', f'bytes {start}-{end}/{size}')])
+                self.connection.sendfile(f, start, length)
+        except OSError as e:
+            logging.debug(f"Peer upload failed: {e}")
+        finally:
+            self.server.uploads.release()
+
+    def log_message(self, format, *args):
+        logging.debug("peer: " + format % args)
+
+
+class PeerNetwork:
+    """
+    Serves our files to peers and downloads from them. Hand it to the
+    SyncWorker (`peers=`), then call start() with that worker.
+    """
+
+    def __init__(self, master_url, client_id, port=PEER_PORT):
+        self.master_url = master_url
+        self.client_id = client_id
+        self.port = port
+        self.lock = threading.Lock()
+        self.known = {}  # sha256 -> (fetched at, [peer urls])
+        self.bytes = {'peer': 0, 'master': 0}
+        self.server = None
+
+    def start(self, sync):
+        self.server = ThreadingHTTPServer(('0.0.0.0', self.port), _PeerHandler)
+        self.server.daemon_threads = True
+        self.server.sync = sync
+        self.server.client_id = self.client_id
+        self.server.uploads = threading.BoundedSemaphore(PEER_MAX_UPLOADS)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logging.info(f"Serving videos to peers on port {self.port}")
+
+    def seed(self, peers):
+        """Takes the manifest's {sha256: [urls]} so the first lookups are free."""
+        now = time.monotonic()
+        with self.lock:
+            for sha, urls in peers.items():
+                self.known[sha] = (now, list(urls))
+
+    def stats(self):
+        with self.lock:
+            return dict(self.bytes)
+
+    def _peers(self, sha256, max_age=PEER_REFRESH):
+        with self.lock:
+            fetched, urls = self.known.get(sha256, (0, []))
+        if time.monotonic() - fetched < max_age:
+            return urls
+        try:
+            r = requests.get(f"{self.master_url}/api/peers/{sha256}",
+                             params={'client_id': self.client_id}, timeout=2)
+            urls = r.json()['peers'] if r.status_code == 200 else []
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            pass  # keep the stale list
+        with self.lock:
+            self.known[sha256] = (time.monotonic(), urls)
+        return urls
+
+    def _probe(self, url, sha256):
+        """(available bytes, client id) of a peer, or None."""
+        try:
+            r = requests.head(f"{url}/content/{sha256}", timeout=PROBE_TIMEOUT)
+            if r.status_code == 200:
+                return int(r.headers['X-Available']), r.headers.get('X-Client-Id', '')
+        except (requests.exceptions.RequestException, KeyError, ValueError):
+            pass
+        return None
+
+    def _get_range(self, url, start, end):
+        """(status, data); data is None unless the whole range arrived."""
+        try:
+            r = requests.get(url, headers={'Range': f'bytes={start}-{end - 1}'}, timeout=PEER_TIMEOUT)
+            if r.status_code == 206 and len(r.content) == end - start:
+                return r.status_code, r.content
+            return r.status_code, None
+        except requests.exceptions.RequestException:
+            return None, None
+
+    def _fetch_piece(self, video, start, end, expected):
+        sha = video['sha256']
+        deadline = time.monotonic() + PEER_WAIT
+        bad = set()
+        max_age = PEER_REFRESH
+        while True:
+            urls = [u for u in self._peers(sha, max_age) if u not in bad]
+            ahead = []
+            waiting = False
+            for url in random.sample(urls, min(PEER_SAMPLE, len(urls))):
+                status = self._probe(url, sha)
+                if status is None:
+                    bad.add(url)
+                elif status[0] >= end:
+                    ahead.append(url)
+                elif status[0] >= start and status[1] < self.client_id:
+                    waiting = True  # level with us and first in line for the master
+            for url in ahead:
+                status, data = self._get_range(f"{url}/content/{sha}", start, end)
+                if data is not None and hashlib.sha256(data).hexdigest() == expected:
+                    with self.lock:
+                        self.bytes['peer'] += len(data)
+                    return data
+                if status == 503:
+                    waiting = True  # busy serving others, try again shortly
+                    continue
+                logging.warning(f"Peer {url} failed piece at {start} of {video['filename']}")
+                bad.add(url)
+            if time.monotonic() >= deadline:
+                break
+            if not waiting:
+                if max_age == 0:
+                    break
+                # One up-to-date look before using the master: another screen
+                # may have just started on this video
+                max_age = 0
+                continue
+            time.sleep(PEER_POLL)
+
+        _, data = self._get_range(self.master_url + video['url'], start, end)
+        if data is not None and hashlib.sha256(data).hexdigest() == expected:
+            with self.lock:
+                self.bytes['master'] += len(data)
+            return data
+        return None
+
+    def download(self, directory, video, limiter, progress=None):
+        """
+        Fetches one video piece by piece into its .part file and renames it
+        into place once the whole-file hash matches. `progress(n)` is called
+        with the verified byte count, which is what we then serve to peers.
+        Returns None when the master has no piece hashes (use a plain
+        download instead), else True/False like sync.download_video().
+        """
+        try:
+            # Also tells the master we are now a source for this video
+            r = requests.get(f"{self.master_url}{video['url']}/pieces", timeout=30,
+                             params={'client_id': self.client_id, 'peer_port': self.port})
+            info = r.json() if r.status_code == 200 else None
+        except (requests.exceptions.RequestException, ValueError):
+            info = None
+        if not info:
+            return None
+        piece_size, pieces = info['piece_size'], info['pieces']
+
+        name = local_name(video)
+        tmp = os.path.join(directory, part_name(name))
+        hasher = hashlib.sha256()
+        offset = 0
+        # Keep whole pieces of a previous attempt that still verify
+        if os.path.exists(tmp):
+            with open(tmp, 'rb') as f:
+                for expected in pieces:
+                    data = f.read(piece_size)
+                    if not data or hashlib.sha256(data).hexdigest() != expected:
+                        break
+                    hasher.update(data)
+                    offset += len(data)
+            if offset:
+                logging.info(f"Resuming {video['filename']} at {offset} bytes")
+
+        with open(tmp, 'r+b' if os.path.exists(tmp) else 'wb') as f:
+            f.truncate(offset)
+            f.seek(offset)
+            if progress:
+                progress(offset)
+            for i in range(offset // piece_size, len(pieces)):
+                start, end = i * piece_size, min((i + 1) * piece_size, video['size'])
+                data = self._fetch_piece(video, start, end, pieces[i])
+                if data is None:
+                    logging.warning(f"Could not fetch {video['filename']} at {start}, will resume")
+                    return False
+                f.write(data)
+                f.flush()  # peers may read it as soon as we advertise it
+                hasher.update(data)
+                offset = end
+                limiter.consume(len(data))
+                if progress:
+                    progress(offset)
+
+        if hasher.hexdigest() != video['sha256'] or offset != video['size']:
+            logging.error(f"Downloaded {video['filename']} failed verification, discarding")
+            os.remove(tmp)
+            return False
+        os.replace(tmp, os.path.join(directory, name))
+        return True
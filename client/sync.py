@@ -0,0 +1,522 @@
+"""
+Background media sync for the client agent.
+
+A SyncWorker owns the local video cache. The control loop hands it each new
+manifest (plus which videos are needed right now) and only ever asks
+`is_ready()`; verification and downloads happen on worker threads so a
+multi-GB transfer never stalls pause/playlist handling or heartbeats.
+
+The cache is bounded by a disk quota rather than mirroring the manifest:
+videos the master stops listing stay on disk, so putting one back in a
+playlist (or re-uploading it, as files are named by content) costs no
+download. Before each download the worker checks the space and evicts
+videos nobody wants, least recently played first, then ones only wanted
+later than the download.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+import requests
+
+INDEX_FILE = '.index.json'  # verified size/hash of cached videos
+
+# Download tuning. Downloads go to a .part file (resumed with HTTP Range
+# after a drop) and are renamed into place only once verified.
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get('DOWNLOAD_CHUNK_SIZE', 1024 * 1024))
+DOWNLOAD_TIMEOUT = (5, 30)  # connect, read
+# Bytes/sec cap so syncing doesn't starve playback on a shared NIC (0 = off)
+SYNC_BANDWIDTH_LIMIT = int(os.environ.get('SYNC_BANDWIDTH_LIMIT', 0))
+SYNC_CONCURRENCY = int(os.environ.get('SYNC_CONCURRENCY', 2))
+RETRY_INTERVAL = 10  # seconds before a failed download is retried
+# Disk budget: CACHE_QUOTA caps the cache in bytes (0 = as much as the disk
+# holds) and CACHE_MIN_FREE is always left free on the filesystem
+CACHE_QUOTA = int(os.environ.get('CACHE_QUOTA', 0))
+CACHE_MIN_FREE = int(os.environ.get('CACHE_MIN_FREE', 256 * 1024 * 1024))
+
+# Queue priorities: lower runs first
+PRIORITY_NOW = 0  # what the screen should be showing right now
+PRIORITY_SOON = 1  # playlist items, in order
+PRIORITY_LIBRARY = 1000
+
+
+def local_name(video):
+    """Videos are cached under their content address, like on the master."""
+    if video.get('sha256'):
+        return video['sha256'] + os.path.splitext(video['filename'])[1].lower()
+    return video['filename']
+
+
+def part_name(name):
+    return f'.{name}.part'
+
+
+def hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+class RateLimiter:
+    """Token bucket shared by all downloads; at most one second of burst."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.allowance = limit
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, n):
+        if not self.limit:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.limit, self.allowance + (now - self.last) * self.limit)
+            self.last = now
+            self.allowance -= n
+            wait = -self.allowance / self.limit if self.allowance < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class LocalIndex:
+    """
+    Remembers which cached files have been verified (size + sha256) along
+    with their mtime, so each sync is a stat() per file rather than a re-hash,
+    and when each was last played (`used`) for eviction.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, INDEX_FILE)
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # one writer of the temp file at a time
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def is_verified(self, name, video):
+        try:
+            st = os.stat(os.path.join(self.directory, name))
+        except OSError:
+            return False
+        with self.lock:
+            entry = self.entries.get(name)
+        return (entry is not None and entry['sha256'] == video.get('sha256')
+                and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime)
+
+    def add(self, name, sha256):
+        st = os.stat(os.path.join(self.directory, name))
+        with self.lock:
+            self.entries[name] = {'sha256': sha256, 'size': st.st_size, 'mtime': st.st_mtime, 'used': time.time()}
+
+    def touch(self, name):
+        with self.lock:
+            if name in self.entries:
+                self.entries[name]['used'] = time.time()
+
+    def last_used(self, name):
+        with self.lock:
+            entry = self.entries.get(name)
+            return entry.get('used', entry['mtime']) if entry else 0
+
+    def discard(self, name):
+        with self.lock:
+            self.entries.pop(name, None)
+
+    def save(self):
+        # Worker threads save after downloads while the control loop saves
+        # from update(); serialising under save_lock keeps each write whole
+        # and the last one the newest, without blocking lookups meanwhile
+        with self.save_lock:
+            with self.lock:
+                data = json.dumps(self.entries)
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+
+
+def download_video(master_url, directory, video, limiter, progress=None):
+    """
+    Fetches one video into a .part file, resuming a previous partial
+    download with a Range request, and atomically renames it into place
+    once size and hash check out. Returns True if it verified.
+    """
+    name = local_name(video)
+    tmp = os.path.join(directory, part_name(name))
+    url = master_url + (video.get('url') or f"/static/videos/{video['filename']}")
+
+    # Seed the hash with whatever we already have on disk
+    hasher = hashlib.sha256()
+    offset = 0
+    if os.path.exists(tmp):
+        with open(tmp, 'rb') as f:
+            for block in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+                hasher.update(block)
+                offset += len(block)
+    if video.get('size') is not None and offset >= video['size']:
+        offset = 0  # stale or oversized part file; start over
+        hasher = hashlib.sha256()
+
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+    with requests.get(url, stream=True, headers=headers, timeout=DOWNLOAD_TIMEOUT) as r:
+        if r.status_code == 200:
+            offset = 0  # server ignored the Range; start over
+            hasher = hashlib.sha256()
+        elif r.status_code != 206:
+            logging.error(f"Failed to download {video['filename']}: {r.status_code}")
+            return False
+        elif offset:
+            logging.info(f"Resuming {video['filename']} at {offset} bytes")
+
+        with open(tmp, 'r+b' if offset else 'wb') as f:
+            f.seek(offset)
+            f.truncate()
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                hasher.update(chunk)
+                offset += len(chunk)
+                limiter.consume(len(chunk))
+                if progress:
+                    progress(offset)
+
+    if video.get('size') is not None and offset < video['size']:
+        logging.warning(f"Download of {video['filename']} interrupted at {offset} bytes, will resume")
+        return False
+    if video.get('sha256') and (hasher.hexdigest() != video['sha256'] or offset != video.get('size')):
+        logging.error(f"Downloaded {video['filename']} failed verification, discarding")
+        os.remove(tmp)
+        return False
+    os.replace(tmp, os.path.join(directory, name))
+    return True
+
+
+class SyncWorker:
+    """
+    Keeps `directory` in line with the manifest on background threads.
+
+    `update()` replaces the wanted set and re-prioritises the queue;
+    `is_ready()` is what the control loop uses before switching to a video
+    and `touch()` when it plays one. `wake` (a threading.Event) is set
+    whenever a video becomes ready.
+    """
+
+    def __init__(self, master_url, directory, wake=None, concurrency=SYNC_CONCURRENCY, peers=None,
+                 quota=CACHE_QUOTA, min_free=CACHE_MIN_FREE):
+        self.master_url = master_url
+        self.directory = directory
+        self.wake = wake
+        self.concurrency = concurrency
+        self.peers = peers  # client.peers.PeerNetwork, for peer-to-peer downloads
+        self.limiter = RateLimiter(SYNC_BANDWIDTH_LIMIT)
+        self.index = None
+        self.cond = threading.Condition()
+        self.wanted = {}  # local name -> video
+        self.pending = {}  # local name -> (priority, not_before)
+        self.active = {}  # local name -> {'filename', 'sha256', 'bytes', 'size', 'verified'}
+        self.ready = set()
+        self.failed = 0
+        self.threads = []
+        self.quota = quota
+        self.min_free = min_free
+        self.priorities = {}  # local name -> queue priority of every wanted video
+        self.no_room = set()  # wanted videos waiting for cache space
+        self.playing = None  # local name of the video on screen
+        self.hits = 0  # wanted videos found in the cache
+        self.misses = 0  # wanted videos downloaded
+        self.evicted = 0
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.index = LocalIndex(self.directory)
+        for _ in range(self.concurrency):
+            t = threading.Thread(target=self._run, daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def update(self, videos, needed_ids=()):
+        """
+        Takes the manifest's video list. `needed_ids` is ordered: the first is
+        what should be on screen now, the rest (e.g. playlist) come next.
+        """
+        needed = list(needed_ids)
+        wanted = {local_name(v): v for v in videos}
+        with self.cond:
+            self.wanted = wanted
+            self.ready &= set(wanted)
+            self.no_room &= set(wanted)
+            self.pending = {}
+            self.priorities = {}
+            for name, video in wanted.items():
+                if video['id'] in needed:
+                    pos = needed.index(video['id'])
+                    priority = PRIORITY_NOW if pos == 0 else PRIORITY_SOON + pos
+                else:
+                    priority = PRIORITY_LIBRARY
+                self.priorities[name] = priority
+                if name not in self.ready and name not in self.active:
+                    self.pending[name] = (priority, 0)
+            self.cond.notify_all()
+        self._cleanup(wanted)
+
+    def is_ready(self, video):
+        with self.cond:
+            return local_name(video) in self.ready
+
+    def path(self, video):
+        return os.path.join(self.directory, local_name(video))
+
+    def touch(self, video):
+        """
+        Marks a video as just played, which keeps it longest in the cache;
+        the last one touched is on screen and never evicted.
+        """
+        self.playing = local_name(video)
+        self.index.touch(self.playing)
+
+    def progress(self):
+        """Compact sync status for the heartbeat."""
+        with self.cond:
+            progress = {
+                'wanted': len(self.wanted),
+                'ready': len(self.ready),
+                'pending': len(self.pending),
+                'failed': self.failed,
+                'active': [dict(a) for a in self.active.values()],
+                'cache': self._cache_stats(),
+            }
+            if self.peers:
+                # What we can serve, for the master's peer lists
+                progress['peer_port'] = self.peers.port
+                progress['have'] = [self.wanted[n]['sha256'] for n in self.ready if self.wanted[n].get('sha256')]
+        if self.peers:
+            progress['bytes_from'] = self.peers.stats()
+        return progress
+
+    def peer_file(self, sha256):
+        """
+        (path, verified bytes, size) of a video we can serve to peers: a
+        verified file, or the piece-verified prefix of one being downloaded.
+        """
+        with self.cond:
+            for name, video in self.wanted.items():
+                if video.get('sha256') != sha256 or video.get('size') is None:
+                    continue
+                if name in self.ready:
+                    return os.path.join(self.directory, name), video['size'], video['size']
+                active = self.active.get(name)
+                if active and active['verified']:
+                    return os.path.join(self.directory, part_name(name)), active['bytes'], video['size']
+        return None
+
+    def _cache_stats(self):
+        """Cache usage and hit rate for the heartbeat; callers hold self.cond."""
+        lookups = self.hits + self.misses
+        return {
+            'used': self._usage(),
+            'quota': self.quota or None,
+            'free': shutil.disk_usage(self.directory).free,
+            'files': len(self.index.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            'evicted': self.evicted,
+            'no_room': len(self.no_room),
+        }
+
+    def _usage(self):
+        """Bytes of video (and part files) in the cache directory."""
+        total = 0
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file() and entry.name != INDEX_FILE:
+                    total += entry.stat().st_size
+            except OSError:
+                pass  # removed meanwhile
+        return total
+
+    def _fits(self, need, usage, free):
+        """True if `need` more bytes stay within the quota and the disk's reserve."""
+        if self.quota and usage + need > self.quota:
+            return False
+        return free - need >= self.min_free
+
+    def _make_room(self, name, video):
+        """
+        Evicts cached videos until `video` fits: first ones nobody wants,
+        least recently played first, then wanted ones due later than it.
+        Returns False (and keeps everything) if it still wouldn't fit.
+        """
+        if not video.get('size'):
+            return True
+        part = os.path.join(self.directory, part_name(name))
+        need = video['size'] - (os.path.getsize(part) if os.path.exists(part) else 0)
+        with self.cond:
+            # Other downloads in flight will grow by what they still lack
+            need += sum(a['size'] - a['bytes'] for n, a in self.active.items() if n != name and a['size'])
+            usage, free = self._usage(), shutil.disk_usage(self.directory).free
+            if self._fits(need, usage, free):
+                return True
+            priority = self.priorities.get(name, PRIORITY_LIBRARY)
+            candidates = []
+            for cached in list(self.index.entries):
+                if cached in (name, self.playing) or cached in self.active:
+                    continue
+                if cached not in self.wanted:
+                    candidates.append((0, 0, self.index.last_used(cached), cached))
+                elif self.priorities.get(cached, PRIORITY_LIBRARY) > priority:
+                    candidates.append((1, -self.priorities[cached], self.index.last_used(cached), cached))
+            candidates.sort()
+            evict, freed = [], 0
+            for _, _, _, cached in candidates:
+                try:
+                    freed += os.path.getsize(os.path.join(self.directory, cached))
+                except OSError:
+                    continue
+                evict.append(cached)
+                if self._fits(need, usage - freed, free + freed):
+                    break
+            else:
+                return False
+            for cached in evict:
+                self._evict(cached)
+            return True
+
+    def _evict(self, name):
+        """Deletes a cached video and returns the bytes freed; callers hold self.cond."""
+        logging.info(f"Evicting {name} from the cache")
+        self.index.discard(name)
+        self.ready.discard(name)
+        path = os.path.join(self.directory, name)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            size = 0
+        self.evicted += 1
+        if name in self.wanted:
+            self.pending[name] = (self.priorities.get(name, PRIORITY_LIBRARY), 0)
+        return size
+
+    def _cleanup(self, wanted):
+        # Verified videos stay cached even when the master no longer lists
+        # them (evicted for space later); drop anything else unwanted, but
+        # keep the part files of wanted videos so they can resume
+        keep = set(wanted) | {part_name(n) for n in wanted} | set(self.index.entries) | {INDEX_FILE}
+        for fname in os.listdir(self.directory):
+            if fname not in keep and not fname.endswith('.tmp'):
+                logging.info(f"Removing old file: {fname}")
+                self.index.discard(fname)
+                try:
+                    os.remove(os.path.join(self.directory, fname))
+                except OSError:
+                    pass
+        with self.cond:
+            # Shrink to a quota that was lowered, dropping unwanted videos only
+            usage = self._usage() if self.quota else 0
+            if usage > self.quota:
+                unwanted = sorted((self.index.last_used(n), n) for n in list(self.index.entries)
+                                  if n not in wanted and n != self.playing)
+                for _, name in unwanted:
+                    usage -= self._evict(name)
+                    if usage <= self.quota:
+                        break
+        self.index.save()
+
+    def _next(self):
+        """Blocks until a job is due; returns (name, video)."""
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                due = [(p, n) for n, (p, not_before) in self.pending.items() if not_before <= now]
+                if due:
+                    _, name = min(due)
+                    del self.pending[name]
+                    video = self.wanted[name]
+                    self.active[name] = {'filename': video['filename'], 'sha256': video.get('sha256'),
+                                         'bytes': 0, 'size': video.get('size'), 'verified': False}
+                    return name, video
+                waits = [nb - now for _, nb in self.pending.values()]
+                self.cond.wait(min(waits) if waits else None)
+
+    def _verify(self, name, video):
+        """
+        True if the cached copy matches the manifest. Files that predate the
+        index (or were touched) are hashed once and then remembered.
+        """
+        if self.index.is_verified(name, video):
+            return True
+        path = os.path.join(self.directory, name)
+        if not video.get('sha256') or not os.path.exists(path):
+            return os.path.exists(path)
+        if os.path.getsize(path) == video.get('size') and hash_file(path) == video['sha256']:
+            self.index.add(name, video['sha256'])
+            return True
+        self.index.discard(name)
+        return False
+
+    def _set_bytes(self, name, n, verified=False):
+        with self.cond:
+            if name in self.active:
+                self.active[name]['bytes'] = n
+                self.active[name]['verified'] = verified
+
+    def _run(self):
+        while True:
+            name, video = self._next()
+            ok = hit = no_room = False
+            try:
+                ok = hit = self._verify(name, video)
+                if ok:
+                    pass  # cache hit
+                elif not self._make_room(name, video):
+                    no_room = True
+                    if name not in self.no_room:
+                        logging.warning(f"No cache space for {video['filename']} ({video['size']} bytes), "
+                                        f"will retry")
+                else:
+                    logging.info(f"Downloading new video: {video['filename']}")
+                    ok = None
+                    if self.peers and video.get('sha256') and video.get('url'):
+                        ok = self.peers.download(self.directory, video, self.limiter,
+                                                 progress=lambda n, name=name: self._set_bytes(name, n, True))
+                    if ok is None:
+                        ok = download_video(self.master_url, self.directory, video, self.limiter,
+                                            progress=lambda n, name=name: self._set_bytes(name, n))
+                    if ok and video.get('sha256'):
+                        self.index.add(name, video['sha256'])
+                        self.index.save()
+            except Exception as e:
+                logging.error(f"Download error: {e}")
+
+            with self.cond:
+                priority = self.pending.pop(name, (PRIORITY_LIBRARY, 0))[0]
+                self.active.pop(name, None)
+                if name not in self.wanted:
+                    continue  # dropped from the manifest meanwhile
+                if ok:
+                    self.ready.add(name)
+                    self.no_room.discard(name)
+                    if hit:
+                        self.hits += 1
+                    else:
+                        self.misses += 1
+                elif no_room:
+                    self.no_room.add(name)
+                    self.pending[name] = (priority, time.monotonic() + RETRY_INTERVAL)
+                    self.cond.notify_all()
+                else:
+                    self.failed += 1
+                    self.pending[name] = (priority, time.monotonic() + RETRY_INTERVAL)
+                    self.cond.notify_all()
+            if ok and self.wake:
+                self.wake.set()
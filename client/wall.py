@@ -0,0 +1,187 @@
+"""
+Video wall sync: several screens playing one timeline in lockstep.
+
+The master is the time reference. WallClock estimates this screen's offset
+to the master's clock NTP-style from /api/time round trips; the sample with
+the shortest round trip wins, so the estimate is off by at most half of it.
+The manifest carries `sync_start`, the master time at which the content
+starts (or started) from its first frame, and the videos' durations, so
+every screen can work out where the loop should be at any instant.
+
+While following a timeline WallSync owns the player: it preloads the right
+entry paused at the right position, unpauses at the agreed instant, then
+every CHECK_INTERVAL compares mpv's time-pos with the timeline and nudges
+mpv's speed to close small gaps without a visible jump. Larger gaps (a
+stall, a restarted mpv) get a fresh synchronized start.
+"""
+import logging
+import threading
+import time
+
+import requests
+
+CLOCK_SAMPLES = 8  # round trips per offset estimate
+CLOCK_SYNC_INTERVAL = 60  # seconds between estimates
+PRELOAD_LEAD = 0.5  # seconds from loading paused to starting, when joining late
+CHECK_INTERVAL = 0.5  # seconds between drift checks
+DEADBAND = 0.010  # error left alone, in seconds (under a frame)
+CORRECTION_TIME = 2.0  # seconds a speed change takes to close the error
+MAX_SPEED_CHANGE = 0.05  # +-5%: unnoticeable, audio is pitch-corrected
+RESYNC_AFTER = 0.25  # error (seconds) fixed with a synchronized restart instead
+
+
+class WallClock(threading.Thread):
+    """Offset between the master's clock and ours, refreshed in the background."""
+
+    def __init__(self, master_url):
+        super().__init__(daemon=True)
+        self.master_url = master_url
+        self.offset = None  # master time - local time
+        self.error = None  # upper bound on the offset's error
+
+    def measure(self, samples=CLOCK_SAMPLES):
+        best = None
+        with requests.Session() as session:
+            for _ in range(samples):
+                sent = time.time()
+                data = session.get(f"{self.master_url}/api/time", timeout=2).json()
+                received = time.time()
+                delay = (received - sent) - (data['sent'] - data['received'])
+                if best is None or delay < best[0]:
+                    best = (delay, ((data['received'] - sent) + (data['sent'] - received)) / 2)
+        self.error, self.offset = best[0] / 2, best[1]
+        return self.offset
+
+    def run(self):
+        while True:
+            try:
+                self.measure()
+                logging.debug(f"Master clock offset {self.offset * 1000:+.1f} ms (+-{self.error * 1000:.1f})")
+                time.sleep(CLOCK_SYNC_INTERVAL)
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                logging.debug(f"Clock sync failed: {e}")
+                time.sleep(5)
+
+    def now(self):
+        """The master's time (our own until the first estimate)."""
+        return time.time() + (self.offset or 0)
+
+    def to_local(self, master_time):
+        return master_time - (self.offset or 0)
+
+
+def position_at(items, anchor, t):
+    """(entry index, seconds into it) of a loop of [(path, rotation, duration)] started at `anchor`, at time t."""
+    offset = (t - anchor) % sum(duration for _, _, duration in items)
+    for index, (_, _, duration) in enumerate(items):
+        if offset < duration:
+            return index, offset
+        offset -= duration
+    return len(items) - 1, items[-1][2]  # rounding at the loop point
+
+
+class WallSync(threading.Thread):
+    """Drives the player along a shared timeline (see module docstring)."""
+
+    def __init__(self, player, clock):
+        super().__init__(daemon=True)
+        self.player = player
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self._target = None  # (items, anchor, paused)
+        self._running = None  # (items, anchor) playing and being corrected
+        self._speed = 1.0
+        self._strikes = 0
+        self.error = None  # last measured offset from the timeline, seconds
+
+    @property
+    def active(self):
+        return self._target is not None
+
+    def follow(self, items, anchor=None, paused=False):
+        """
+        Plays [(path, rotation, duration), ...] as a loop whose first frame
+        was (or will be) shown at master time `anchor`. items=None hands the
+        player back to the caller.
+        """
+        target = (tuple(items), anchor, paused) if items else None
+        with self._lock:
+            if target == self._target:
+                return
+            self._target = target
+        self._changed.set()
+
+    def run(self):
+        while True:
+            self._changed.wait(CHECK_INTERVAL)
+            changed = self._changed.is_set()
+            self._changed.clear()
+            with self._lock:
+                target = self._target
+            try:
+                if target is None:
+                    if changed and self._speed != 1.0:
+                        self._set_speed(1.0)
+                    self._running = None
+                elif target[2]:
+                    if changed:
+                        self.player.set_pause(True)
+                    self._running = None
+                elif changed or self._running != target[:2]:
+                    self._start(*target[:2])  # new timeline, unpaused, or an earlier start failed
+                else:
+                    self._correct()
+            except Exception as e:
+                logging.error(f"Wall sync error: {e}", exc_info=True)
+
+    def _set_speed(self, speed):
+        self.player.set_speed(speed)
+        self._speed = speed
+
+    def _start(self, items, anchor):
+        """Preloads the timeline paused and unpauses it at the agreed instant."""
+        self._running = None
+        for _ in range(3):
+            start = max(anchor, self.clock.now() + PRELOAD_LEAD)
+            index, position = position_at(items, anchor, start)
+            if not self.player.preload([(path, rotation) for path, rotation, _ in items], index, position):
+                logging.warning("Wall sync: mpv did not open the file in time")
+                return
+            if self.clock.now() < start:
+                break  # otherwise loading took longer than the lead; aim later
+        self._speed, self._strikes = 1.0, 0
+        if self._changed.wait(max(self.clock.to_local(start) - time.time(), 0)):
+            return  # superseded while waiting
+        self.player.set_pause(False)
+        self._running = (items, anchor)
+        logging.info(f"Wall sync: started entry {index} at {position:.3f}s "
+                     f"(clock offset {(self.clock.offset or 0) * 1000:+.1f} ms)")
+
+    def _correct(self):
+        items, anchor = self._running
+        before = self.clock.now()
+        index = self.player.get_property("playlist-pos") if len(items) > 1 else 0
+        position = self.player.get_property("time-pos")
+        after = self.clock.now()
+        if position is None or index is None or not 0 <= index < len(items):
+            self._running = None  # mpv restarted or stopped: start again
+            return
+        expected_index, expected = position_at(items, anchor, (before + after) / 2)
+        starts = [sum(duration for _, _, duration in items[:i]) for i in range(len(items))]
+        total = starts[-1] + items[-1][2]
+        error = (starts[index] + position) - (starts[expected_index] + expected)
+        self.error = error = (error + total / 2) % total - total / 2  # across the loop point
+        if abs(error) > RESYNC_AFTER:
+            # Twice in a row: a single reading may straddle an entry change
+            self._strikes += 1
+            if self._strikes >= 2:
+                logging.info(f"Wall sync: {error * 1000:+.0f} ms off, restarting in sync")
+                self._start(items, anchor)
+            return
+        self._strikes = 0
+        speed = 1.0
+        if abs(error) >= DEADBAND:
+            speed = round(1.0 - max(-MAX_SPEED_CHANGE, min(MAX_SPEED_CHANGE, error / CORRECTION_TIME)), 4)
+        if speed != self._speed:
+            self._set_speed(speed)
@@ -1,17 +1,86 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for, session, send_from_directory
 import os
+import sys
+import time
 import database
+import clients
+import uploads
+import media
+import transcode
+import thumbnails
 import hashlib
+import gzip
 from werkzeug.utils import secure_filename
 
+# Add parent dir to path to import shared modules
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared import schedule
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # optional: responses are gzipped instead
+
 app = Flask(__name__)
 app.secret_key = 'super_secret_key_change_this'
 
-UPLOAD_FOLDER = os.path.join(app.root_path, 'static', 'videos')
+UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', os.path.join(app.root_path, 'static', 'videos'))
+MEDIA_MAX_AGE = 365 * 24 * 3600  # blobs are content-addressed, so never change
+app.config['MAX_CONTENT_LENGTH'] = uploads.MAX_UPLOAD_SIZE
+EVENT_KEEPALIVE = 15  # seconds between SSE comments on an idle stream
+WALL_SYNC_LEAD = 1.0  # seconds screens get to preload before a synchronized start
+LIBRARY_PAGE_SIZE = 48
+LIBRARY_MAX_PAGE = 200
+COMPRESS_MIN_SIZE = 1024  # smaller JSON bodies aren't worth compressing
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # Initialize DB
 database.init_db()
+media.migrate_legacy_files(UPLOAD_FOLDER)
+clients.start()
+transcode.start(UPLOAD_FOLDER)
+thumbnails.start(UPLOAD_FOLDER)
+
+@app.after_request
+def compress_json(response):
+    """Compresses JSON API responses (manifest, library) if the client accepts it."""
+    if (response.status_code != 200 or response.mimetype != 'application/json'
+            or response.direct_passthrough or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+    data = response.get_data()
+    if encoding is None or len(data) < COMPRESS_MIN_SIZE:
+        return response
+    if encoding == 'br':
+        response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+    else:
+        response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+@app.template_filter('duration')
+def format_duration(seconds):
+    """1:05 / 1:02:03, or '' when unknown."""
+    if seconds is None:
+        return ''
+    minutes, secs = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02}:{secs:02}' if hours else f'{minutes}:{secs:02}'
+
+def playlist_timing(playlist):
+    """
+    Adds each item's start offset (seconds into a loop of the playlist) and
+    returns the loop's total duration; None from the first unknown duration.
+    """
+    start = 0
+    for item in playlist:
+        item['start'] = start
+        if start is not None:
+            start = start + item['duration'] if item['duration'] is not None else None
+    return start
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'mp4', 'mkv', 'avi', 'mov'}
@@ -21,10 +90,18 @@ def index():
     if not session.get('logged_in'):
         return redirect(url_for('login'))
     
-    videos = database.get_all_videos()
-    state = database.get_state()
-    playlist = database.get_playlist()
-    return render_template('dashboard.html', videos=videos, state=state, playlist=playlist)
+    # The library is loaded page by page from /api/videos. ?group_id= shows
+    # and controls one screen group instead of the screens in no group.
+    group = database.get_group(request.args.get('group_id', type=int))
+    group_id = group and group['id']
+    state = database.get_state(group_id)
+    state['now_playing'], state['last_heartbeat'] = clients.summary()
+    playlist = database.get_playlist(group_id)
+    return render_template('dashboard.html', state=state, playlist=playlist,
+                           group=group, groups=database.get_groups(),
+                           library_page_size=LIBRARY_PAGE_SIZE,
+                           playlist_duration=playlist_timing(playlist),
+                           sprite_grid=(thumbnails.SPRITE_COLUMNS, thumbnails.SPRITE_ROWS))
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -57,34 +134,196 @@ def upload_file():
 
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(path)
+        stored = uploads.store_stream(UPLOAD_FOLDER, filename, file.stream)
         
         # Add to DB
-        new_id = database.add_video(filename)
+        new_id = database.add_video(**stored)
+        transcode.submit(new_id)
+        thumbnails.submit(new_id)
         return jsonify({'success': True, 'id': new_id, 'filename': filename})
     
     return jsonify({'error': 'Invalid file type'}), 400
 
+@app.errorhandler(uploads.UploadError)
+def handle_upload_error(e):
+    return jsonify({'error': str(e), **e.extra}), e.status
+
+@app.route('/api/upload/init', methods=['POST'])
+def init_chunked_upload():
+    """
+    Starts or resumes a chunked upload. Expects {'filename', 'size'} and
+    optionally {'sha256'} and a client {'fingerprint'} of the file (needed
+    to resume without the hash); returns the chunk size and the chunks the
+    master already has so the dashboard only sends what is missing.
+    """
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    data = request.json or {}
+    if not allowed_file(data.get('filename', '')):
+        return jsonify({'error': 'Invalid file type'}), 400
+    try:
+        size = int(data.get('size', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid size'}), 400
+    filename = secure_filename(data['filename'])
+    upload = uploads.init_upload(UPLOAD_FOLDER, filename, size, data.get('sha256'), data.get('fingerprint'))
+    return jsonify({'success': True, **upload})
+
+@app.route('/api/upload/<upload_id>', methods=['GET'])
+def get_chunked_upload(upload_id):
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(uploads.describe(uploads.get_upload(upload_id)))
+
+@app.route('/api/upload/<upload_id>/<int:index>', methods=['PUT'])
+def put_upload_chunk(upload_id, index):
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    upload = uploads.write_chunk(UPLOAD_FOLDER, upload_id, index, request.stream)
+    return jsonify({'success': True, 'received': len(upload['received'])})
+
+@app.route('/api/upload/<upload_id>/finalize', methods=['POST'])
+def finalize_chunked_upload(upload_id):
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    stored = uploads.finalize_upload(UPLOAD_FOLDER, upload_id)
+    new_id = database.add_video(**stored)
+    transcode.submit(new_id)
+    thumbnails.submit(new_id)
+    return jsonify({'success': True, 'id': new_id, 'filename': stored['filename']})
+
+@app.route('/api/upload/<upload_id>', methods=['DELETE'])
+def abort_chunked_upload(upload_id):
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    uploads.abort_upload(UPLOAD_FOLDER, upload_id)
+    return jsonify({'success': True})
+
+@app.route('/media/<blob>', methods=['GET'])
+def serve_media(blob):
+    """
+    Serves a media blob to clients with Range/If-Range support so partial
+    downloads can resume. The blob name is its hash, so it doubles as a
+    strong ETag and the response can be cached forever.
+    """
+    response = send_from_directory(UPLOAD_FOLDER, blob, conditional=True,
+                                   etag=blob.split('.')[0], max_age=MEDIA_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={MEDIA_MAX_AGE}, immutable'
+    if response.status_code == 206 and request.method == 'GET':
+        _sendfile_range(response, os.path.join(UPLOAD_FOLDER, blob))  # already checked by send_from_directory
+    return response
+
+def _sendfile_range(response, path):
+    """
+    Werkzeug sends a byte range by reading the file in Python. Under a
+    server with wsgi.file_wrapper (gunicorn, see wsgi.py) hand it the file
+    positioned at the range start instead; it sendfile()s exactly
+    Content-Length bytes, so resumed downloads are zero-copy like full ones.
+    """
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper is None:
+        return
+    start = int(response.headers['Content-Range'].split()[1].split('-')[0])
+    f = open(path, 'rb')
+    f.seek(start)
+    response.close()  # the range iterator werkzeug opened
+    response.response = file_wrapper(f)
+    response.direct_passthrough = True
+
+@app.route('/thumbs/<name>', methods=['GET'])
+def serve_thumbnail(name):
+    """Posters and sprite sheets; named by content hash, so cached forever."""
+    response = send_from_directory(thumbnails.thumbs_path(UPLOAD_FOLDER), name, max_age=MEDIA_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={MEDIA_MAX_AGE}, immutable'
+    return response
+
+@app.route('/media/<blob>/pieces', methods=['GET'])
+def media_pieces(blob):
+    """
+    Per-piece hashes, so clients can verify pieces fetched from peers. A
+    client that passes client_id and peer_port is listed as a source for
+    the video right away.
+    """
+    blob = secure_filename(blob)
+    if not os.path.exists(os.path.join(UPLOAD_FOLDER, blob)):
+        return jsonify({'error': 'Not found'}), 404
+    client_id = request.args.get('client_id')
+    peer_port = request.args.get('peer_port', type=int)
+    if client_id and peer_port:
+        clients.announce(os.path.splitext(blob)[0], client_id, request.remote_addr, peer_port)
+    response = jsonify(media.piece_hashes(UPLOAD_FOLDER, blob))
+    response.headers['Cache-Control'] = f'public, max-age={MEDIA_MAX_AGE}, immutable'
+    return response
+
+@app.route('/api/peers/<sha256>', methods=['GET'])
+def get_peers(sha256):
+    """
+    Fresh list of screens that can serve a video. The manifest carries the
+    same data, but is only refetched when the manifest version changes.
+    """
+    return jsonify({'peers': clients.peers([sha256], exclude=request.args.get('client_id'))[sha256]})
+
+@app.route('/api/videos', methods=['GET'])
+def list_videos():
+    """
+    One page of the library: ?offset=&limit=&sort=added|name|duration|size
+    &order=asc|desc&q=<filename search>. Returns the videos and the total
+    number of matches.
+    """
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    sort = request.args.get('sort', 'added')
+    if sort not in database.VIDEO_SORTS:
+        return jsonify({'error': f'Unknown sort {sort}'}), 400
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', LIBRARY_PAGE_SIZE, type=int), 1), LIBRARY_MAX_PAGE)
+    videos, total = database.list_videos(offset, limit, sort, request.args.get('order', 'desc') != 'asc',
+                                         request.args.get('q'))
+    for v in videos:
+        v['url'] = media.blob_url(v['blob']) if v['blob'] else None
+    return jsonify({'videos': videos, 'total': total, 'offset': offset, 'limit': limit})
+
 @app.route('/api/delete/<int:video_id>', methods=['POST'])
 def delete_video(video_id):
     if not session.get('logged_in'):
         return jsonify({'error': 'Unauthorized'}), 401
         
-    videos = database.get_all_videos()
-    target = next((v for v in videos if v['id'] == video_id), None)
+    target = database.get_video(video_id)
     
     if target:
-        # Remove file
-        try:
-            os.remove(os.path.join(UPLOAD_FOLDER, target['filename']))
-        except OSError:
-            pass # File might be gone already
-            
         database.delete_video(video_id)
+        transcode.cancel(video_id)
+        # Remove files unless another row shares the same content
+        media.release(UPLOAD_FOLDER, target['blob'])
+        media.release(UPLOAD_FOLDER, target['rendition_blob'])
+        thumbnails.release(UPLOAD_FOLDER, target['sha256'])
         return jsonify({'success': True})
     return jsonify({'error': 'Video not found'}), 404
 
+@app.route('/api/transcodes', methods=['GET'])
+def list_transcodes():
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify({'jobs': database.get_transcode_jobs()})
+
+@app.route('/api/transcodes/<int:video_id>', methods=['GET', 'POST'])
+def video_transcode(video_id):
+    """Job status and progress of one video; POST queues it again (e.g. after a failure)."""
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    if request.method == 'POST':
+        if database.get_video(video_id) is None:
+            return jsonify({'error': 'Video not found'}), 404
+        job = database.get_transcode_job(video_id)
+        if job is None or job['status'] not in ('queued', 'running'):
+            if not transcode.submit(video_id):
+                return jsonify({'error': 'Transcoding is off (TRANSCODE=0 or no ffprobe/ffmpeg)'}), 409
+    job = database.get_transcode_job(video_id)
+    if job is None:
+        return jsonify({'error': 'No transcode job'}), 404
+    return jsonify(job)
+
 @app.route('/api/rotate/<int:video_id>', methods=['POST'])
 def rotate_video(video_id):
     if not session.get('logged_in'):
@@ -101,15 +340,54 @@ def update_state():
     if not session.get('logged_in'):
         return jsonify({'error': 'Unauthorized'}), 401
     
+    # All fields in one commit, so screens never see half of a change
     data = request.json
+    try:
+        group_id = _group_id(data)
+        database.apply_changes(state=_state_updates(data, group_id=group_id), group_id=group_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'success': True})
+
+def _group_id(data):
+    """The screen group a request's `group_id` field targets (None: screens in no group)."""
+    group_id = (data or {}).get('group_id')
+    return None if group_id in (None, '') else int(group_id)
+
+def _state_updates(data, playlist_changed=False, group_id=None):
+    """
+    State keys to write for the mode/current_video_id/paused/wall_sync
+    fields in a request, plus a new wall timeline start if needed.
+    """
+    updates = {}
     if 'mode' in data:
-        database.set_state('mode', data['mode'])
+        updates['mode'] = data['mode']
     if 'current_video_id' in data:
-        database.set_state('current_video_id', data['current_video_id'])
+        updates['current_video_id'] = data['current_video_id']
     if 'paused' in data:
-        database.set_state('paused', 'true' if data['paused'] else 'false')
-        
-    return jsonify({'success': True})
+        updates['paused'] = 'true' if data['paused'] else 'false'
+    if 'wall_sync' in data:
+        updates['wall_sync'] = 'true' if data['wall_sync'] else 'false'
+    return _wall_sync_start(updates, playlist_changed, group_id)
+
+def _wall_sync_start(updates, playlist_changed=False, group_id=None):
+    """
+    With wall sync on, content changes restart the shared timeline a moment
+    from now (master clock), so every screen can preload and start together.
+    """
+    enabled = updates.get('wall_sync', database.get_state(group_id).get('wall_sync')) == 'true'
+    if enabled and (playlist_changed or {'mode', 'current_video_id', 'wall_sync'} & updates.keys()):
+        updates['sync_start'] = f'{time.time() + WALL_SYNC_LEAD:.3f}'
+    return updates
+
+@app.route('/api/time', methods=['GET'])
+def master_time():
+    """
+    The master's clock, for screens estimating their offset NTP-style:
+    when the request was handled and when the reply was sent.
+    """
+    received = time.time()
+    return jsonify({'received': received, 'sent': time.time()})
 
 @app.route('/api/restart', methods=['POST'])
 def restart_clients():
@@ -117,18 +395,181 @@ def restart_clients():
         return jsonify({'error': 'Unauthorized'}), 401
     
     # Update restart_id to current timestamp
-    import time
     database.set_state('restart_id', str(int(time.time())))
     return jsonify({'success': True})
 
+@app.route('/api/playlist', methods=['GET'])
+def get_playlist():
+    """
+    The playlist (?group_id=: a screen group's) with each item's start
+    offset and the loop's total duration.
+    """
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    playlist = database.get_playlist(request.args.get('group_id', type=int))
+    duration = playlist_timing(playlist)
+    return jsonify({'items': playlist, 'duration': duration})
+
 @app.route('/api/playlist', methods=['POST'])
 def update_playlist():
     if not session.get('logged_in'):
         return jsonify({'error': 'Unauthorized'}), 401
         
     data = request.json
-    # Expects {'video_ids': [1, 3, 2]}
-    database.set_playlist(data.get('video_ids', []))
+    # Expects {'video_ids': [1, 3, 2]} to replace the playlist, or edits:
+    # {'ops': [{'op': 'insert', 'video_id': 4}, {'op': 'move', 'from': 0, 'to': 2}]},
+    # and 'group_id' to change a screen group's playlist
+    try:
+        group_id = _group_id(data)
+        state = _wall_sync_start({}, True, group_id)
+        if 'ops' in data:
+            database.apply_changes(state=state, playlist_ops=data['ops'], group_id=group_id)
+        else:
+            database.apply_changes(state=state, playlist=data.get('video_ids', []), group_id=group_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'success': True})
+
+@app.route('/api/apply', methods=['POST'])
+def apply_changes():
+    """
+    Several dashboard changes in one round trip and one atomic commit:
+    any of mode, current_video_id, paused, wall_sync, video_ids (new
+    playlist), ops (playlist edits) and restart, for the screens in no group
+    or those of `group_id`. Screens see a single new version.
+    """
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    data = request.json
+    try:
+        group_id = _group_id(data)
+        state = _state_updates(data, 'video_ids' in data or bool(data.get('ops')), group_id)
+        if data.get('restart'):
+            state['restart_id'] = str(int(time.time()))
+        version = database.apply_changes(state=state, playlist=data.get('video_ids'),
+                                         playlist_ops=data.get('ops'), group_id=group_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'success': True, 'version': version})
+
+_schedules = {}  # group id -> Schedule of the rules for its screens
+
+def _scope_rules(group_id=None):
+    """The rules for a group's screens (None: screens in no group)."""
+    return [r for r in database.get_schedules() if r['group_id'] in (None, group_id)]
+
+def _current_schedule(group_id=None):
+    """A group's rules as a Schedule, rebuilt only when they change."""
+    rules = _scope_rules(group_id)
+    if group_id not in _schedules or rules != _schedules[group_id].rules:
+        _schedules[group_id] = schedule.Schedule(rules)
+    return _schedules[group_id]
+
+def _schedule_rule(data):
+    """A validated rule from a request, with the group it is for; raises ValueError."""
+    rule = schedule.normalize_rule(data or {})
+    video_ids = [rule['video_id']] if rule['mode'] == 'single' else rule['playlist']
+    missing = [i for i in video_ids if database.get_video(i) is None]
+    if missing:
+        raise ValueError(f'Unknown video ids {missing}')
+    rule['group_id'] = _group_id(data)
+    if rule['group_id'] is not None and database.get_group(rule['group_id']) is None:
+        raise ValueError(f"Unknown group {rule['group_id']}")
+    return rule
+
+@app.route('/api/schedule', methods=['GET'])
+def get_schedule():
+    """
+    The dayparting rules, the one active now (by the master's clock) on the
+    screens in no group, or those of ?group_id=, and when that next changes,
+    in epoch seconds.
+    """
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    rule, until = _current_schedule(request.args.get('group_id', type=int)).current()
+    return jsonify({'rules': database.get_schedules(), 'active': rule and rule['id'], 'until': until,
+                    'now': schedule.clock()})
+
+@app.route('/api/schedule', methods=['POST'])
+def add_schedule_rule():
+    """
+    Adds a rule: {'mode': 'single', 'video_id'} or {'mode': 'playlist',
+    'playlist': [ids]}, 'start_time'/'end_time' ('HH:MM') and optionally
+    'days' ([0-6], 0 = Monday), 'start_date'/'end_date', 'priority', 'name'
+    and 'group_id' (only that group's screens; default every screen).
+    """
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        rule = _schedule_rule(request.json)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'success': True, 'id': database.save_schedule(rule)})
+
+@app.route('/api/schedule/<int:rule_id>', methods=['PUT'])
+def replace_schedule_rule(rule_id):
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        rule = _schedule_rule(request.json)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if database.save_schedule(rule, rule_id) is None:
+        return jsonify({'error': 'Rule not found'}), 404
+    return jsonify({'success': True, 'id': rule_id})
+
+@app.route('/api/schedule/<int:rule_id>', methods=['DELETE'])
+def delete_schedule_rule(rule_id):
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    if not database.delete_schedule(rule_id):
+        return jsonify({'error': 'Rule not found'}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/groups', methods=['GET'])
+def list_groups():
+    """
+    Screen groups with their own state, playlist (video ids) and member
+    screens. /api/state, /api/playlist, /api/apply and /api/schedule take
+    a 'group_id' to act on one group.
+    """
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify({'groups': database.get_groups()})
+
+@app.route('/api/groups', methods=['POST'])
+def add_group():
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    name = str((request.json or {}).get('name') or '').strip()
+    if not name:
+        return jsonify({'error': 'Group name required'}), 400
+    try:
+        group_id = database.add_group(name)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'success': True, 'id': group_id})
+
+@app.route('/api/groups/<int:group_id>', methods=['DELETE'])
+def delete_group(group_id):
+    """Deletes a group and its rules; its screens go back to the global settings."""
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    if not database.delete_group(group_id):
+        return jsonify({'error': 'Group not found'}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/clients/<client_id>/group', methods=['POST'])
+def set_client_group(client_id):
+    """Moves a screen into {'group_id': id}, or into no group with null."""
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        group_id = _group_id(request.json)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not database.set_client_group(client_id, group_id):
+        return jsonify({'error': 'Group not found'}), 404
     return jsonify({'success': True})
 
 @app.route('/api/pin', methods=['POST'])
@@ -147,36 +588,259 @@ def update_pin():
 
 @app.route('/api/status', methods=['POST'])
 def update_client_status():
-    data = request.json
-    now_playing = data.get('current_video', 'Stopped')
-    database.set_state('now_playing', now_playing)
-    # Update heartbeat as well
-    import time
-    database.set_state('last_heartbeat', str(int(time.time())))
+    """
+    Heartbeat from a screen. Recorded in the in-memory client registry only;
+    it is flushed to the clients table in batches.
+    """
+    data = request.json or {}
+    clients.record_heartbeat(
+        data.get('client_id') or request.remote_addr,
+        request.remote_addr,
+        current_video=data.get('current_video', 'Stopped'),
+        position=data.get('position'),
+        player_state=data.get('player_state'),
+        sync=data.get('sync'),
+    )
     return jsonify({'success': True})
 
+@app.route('/api/status', methods=['GET'])
+def get_client_status():
+    """Summary of the freshest screen, for the dashboard header."""
+    now_playing, last_heartbeat = clients.summary()
+    return jsonify({
+        'now_playing': now_playing,
+        'last_heartbeat': str(last_heartbeat),
+    })
+
+@app.route('/api/clients', methods=['GET'])
+def list_clients():
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    screens = clients.get_clients()
+    for c in screens:
+        c['group_id'] = database.get_client_group(c['client_id'])
+    return jsonify({'clients': screens})
+
+def _not_modified(etag):
+    response = app.response_class(status=304)
+    response.set_etag(etag, weak=True)
+    response.vary.add('Accept-Encoding')  # as on the 200 it stands for
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Manifest field -> (state key, conversion)
+MANIFEST_STATE_FIELDS = {
+    'mode': ('mode', lambda v: v or 'single'),
+    'current_single_id': ('current_video_id', lambda v: v),
+    'paused': ('paused', lambda v: v == 'true'),
+    'restart_id': ('restart_id', lambda v: v or '0'),
+    'wall_sync': ('wall_sync', lambda v: v == 'true'),
+    'sync_start': ('sync_start', lambda v: float(v) if v else None),  # master time
+}
+
+def _manifest_state(state, keys=None):
+    """Manifest fields for the given state keys (all of them by default)."""
+    return {field: convert(state.get(key))
+            for field, (key, convert) in MANIFEST_STATE_FIELDS.items()
+            if keys is None or key in keys}
+
+# Video fields the agent uses; ?view=client sends only these
+CLIENT_VIDEO_FIELDS = ('id', 'filename', 'rotation', 'size', 'sha256', 'url', 'duration')
+
+def _client_view():
+    return request.args.get('view') == 'client'
+
+def _manifest_videos(videos):
+    # With size/hash so clients can verify what they hold
+    for v in videos:
+        v['url'] = media.blob_url(v['blob']) if v['blob'] else None
+        if v['rendition_blob']:
+            # Screens play the Pi-friendly transcode
+            v['original_url'] = v['url']
+            v['url'] = media.blob_url(v['rendition_blob'])
+            v['size'], v['sha256'] = v['rendition_size'], v['rendition_sha256']
+    if _client_view():
+        return [{k: v[k] for k in CLIENT_VIDEO_FIELDS} for v in videos]
+    return videos
+
+def _manifest_peers(videos):
+    """Screens that already hold (part of) these videos, for peer-to-peer sync."""
+    peers = clients.peers([v['sha256'] for v in videos if v['sha256']],
+                          exclude=request.args.get('client_id'))
+    return {sha: urls for sha, urls in peers.items() if urls}
+
+def _request_group():
+    """
+    The screen group a manifest request is for: ?group_id=, else the group
+    of ?client_id=, else None (screens in no group).
+    """
+    group_id = request.args.get('group_id', type=int)
+    if group_id is None:
+        return database.get_client_group(request.args.get('client_id'))
+    return group_id
+
+def _scope_video_ids(state, playlist, rules):
+    """
+    Ids of the videos a group's screens may play: the current video, the
+    playlist and what its schedule rules show. Screens sync only these.
+    """
+    ids = {item['id'] for item in playlist}
+    for rule in rules:
+        ids.update([rule['video_id']] if rule['mode'] == 'single' else rule['playlist'])
+    if str(state.get('current_video_id') or '').isdigit():
+        ids.add(int(state['current_video_id']))
+    return ids
+
+# Client-view manifest per group (None: screens in no group), rebuilt when
+# the version moves on: group id -> (version, manifest without peers, videos)
+_client_manifests = {}
+
+def _client_manifest(version, group_id):
+    cached = _client_manifests.get(group_id)
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+    state = database.get_state(group_id)
+    playlist = database.get_playlist(group_id)
+    rules = _scope_rules(group_id)
+    needed = _scope_video_ids(state, playlist, rules)
+    videos = _manifest_videos([v for v in database.get_all_videos() if v['id'] in needed])
+    group = database.get_group(group_id) if group_id is not None else None
+    # Compact: no dashboard fields, playlist as video ids and the videos
+    # as a table, so each field name is sent once
+    manifest = {
+        'version': version,
+        'group': group and group['name'],
+        **_manifest_state(state),
+        'playlist': [item['id'] for item in playlist],
+        'schedule': rules,
+        'video_table': {
+            'fields': CLIENT_VIDEO_FIELDS,
+            'rows': [[v[k] for k in CLIENT_VIDEO_FIELDS] for v in videos],
+        },
+    }
+    _client_manifests[group_id] = (version, manifest, videos)
+    return manifest, videos
+
+def _full_manifest(version, group_id=None):
+    etag = str(version)
+    if _client_view():
+        # Only the videos this screen's group needs
+        manifest, videos = _client_manifest(version, group_id)
+        response = jsonify(dict(manifest, peers=_manifest_peers(videos)))
+    else:
+        state = database.get_state(group_id)
+        videos = _manifest_videos(database.get_all_videos())
+        now_playing, last_heartbeat = clients.summary()
+        # We provide a full list of videos so client can download them
+        # And the current logic (what to play)
+        response = jsonify({
+            'version': version,
+            **_manifest_state(state),
+            'now_playing': now_playing,
+            'last_heartbeat': str(last_heartbeat),
+            'playlist': database.get_playlist(group_id),
+            'schedule': _scope_rules(group_id),  # dayparting rules, see shared/schedule.py
+            'all_videos': videos,  # Metadata for all available videos
+            'peers': _manifest_peers(videos),
+        })
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/api/manifest', methods=['GET'])
 def get_manifest():
     """
     Called by clients to get the current state and list of required files.
+
+    Clients echo the version they already hold via If-None-Match (or
+    ?since=<version>) and get an empty 304 without any DB work until
+    something on the dashboard changes. The ETag is weak (W/"<version>"):
+    every view, group and encoding of one version shares it. Screens pass ?view=client for the
+    compact form, listing only the videos their group needs, and their
+    ?client_id= (or ?group_id=) to get their group's content.
     """
-    state = database.get_state()
-    videos = database.get_all_videos()
-    playlist = database.get_playlist()
-    
-    # We provide a full list of videos so client can download them
-    # And the current logic (what to play)
-    return jsonify({
-        'mode': state.get('mode', 'single'),
-        'current_single_id': state.get('current_video_id'),
-        'paused': state.get('paused', 'false') == 'true',
-        'restart_id': state.get('restart_id', '0'),
-        'now_playing': state.get('now_playing', 'Stopped'),
-        'last_heartbeat': state.get('last_heartbeat', '0'),
-        'playlist': playlist,
-        'all_videos': videos,  # Metadata for all available videos
-        'timestamp': os.stat(database.DB_PATH).st_mtime # Simple change detection
-    })
+    version = database.get_manifest_version()
+    etag = str(version)
+    if request.if_none_match.contains_weak(etag) or request.args.get('since') == etag:
+        return _not_modified(etag)
+    group_id = _request_group()
+    if group_id is not None and database.get_group(group_id) is None:
+        return jsonify({'error': 'Group not found'}), 404
+    return _full_manifest(version, group_id)
+
+@app.route('/api/manifest/delta', methods=['GET'])
+def get_manifest_delta():
+    """
+    Only what changed since the client's version: the manifest fields whose
+    state changed, changed video rows, ids of deleted videos and, if they
+    changed, the playlist as an ordered list of video ids and the schedule
+    rules. Answers 304 when nothing changed, and the full manifest (no
+    `delta` key) when the changelog no longer reaches back to `since`, the
+    screen changed groups or (client view) the set of videos it needs may
+    have changed.
+    """
+    version = database.get_manifest_version()
+    etag = str(version)
+    since = request.args.get('since', type=int)
+    if since == version:
+        return _not_modified(etag)
+    group_id = _request_group()
+    if group_id is not None and database.get_group(group_id) is None:
+        return jsonify({'error': 'Group not found'}), 404
+    changes = database.get_changes(since, version, group_id) if since is not None else None
+    if (changes is None or request.args.get('client_id') in changes['clients']
+            or _client_view() and (changes['playlist'] or changes['schedule']
+                                   or 'current_video_id' in changes['state'])):
+        return _full_manifest(version, group_id)
+
+    state = database.get_state(group_id)
+    videos = {v['id']: v for v in database.get_all_videos() if v['id'] in changes['videos']}
+    if _client_view():
+        needed = _scope_video_ids(state, database.get_playlist(group_id), _scope_rules(group_id))
+        videos = {video_id: v for video_id, v in videos.items() if video_id in needed}
+    changed = _manifest_videos(list(videos.values()))
+    delta = {
+        'version': version,
+        'delta': since,
+        **_manifest_state(state, changes['state']),
+        'videos': changed,
+        'deleted': sorted(changes['videos'] - {v['id'] for v in database.get_all_videos()}),
+        'peers': _manifest_peers(changed),
+    }
+    if changes['playlist']:
+        delta['playlist'] = [item['id'] for item in database.get_playlist(group_id)]
+    if changes['schedule']:
+        delta['schedule'] = _scope_rules(group_id)
+    response = jsonify(delta)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/events', methods=['GET'])
+def manifest_events():
+    """
+    Server-Sent Events stream for clients. Emits a `manifest` event carrying
+    the new version as soon as any change commits (state, playlist, rotation,
+    restart) and a keepalive comment while idle. Clients then fetch
+    /api/manifest once instead of polling it.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    last = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+
+    def stream():
+        nonlocal last
+        while True:
+            version = database.wait_for_manifest_version(last, EVENT_KEEPALIVE)
+            if version != last:
+                last = version
+                yield f'id: {version}\nevent: manifest\ndata: {version}\n\n'
+            else:
+                yield ': keepalive\n\n'
+
+    response = app.response_class(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 if __name__ == '__main__':
-     app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
+     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=False, use_reloader=False)
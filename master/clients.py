@@ -0,0 +1,150 @@
+"""
+In-memory registry of connected screens.
+
+Heartbeats from /api/status only update this registry; a background thread
+flushes changed entries to the `clients` table in batches so a fleet of
+screens costs one small transaction every FLUSH_INTERVAL seconds instead of
+two commits per heartbeat.
+"""
+import atexit
+import threading
+import time
+
+import database
+
+# seconds between batched writes; with several worker processes the table is
+# how workers see each other's heartbeats, so flush sooner
+FLUSH_INTERVAL = 2 if database.MULTIPROCESS else 10
+OFFLINE_AFTER = 10  # seconds without a heartbeat before a screen shows offline
+
+_lock = threading.Lock()
+_clients = {}
+_dirty = set()
+_flusher = None
+_announced = {}  # sha256 -> {client_id: (peer url, time)}, until heartbeats catch up
+
+
+def _load():
+    """Seeds the registry from the last flush so restarts keep the screen list."""
+    with _lock:
+        for row in database.get_clients():
+            _clients.setdefault(row['client_id'], row)
+
+
+def record_heartbeat(client_id, address, current_video='Stopped', position=None, player_state=None, sync=None):
+    with _lock:
+        _clients[client_id] = {
+            'client_id': client_id,
+            'address': address,
+            'last_seen': time.time(),
+            'current_video': current_video,
+            'position': position,
+            'player_state': player_state,
+            'sync': sync,
+        }
+        _dirty.add(client_id)
+
+
+def get_clients():
+    """Returns all known screens, most recently seen first, with an `online` flag."""
+    now = time.time()
+    with _lock:
+        merged = {cid: dict(c) for cid, c in _clients.items()}
+    if database.MULTIPROCESS:
+        # Heartbeats handled by other workers only reach us through the table
+        for row in database.get_clients():
+            mine = merged.get(row['client_id'])
+            if mine is None or (row['last_seen'] or 0) > (mine['last_seen'] or 0):
+                merged[row['client_id']] = row
+    clients = list(merged.values())
+    for c in clients:
+        c['online'] = now - (c['last_seen'] or 0) < OFFLINE_AFTER
+    clients.sort(key=lambda c: c['last_seen'] or 0, reverse=True)
+    return clients
+
+
+def announce(sha256, client_id, address, peer_port):
+    """
+    Lists a screen as a source for a video as soon as it starts downloading
+    it. Heartbeats report the same a few seconds later, which on a fast
+    network can be after the download is over.
+    """
+    with _lock:
+        _announced.setdefault(sha256, {})[client_id] = (f'http://{address}:{peer_port}', time.time())
+
+
+def peers(sha256s, exclude=None):
+    """
+    Maps each content hash to the peer URLs of online screens that can serve
+    it: ones holding the verified file, then ones part-way through
+    downloading it (they serve their verified prefix). Screens opt in by
+    reporting a `peer_port` in their sync status.
+    """
+    wanted = set(sha256s)
+    holders = {sha: [] for sha in wanted}
+    partial = {sha: [] for sha in wanted}
+    for c in get_clients():
+        sync = c.get('sync') or {}
+        if not c['online'] or not sync.get('peer_port') or c['client_id'] == exclude:
+            continue
+        url = f"http://{c['address']}:{sync['peer_port']}"
+        for sha in wanted.intersection(sync.get('have') or ()):
+            holders[sha].append(url)
+        for active in sync.get('active') or ():
+            if active.get('sha256') in wanted:
+                partial[active['sha256']].append(url)
+    now = time.time()
+    with _lock:
+        for sha in wanted.intersection(_announced):
+            recent = {cid: a for cid, a in _announced[sha].items() if now - a[1] < OFFLINE_AFTER}
+            if recent:
+                _announced[sha] = recent
+            else:
+                del _announced[sha]
+            for cid, (url, _) in recent.items():
+                if cid != exclude and url not in holders[sha] and url not in partial[sha]:
+                    partial[sha].append(url)
+    return {sha: holders[sha] + partial[sha] for sha in wanted}
+
+
+def summary():
+    """
+    Collapses the registry into the old single-screen view used by the
+    dashboard header: (now playing on the freshest screen, newest heartbeat).
+    """
+    clients = get_clients()
+    if not clients:
+        return 'Stopped', 0
+    return clients[0]['current_video'] or 'Stopped', int(clients[0]['last_seen'] or 0)
+
+
+def flush():
+    with _lock:
+        rows = [dict(_clients[cid]) for cid in _dirty]
+        _dirty.clear()
+    try:
+        database.save_clients(rows)
+    except Exception:
+        with _lock:
+            _dirty.update(r['client_id'] for r in rows)
+        raise
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            pass  # rows stay dirty and are retried next cycle
+
+
+def start():
+    """Loads persisted clients and starts the batch flusher (idempotent)."""
+    global _flusher
+    if _flusher is not None:
+        return
+    _load()
+    _flusher = threading.Thread(target=_flush_loop, daemon=True)
+    _flusher.start()
+    atexit.register(flush)
@@ -1,13 +1,149 @@
 import sqlite3
 import os
+import json
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
 
 DB_PATH = 'signage.db'
 
+# State keys that are published in the client manifest. Writing any of them
+# (or touching videos/playlist) bumps the manifest version; heartbeat and PIN
+# writes do not, so idle clients keep getting 304s.
+MANIFEST_STATE_KEYS = {'mode', 'current_video_id', 'paused', 'restart_id', 'wall_sync', 'sync_start'}
+
+# Screen groups (e.g. lobby, cafeteria) each have their own copy of these
+# state keys and their own playlist; screens in no group use the global
+# ones. restart_id and the PIN stay global.
+GROUP_STATE_DEFAULTS = {'mode': 'single', 'current_video_id': '', 'paused': 'false',
+                        'wall_sync': 'false', 'sync_start': ''}
+
+# Every version bump also records what it touched in `changelog`, so clients
+# can ask for just the changes since the version they hold. Older entries are
+# pruned; clients that far behind get the full manifest. Entries carry the
+# group they concern (0 for screens in no group, NULL for every screen) so
+# a screen's delta leaves out other groups' changes.
+CHANGELOG_KEEP = 1000  # versions
+
+# Reads of state/videos/playlist are served from an in-memory snapshot that
+# every writer in this module updates or invalidates. Set SIGNAGE_DB_CACHE=0
+# to always read through to SQLite (useful when benchmarking).
+CACHE_ENABLED = os.environ.get('SIGNAGE_DB_CACHE', '1') != '0'
+POOL_SIZE = 8
+
+# Set by wsgi.py when several worker processes share the database. Commits
+# from other processes can't update this process's snapshot or wake its event
+# streams, so each process watches SQLite's data_version and resyncs.
+MULTIPROCESS = os.environ.get('SIGNAGE_MULTIPROCESS', '0') == '1'
+WATCH_INTERVAL = 0.1  # seconds between data_version checks in the background
+
+# Library listing: sort keys the dashboard may ask for -> indexed column
+VIDEO_SORTS = {'added': 'id', 'name': 'filename COLLATE NOCASE', 'duration': 'duration', 'size': 'size'}
+_fts = False  # full-text filename search; LIKE where SQLite lacks FTS5
+
+_version_lock = threading.Lock()
+_version_changed = threading.Condition(_version_lock)
+_manifest_version = None
+
+# Writers hold _cache_lock across commit + snapshot update, so a reader never
+# sees a snapshot that is older than the published manifest version.
+_cache_lock = threading.Lock()
+_cache = {'state': None, 'videos': None, 'playlist': None, 'schedules': None, 'groups': None}
+_pool = queue.LifoQueue()
+_watch = None  # (path, connection) only used for PRAGMA data_version
+_data_version = None
+_synced_versions = None  # (manifest_version, snapshot_version) the snapshot reflects
+_watcher = None
+
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
+    """Opens a new tuned connection. Prefer _connection() which pools them."""
+    conn = sqlite3.connect(DB_PATH, timeout=5, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA cache_size=-8000')
     return conn
 
+@contextmanager
+def _connection():
+    """
+    Borrows a persistent connection from the pool. The dev server spawns a
+    thread per request, so connections are pooled rather than thread-bound.
+    """
+    try:
+        path, conn = _pool.get_nowait()
+        if path != DB_PATH:
+            conn.close()
+            raise queue.Empty
+    except queue.Empty:
+        path, conn = DB_PATH, get_db_connection()
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if _pool.qsize() < POOL_SIZE:
+            _pool.put((path, conn))
+        else:
+            conn.close()
+
+def _sync_external():
+    """
+    Multi-process mode: if another connection committed since the last
+    check and it changed cached data (the persisted manifest or snapshot
+    version moved), drops the snapshot and republishes the manifest
+    version. Commits that don't touch cached tables, such as the status
+    flushes every few seconds, leave the snapshot warm.
+    Callers must hold _cache_lock.
+    """
+    global _watch, _data_version, _synced_versions
+    if not MULTIPROCESS:
+        return
+    if _watch is None or _watch[0] != DB_PATH:
+        _watch = (DB_PATH, get_db_connection())
+    conn = _watch[1]
+    data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+    if data_version == _data_version:
+        return
+    _data_version = data_version
+    rows = conn.execute("SELECT key, value FROM state WHERE key IN ('manifest_version', 'snapshot_version')")
+    versions = {row['key']: int(row['value']) for row in rows}
+    versions = (versions.get('manifest_version', 0), versions.get('snapshot_version', 0))
+    if versions == _synced_versions:
+        return
+    _synced_versions = versions
+    _invalidate()
+    _publish_manifest_version(versions[0])
+
+def _watch_loop():
+    while True:
+        time.sleep(WATCH_INTERVAL)
+        try:
+            with _cache_lock:
+                _sync_external()
+        except sqlite3.Error:
+            pass  # retried next interval
+
+def _cached(name, loader):
+    with _cache_lock:
+        _sync_external()
+        value = _cache[name] if CACHE_ENABLED else None
+        if value is None:
+            with _connection() as conn:
+                value = loader(conn)
+            if CACHE_ENABLED:
+                _cache[name] = value
+        return value
+
+def _invalidate(*names):
+    """Drops snapshots; callers must hold _cache_lock."""
+    for name in names or _cache.keys():
+        _cache[name] = None
+
 def init_db():
     conn = get_db_connection()
     c = conn.cursor()
@@ -38,80 +174,870 @@ def init_db():
         )
     ''')
 
+    # Columns added after the first release
+    _ensure_columns(c, 'videos', {
+        'size': 'INTEGER',
+        'sha256': 'TEXT',
+        'blob': 'TEXT',  # content-addressed file name in the media store
+        # Pi-friendly transcode of the original, played instead when present
+        'rendition_blob': 'TEXT',
+        'rendition_size': 'INTEGER',
+        'rendition_sha256': 'TEXT',
+        # Probed from the original by the thumbnail worker
+        'duration': 'REAL',
+        'width': 'INTEGER',
+        'height': 'INTEGER',
+        'codec': 'TEXT',
+        'bitrate': 'INTEGER',
+        'thumbnail': 'TEXT',  # poster file name in the thumbnail cache
+        'sprite': 'TEXT',
+        'probed': 'REAL',  # when the worker last tried, even if it failed
+    })
+    c.execute('CREATE INDEX IF NOT EXISTS idx_videos_sha256 ON videos(sha256)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_videos_filename ON videos(filename COLLATE NOCASE)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_videos_duration ON videos(duration)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_videos_size ON videos(size)')
+    global _fts
+    _fts = _ensure_fts(c)
+
+    # One transcode job per video: queued, running, done, skipped or failed
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS transcode_jobs (
+            video_id INTEGER PRIMARY KEY,
+            status TEXT NOT NULL,
+            progress REAL DEFAULT 0,
+            error TEXT,
+            detail TEXT,
+            updated REAL
+        )
+    ''')
+
+    # Resumable chunked uploads in progress
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS uploads (
+            upload_id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            sha256 TEXT,
+            fingerprint TEXT,
+            created REAL
+        )
+    ''')
+    _ensure_columns(c, 'uploads', {
+        'fingerprint': 'TEXT',  # the client's identity for the file (name, size, mtime)
+    })
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS upload_chunks (
+            upload_id TEXT,
+            idx INTEGER,
+            PRIMARY KEY (upload_id, idx)
+        )
+    ''')
+
+    # Per-screen status, written in batches by the client registry
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS clients (
+            client_id TEXT PRIMARY KEY,
+            address TEXT,
+            last_seen REAL,
+            current_video TEXT,
+            position REAL,
+            player_state TEXT
+        )
+    ''')
+    _ensure_columns(c, 'clients', {
+        'sync': 'TEXT',  # JSON download progress reported by the agent
+    })
+
+    # Dayparting rules (see shared/schedule.py), each with its own playlist
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS schedules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            priority INTEGER DEFAULT 0,
+            mode TEXT NOT NULL,
+            video_id INTEGER,
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            days TEXT NOT NULL,
+            start_date TEXT,
+            end_date TEXT
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS schedule_items (
+            schedule_id INTEGER,
+            position INTEGER,
+            video_id INTEGER,
+            PRIMARY KEY (schedule_id, position)
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_schedule_items_video ON schedule_items(video_id)')
+    _ensure_columns(c, 'schedules', {
+        'group_id': 'INTEGER',  # NULL: applies to every screen
+    })
+
+    # Screen groups, each with its own state keys (GROUP_STATE_DEFAULTS),
+    # playlist and member screens
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS groups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS group_state (
+            group_id INTEGER,
+            key TEXT,
+            value TEXT,
+            PRIMARY KEY (group_id, key)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS group_playlist (
+            group_id INTEGER,
+            position INTEGER,
+            video_id INTEGER,
+            PRIMARY KEY (group_id, position)
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_group_playlist_video ON group_playlist(video_id)')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS client_groups (
+            client_id TEXT PRIMARY KEY,
+            group_id INTEGER NOT NULL
+        )
+    ''')
+
+    # What each manifest version changed: a state key, a video id, the
+    # playlist, the schedule or a screen's group. Values are read from the current tables when serving deltas.
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS changelog (
+            version INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            key TEXT
+        )
+    ''')
+    _ensure_columns(c, 'changelog', {
+        'group_id': 'INTEGER',  # see CHANGELOG_KEEP
+    })
+    c.execute('CREATE INDEX IF NOT EXISTS idx_changelog_version ON changelog(version)')
+
     # Insert default state if not exists
     c.execute("INSERT OR IGNORE INTO state (key, value) VALUES ('mode', 'single')")
     c.execute("INSERT OR IGNORE INTO state (key, value) VALUES ('current_video_id', '')")
     c.execute("INSERT OR IGNORE INTO state (key, value) VALUES ('paused', 'false')")
     c.execute("INSERT OR IGNORE INTO state (key, value) VALUES ('restart_id', '0')")
+    c.execute("INSERT OR IGNORE INTO state (key, value) VALUES ('wall_sync', 'false')")
+    c.execute("INSERT OR IGNORE INTO state (key, value) VALUES ('sync_start', '')")
     c.execute("INSERT OR IGNORE INTO state (key, value) VALUES ('now_playing', 'Stopped')")
     c.execute("INSERT OR IGNORE INTO state (key, value) VALUES ('last_heartbeat', '0')")
     c.execute("INSERT OR IGNORE INTO state (key, value) VALUES ('pin', '1234')")
+    c.execute("INSERT OR IGNORE INTO state (key, value) VALUES ('manifest_version', '0')")
+    c.execute("INSERT OR IGNORE INTO state (key, value) VALUES ('snapshot_version', '0')")
+    # Versions before the changelog existed (upgraded databases) have no entries
+    c.execute("""INSERT OR IGNORE INTO state (key, value)
+                 SELECT 'changelog_start', value FROM state WHERE key = 'manifest_version'""")
     
     conn.commit()
+    version = _read_manifest_version(conn)
     conn.close()
 
-def add_video(filename, rotation=0):
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('INSERT INTO videos (filename, rotation) VALUES (?, ?)', (filename, rotation))
-    videoid = c.lastrowid
-    conn.commit()
-    conn.close()
-    return videoid
+    global _manifest_version, _watcher
+    with _cache_lock:
+        _invalidate()
+        with _version_lock:
+            _manifest_version = version
+            _version_changed.notify_all()
 
-def get_all_videos():
-    conn = get_db_connection()
-    videos = conn.execute('SELECT * FROM videos').fetchall()
-    conn.close()
-    return [dict(v) for v in videos]
+    # Wakes this process's event streams when another worker commits
+    if MULTIPROCESS and _watcher is None:
+        _watcher = threading.Thread(target=_watch_loop, daemon=True)
+        _watcher.start()
 
-def delete_video(video_id):
-    conn = get_db_connection()
-    conn.execute('DELETE FROM videos WHERE id = ?', (video_id,))
-    # Also remove from playlist
-    conn.execute('DELETE FROM playlist WHERE video_id = ?', (video_id,))
-    conn.commit()
-    conn.close()
+def _ensure_fts(c):
+    """Filename search index over videos, kept in sync by triggers."""
+    try:
+        exists = c.execute("SELECT 1 FROM sqlite_master WHERE name = 'videos_fts'").fetchone()
+        c.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts
+                     USING fts5(filename, content='videos', content_rowid='id')""")
+    except sqlite3.OperationalError:
+        return False
+    c.execute("""CREATE TRIGGER IF NOT EXISTS videos_fts_insert AFTER INSERT ON videos BEGIN
+                     INSERT INTO videos_fts (rowid, filename) VALUES (new.id, new.filename);
+                 END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS videos_fts_delete AFTER DELETE ON videos BEGIN
+                     INSERT INTO videos_fts (videos_fts, rowid, filename) VALUES ('delete', old.id, old.filename);
+                 END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS videos_fts_update AFTER UPDATE OF filename ON videos BEGIN
+                     INSERT INTO videos_fts (videos_fts, rowid, filename) VALUES ('delete', old.id, old.filename);
+                     INSERT INTO videos_fts (rowid, filename) VALUES (new.id, new.filename);
+                 END""")
+    if not exists:
+        c.execute("INSERT INTO videos_fts (videos_fts) VALUES ('rebuild')")  # existing library
+    return True
 
-def update_video_rotation(video_id, rotation):
-    conn = get_db_connection()
-    conn.execute('UPDATE videos SET rotation = ? WHERE id = ?', (rotation, video_id))
-    conn.commit()
-    conn.close()
+def _ensure_columns(c, table, columns):
+    existing = {row[1] for row in c.execute(f'PRAGMA table_info({table})').fetchall()}
+    for name, decl in columns.items():
+        if name not in existing:
+            c.execute(f'ALTER TABLE {table} ADD COLUMN {name} {decl}')
 
-def get_state():
-    conn = get_db_connection()
-    rows = conn.execute('SELECT * FROM state').fetchall()
-    conn.close()
-    return {row['key']: row['value'] for row in rows}
+def _read_manifest_version(conn):
+    row = conn.execute("SELECT value FROM state WHERE key = 'manifest_version'").fetchone()
+    return int(row['value']) if row else 0
 
-def set_state(key, value):
-    conn = get_db_connection()
-    conn.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', (key, str(value)))
-    conn.commit()
-    conn.close()
+def _bump_manifest_version(conn, *changes):
+    """
+    Increments the persisted manifest version inside the caller's
+    transaction and logs `changes`, (kind, key) pairs for every screen or
+    (kind, key, group) for one group's (0: no group), against it.
+    """
+    conn.execute("UPDATE state SET value = CAST(value AS INTEGER) + 1 WHERE key = 'manifest_version'")
+    version = _read_manifest_version(conn)
+    conn.executemany('INSERT INTO changelog (version, kind, key, group_id) VALUES (?, ?, ?, ?)',
+                     [(version, kind, None if key is None else str(key), group[0] if group else None)
+                      for kind, key, *group in changes])
+    if version % 100 == 0:
+        conn.execute('DELETE FROM changelog WHERE version <= ?', (version - CHANGELOG_KEEP,))
+    return version
 
-def get_playlist():
-    conn = get_db_connection()
+def _bump_snapshot_version(conn):
+    """
+    For writes to cached tables that screens don't see (so no new manifest
+    version): tells other worker processes to drop their snapshots.
+    """
+    conn.execute("UPDATE state SET value = CAST(value AS INTEGER) + 1 WHERE key = 'snapshot_version'")
+
+def _publish_manifest_version(version):
+    global _manifest_version
+    with _version_lock:
+        if _manifest_version is None or version > _manifest_version:
+            _manifest_version = version
+            _version_changed.notify_all()
+
+def get_manifest_version():
+    """
+    Returns the monotonic manifest version. Served from memory so that
+    conditional manifest requests need no database work (bar one PRAGMA
+    when other worker processes may have committed).
+    """
+    if MULTIPROCESS:
+        with _cache_lock:
+            _sync_external()
+    if _manifest_version is None:
+        with _connection() as conn:
+            version = _read_manifest_version(conn)
+        _publish_manifest_version(version)
+    return _manifest_version
+
+def wait_for_manifest_version(since, timeout):
+    """
+    Blocks until the manifest version differs from `since` or `timeout`
+    seconds pass, and returns the current version. Used by the event stream
+    so clients hear about commits without polling.
+    """
+    current = get_manifest_version()
+    if since is None or current != since:
+        return current
+    with _version_changed:
+        _version_changed.wait_for(lambda: _manifest_version != since, timeout)
+        return _manifest_version
+
+def get_changes(since, version, group_id=None):
+    """
+    What changed after version `since` up to `version` for the screens of
+    group `group_id` (None: screens in no group): {'state': {keys},
+    'videos': {ids}, 'playlist': bool, 'schedule': bool, 'clients': {ids
+    whose group changed}}. Returns None when the log can't answer (since is
+    older than what is kept, or from another database).
+    """
+    if since > version:
+        return None
+    with _connection() as conn:
+        row = conn.execute("SELECT value FROM state WHERE key = 'changelog_start'").fetchone()
+        start = int(row['value']) if row else version
+        if since < max(start, version - CHANGELOG_KEEP):
+            return None
+        rows = conn.execute('''SELECT kind, key FROM changelog WHERE version > ? AND version <= ?
+                               AND (group_id IS NULL OR group_id = ?)''',
+                            (since, version, group_id or 0)).fetchall()
+    changes = {'state': set(), 'videos': set(), 'playlist': False, 'schedule': False, 'clients': set()}
+    for row in rows:
+        if row['kind'] == 'state':
+            changes['state'].add(row['key'])
+        elif row['kind'] == 'video':
+            changes['videos'].add(int(row['key']))
+        elif row['kind'] == 'playlist':
+            changes['playlist'] = True
+        elif row['kind'] == 'schedule':
+            changes['schedule'] = True
+        elif row['kind'] == 'client':
+            changes['clients'].add(row['key'])
+    return changes
+
+def _load_videos(conn):
+    return [dict(v) for v in conn.execute('SELECT * FROM videos').fetchall()]
+
+def _load_state(conn):
+    # manifest_version is internal; it is exposed through get_manifest_version()
+    rows = conn.execute("SELECT * FROM state WHERE key NOT IN "
+                        "('manifest_version', 'changelog_start', 'snapshot_version')").fetchall()
+    return {row['key']: row['value'] for row in rows}
+
+def _load_playlist(conn):
     # Join to get filenames
     query = '''
-        SELECT playlist.position, videos.id, videos.filename, videos.rotation
+        SELECT playlist.position, videos.id, videos.filename, videos.rotation, videos.duration
         FROM playlist
         JOIN videos ON playlist.video_id = videos.id
         ORDER BY playlist.position ASC
     '''
-    items = conn.execute(query).fetchall()
-    conn.close()
-    return [dict(i) for i in items]
+    return [dict(i) for i in conn.execute(query).fetchall()]
+
+def add_video(filename, rotation=0, size=None, sha256=None, blob=None):
+    with _cache_lock, _connection() as conn:
+        c = conn.cursor()
+        c.execute('INSERT INTO videos (filename, rotation, size, sha256, blob) VALUES (?, ?, ?, ?, ?)',
+                  (filename, rotation, size, sha256, blob))
+        videoid = c.lastrowid
+        version = _bump_manifest_version(conn, ('video', videoid))
+        conn.commit()
+        if _cache['videos'] is not None:
+            _cache['videos'].append({'id': videoid, 'filename': filename, 'rotation': rotation,
+                                     'size': size, 'sha256': sha256, 'blob': blob,
+                                     'rendition_blob': None, 'rendition_size': None,
+                                     'rendition_sha256': None, 'duration': None, 'width': None,
+                                     'height': None, 'codec': None, 'bitrate': None,
+                                     'thumbnail': None, 'sprite': None, 'probed': None})
+        _publish_manifest_version(version)
+    return videoid
+
+def get_all_videos():
+    return [dict(v) for v in _cached('videos', _load_videos)]
+
+def get_video(video_id):
+    """One video by id (primary key lookup), or None."""
+    with _connection() as conn:
+        row = conn.execute('SELECT * FROM videos WHERE id = ?', (video_id,)).fetchone()
+    return dict(row) if row else None
 
-def set_playlist(video_ids):
+def list_videos(offset=0, limit=50, sort='added', descending=True, search=None):
     """
-    Replaces the current playlist with a new ordered list of video IDs.
+    One page of the library and the total number of matches. `search`
+    matches filenames by word prefix ("sum vid" finds "Summer_Video.mp4").
     """
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('DELETE FROM playlist')
-    for idx, vid in enumerate(video_ids):
-        c.execute('INSERT INTO playlist (position, video_id) VALUES (?, ?)', (idx, vid))
-    conn.commit()
-    conn.close()
+    where, params = '', []
+    terms = re.findall(r'[^\W_]+', search or '')  # words, as the FTS tokenizer splits them
+    if terms and _fts:
+        where = 'WHERE id IN (SELECT rowid FROM videos_fts WHERE videos_fts MATCH ?)'
+        params.append(' '.join(f'"{t}"*' for t in terms))
+    elif terms:
+        where = 'WHERE ' + ' AND '.join(['filename LIKE ?'] * len(terms))
+        params += [f'%{t}%' for t in terms]
+    direction = 'DESC' if descending else 'ASC'
+    with _connection() as conn:
+        total = conn.execute(f'SELECT COUNT(*) FROM videos {where}', params).fetchone()[0]
+        rows = conn.execute(f'SELECT * FROM videos {where} ORDER BY {VIDEO_SORTS[sort]} {direction}, id {direction} '
+                            'LIMIT ? OFFSET ?', params + [limit, offset]).fetchall()
+    return [dict(r) for r in rows], total
+
+def get_video_by_sha256(sha256):
+    for v in _cached('videos', _load_videos):
+        if v['sha256'] == sha256:
+            return dict(v)
+    return None
+
+def delete_video(video_id):
+    with _cache_lock, _connection() as conn:
+        conn.execute('DELETE FROM videos WHERE id = ?', (video_id,))
+        # Also remove from the playlists
+        conn.execute('DELETE FROM playlist WHERE video_id = ?', (video_id,))
+        changes = [('video', video_id), ('playlist', None, 0)]
+        rows = conn.execute('SELECT DISTINCT group_id FROM group_playlist WHERE video_id = ?', (video_id,)).fetchall()
+        conn.execute('DELETE FROM group_playlist WHERE video_id = ?', (video_id,))
+        changes += [('playlist', None, row['group_id']) for row in rows]
+        if conn.execute('DELETE FROM schedule_items WHERE video_id = ?', (video_id,)).rowcount:
+            changes.append(('schedule', None))
+        version = _bump_manifest_version(conn, *changes)
+        conn.commit()
+        _invalidate('videos', 'playlist', 'schedules', 'groups')
+        _publish_manifest_version(version)
+
+def update_video_rotation(video_id, rotation):
+    with _cache_lock, _connection() as conn:
+        conn.execute('UPDATE videos SET rotation = ? WHERE id = ?', (rotation, video_id))
+        version = _bump_manifest_version(conn, ('video', video_id))
+        conn.commit()
+        _invalidate('videos', 'playlist')
+        _publish_manifest_version(version)
+
+def update_video_media(video_id, size, sha256, blob):
+    with _cache_lock, _connection() as conn:
+        conn.execute('UPDATE videos SET size = ?, sha256 = ?, blob = ? WHERE id = ?',
+                     (size, sha256, blob, video_id))
+        version = _bump_manifest_version(conn, ('video', video_id))
+        conn.commit()
+        _invalidate('videos')
+        _publish_manifest_version(version)
+
+def set_video_rendition(video_id, size, sha256, blob):
+    """Publishes a transcode; returns False if the video was deleted meanwhile."""
+    with _cache_lock, _connection() as conn:
+        cur = conn.execute('UPDATE videos SET rendition_size = ?, rendition_sha256 = ?, rendition_blob = ? WHERE id = ?',
+                           (size, sha256, blob, video_id))
+        if not cur.rowcount:
+            conn.rollback()
+            return False
+        version = _bump_manifest_version(conn, ('video', video_id))
+        conn.commit()
+        _invalidate('videos')
+        _publish_manifest_version(version)
+    return True
+
+def set_video_metadata(video_id, **fields):
+    """
+    Stores probed metadata/thumbnail names. Of these screens only use the
+    duration (video walls), so only that bumps the manifest version.
+    """
+    with _cache_lock, _connection() as conn:
+        conn.execute(f"UPDATE videos SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",
+                     (*fields.values(), video_id))
+        version = _bump_manifest_version(conn, ('video', video_id)) if fields.get('duration') else None
+        if version is None:
+            _bump_snapshot_version(conn)
+        conn.commit()
+        _invalidate('videos', 'playlist')
+        if version is not None:
+            _publish_manifest_version(version)
+
+def count_videos_with_blob(blob):
+    return sum(1 for v in _cached('videos', _load_videos) if blob in (v['blob'], v['rendition_blob']))
+
+def get_state(group_id=None):
+    """The global state, or as a group's screens see it (with the group's own keys)."""
+    state = dict(_cached('state', _load_state))
+    if group_id is not None:
+        group = _cached('groups', _load_groups)['groups'].get(group_id)
+        state.update(GROUP_STATE_DEFAULTS)
+        state.update(group['state'] if group else {})
+    return state
+
+def _edit_playlist(video_ids, ops):
+    """
+    Applies incremental edits to a list of video ids:
+    {'op': 'insert', 'video_id', 'position' (default: end)},
+    {'op': 'remove', 'position'} and {'op': 'move', 'from', 'to'}.
+    """
+    ids = list(video_ids)
+    for op in ops:
+        kind = op.get('op')
+        try:
+            if kind == 'insert':
+                position = op.get('position', len(ids))
+                if not 0 <= position <= len(ids):
+                    raise IndexError
+                ids.insert(position, int(op['video_id']))
+            elif kind == 'remove':
+                if not 0 <= op['position'] < len(ids):
+                    raise IndexError
+                del ids[op['position']]
+            elif kind == 'move':
+                if not (0 <= op['from'] < len(ids) and 0 <= op['to'] < len(ids)):
+                    raise IndexError
+                ids.insert(op['to'], ids.pop(op['from']))
+            else:
+                raise ValueError(f'Unknown playlist op {kind!r}')
+        except (IndexError, KeyError, TypeError):
+            raise ValueError(f'Invalid playlist op {op!r}')
+    return ids
+
+def apply_changes(state=None, playlist=None, playlist_ops=None, group_id=None):
+    """
+    Writes state keys, a new playlist (ordered video ids) and/or incremental
+    playlist edits in one transaction: readers see all of it or none of it,
+    and clients get a single new manifest version. With `group_id` the
+    playlist and the GROUP_STATE_DEFAULTS keys are that group's. Raises
+    ValueError for an invalid playlist op or an unknown group, before
+    anything is written.
+    """
+    state = {key: str(value) for key, value in (state or {}).items()}
+    group_state = {k: v for k, v in state.items() if group_id is not None and k in GROUP_STATE_DEFAULTS}
+    global_state = {k: v for k, v in state.items() if k not in group_state}
+    # restart_id restarts every screen; the rest only concerns one group
+    changes = [('state', key) if key == 'restart_id' else ('state', key, group_id or 0)
+               for key in state if key in MANIFEST_STATE_KEYS]
+    with _cache_lock, _connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')  # playlist edits read then write
+        if group_id is not None and not conn.execute('SELECT 1 FROM groups WHERE id = ?', (group_id,)).fetchone():
+            raise ValueError(f'Unknown group {group_id}')
+        if playlist is not None or playlist_ops:
+            if playlist is None:
+                playlist = _read_playlist(conn, group_id)
+            playlist = _edit_playlist(playlist, playlist_ops or ())
+            if group_id is None:
+                conn.execute('DELETE FROM playlist')
+                conn.executemany('INSERT INTO playlist (position, video_id) VALUES (?, ?)', enumerate(playlist))
+            else:
+                conn.execute('DELETE FROM group_playlist WHERE group_id = ?', (group_id,))
+                conn.executemany('INSERT INTO group_playlist (group_id, position, video_id) VALUES (?, ?, ?)',
+                                 [(group_id, position, video_id) for position, video_id in enumerate(playlist)])
+            changes.append(('playlist', None, group_id or 0))
+        conn.executemany('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', global_state.items())
+        conn.executemany('INSERT OR REPLACE INTO group_state (group_id, key, value) VALUES (?, ?, ?)',
+                         [(group_id, key, value) for key, value in group_state.items()])
+        version = _bump_manifest_version(conn, *changes) if changes else None
+        if version is None:
+            _bump_snapshot_version(conn)  # e.g. the PIN
+        conn.commit()
+        if _cache['state'] is not None:
+            _cache['state'].update(global_state)
+        if playlist is not None and group_id is None:
+            _invalidate('playlist')
+        if group_id is not None:
+            _invalidate('groups')
+        if version is not None:
+            _publish_manifest_version(version)
+    return get_manifest_version()
+
+def _read_playlist(conn, group_id=None):
+    if group_id is None:
+        rows = conn.execute('SELECT video_id FROM playlist ORDER BY position').fetchall()
+    else:
+        rows = conn.execute('SELECT video_id FROM group_playlist WHERE group_id = ? ORDER BY position',
+                            (group_id,)).fetchall()
+    return [row['video_id'] for row in rows]
+
+def set_states(values):
+    """Writes several state keys atomically, as one manifest version."""
+    return apply_changes(state=values)
+
+def set_state(key, value):
+    return apply_changes(state={key: value})
+
+def get_playlist(group_id=None):
+    """The global playlist or a group's, as rows with each video's id, filename, rotation and duration."""
+    if group_id is None:
+        return [dict(i) for i in _cached('playlist', _load_playlist)]
+    group = _cached('groups', _load_groups)['groups'].get(group_id)
+    videos = {v['id']: v for v in _cached('videos', _load_videos)}
+    playlist = []
+    for position, video_id in enumerate(group['playlist'] if group else ()):
+        v = videos.get(video_id)
+        if v is not None:
+            playlist.append({'position': position, 'id': v['id'], 'filename': v['filename'],
+                             'rotation': v['rotation'], 'duration': v['duration']})
+    return playlist
+
+def set_playlist(video_ids, group_id=None):
+    """
+    Replaces the current playlist (or a group's) with a new ordered list of video IDs.
+    """
+    return apply_changes(playlist=video_ids, group_id=group_id)
+
+def edit_playlist(ops, group_id=None):
+    """Applies incremental playlist edits (see _edit_playlist) atomically."""
+    return apply_changes(playlist_ops=ops, group_id=group_id)
+
+def _load_groups(conn):
+    groups = {row['id']: {'id': row['id'], 'name': row['name'], 'state': {}, 'playlist': [], 'clients': []}
+              for row in conn.execute('SELECT * FROM groups ORDER BY id').fetchall()}
+    for row in conn.execute('SELECT * FROM group_state').fetchall():
+        if row['group_id'] in groups:
+            groups[row['group_id']]['state'][row['key']] = row['value']
+    for row in conn.execute('SELECT group_id, video_id FROM group_playlist ORDER BY group_id, position').fetchall():
+        if row['group_id'] in groups:
+            groups[row['group_id']]['playlist'].append(row['video_id'])
+    members = {}
+    for row in conn.execute('SELECT client_id, group_id FROM client_groups ORDER BY client_id').fetchall():
+        if row['group_id'] in groups:
+            groups[row['group_id']]['clients'].append(row['client_id'])
+            members[row['client_id']] = row['group_id']
+    return {'groups': groups, 'members': members}
+
+def _copy_group(group):
+    return dict(group, state=dict(group['state']), playlist=list(group['playlist']), clients=list(group['clients']))
+
+def get_groups():
+    """All screen groups: id, name, state, playlist (video ids) and clients (member ids)."""
+    return [_copy_group(g) for g in _cached('groups', _load_groups)['groups'].values()]
+
+def get_group(group_id):
+    group = _cached('groups', _load_groups)['groups'].get(group_id)
+    return _copy_group(group) if group else None
+
+def get_client_group(client_id):
+    """The id of the group a screen is in, or None."""
+    return _cached('groups', _load_groups)['members'].get(client_id)
+
+def add_group(name):
+    """Creates a group with the default state and an empty playlist. Raises ValueError if the name is taken."""
+    with _cache_lock, _connection() as conn:
+        try:
+            group_id = conn.execute('INSERT INTO groups (name) VALUES (?)', (name,)).lastrowid
+        except sqlite3.IntegrityError:
+            raise ValueError(f'A group named {name!r} already exists')
+        conn.executemany('INSERT INTO group_state (group_id, key, value) VALUES (?, ?, ?)',
+                         [(group_id, key, value) for key, value in GROUP_STATE_DEFAULTS.items()])
+        _bump_snapshot_version(conn)  # no screen is in it yet, so no new manifest version
+        conn.commit()
+        _invalidate('groups')
+    return group_id
+
+def delete_group(group_id):
+    """
+    Deletes a group with its playlist and schedule rules; its screens go
+    back to the global settings. Returns False if there is no such group.
+    """
+    with _cache_lock, _connection() as conn:
+        if not conn.execute('DELETE FROM groups WHERE id = ?', (group_id,)).rowcount:
+            conn.rollback()
+            return False
+        rows = conn.execute('SELECT client_id FROM client_groups WHERE group_id = ?', (group_id,)).fetchall()
+        changes = [('client', row['client_id']) for row in rows]
+        conn.execute('DELETE FROM client_groups WHERE group_id = ?', (group_id,))
+        conn.execute('DELETE FROM group_state WHERE group_id = ?', (group_id,))
+        conn.execute('DELETE FROM group_playlist WHERE group_id = ?', (group_id,))
+        conn.execute('DELETE FROM schedule_items WHERE schedule_id IN (SELECT id FROM schedules WHERE group_id = ?)',
+                     (group_id,))
+        if conn.execute('DELETE FROM schedules WHERE group_id = ?', (group_id,)).rowcount:
+            changes.append(('schedule', None))
+        version = _bump_manifest_version(conn, *changes) if changes else None
+        if version is None:
+            _bump_snapshot_version(conn)
+        conn.commit()
+        _invalidate('groups', 'schedules')
+        if version is not None:
+            _publish_manifest_version(version)
+    return True
+
+def set_client_group(client_id, group_id):
+    """Moves a screen into a group (None: into no group). Returns False for an unknown group."""
+    with _cache_lock, _connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        if group_id is not None and not conn.execute('SELECT 1 FROM groups WHERE id = ?', (group_id,)).fetchone():
+            conn.rollback()
+            return False
+        if group_id is None:
+            conn.execute('DELETE FROM client_groups WHERE client_id = ?', (client_id,))
+        else:
+            conn.execute('INSERT OR REPLACE INTO client_groups (client_id, group_id) VALUES (?, ?)',
+                         (client_id, group_id))
+        version = _bump_manifest_version(conn, ('client', client_id))
+        conn.commit()
+        _invalidate('groups')
+        _publish_manifest_version(version)
+    return True
+
+def _load_schedules(conn):
+    rules = [dict(r) for r in conn.execute('SELECT * FROM schedules ORDER BY id').fetchall()]
+    items = conn.execute('SELECT schedule_id, video_id FROM schedule_items ORDER BY schedule_id, position').fetchall()
+    playlists = {}
+    for item in items:
+        playlists.setdefault(item['schedule_id'], []).append(item['video_id'])
+    for rule in rules:
+        rule['days'] = [int(d) for d in rule['days']]
+        rule['playlist'] = playlists.get(rule['id'], [])
+    return rules
+
+def get_schedules():
+    """
+    All dayparting rules, each with `days` and `playlist` as lists and the
+    `group_id` whose screens it applies to (None: every screen).
+    """
+    return [dict(r, days=list(r['days']), playlist=list(r['playlist']))
+            for r in _cached('schedules', _load_schedules)]
+
+def _write_schedule(conn, rule_id, rule):
+    cur = conn.execute('''
+        INSERT OR REPLACE INTO schedules (id, name, priority, mode, video_id, start_time, end_time, days, start_date,
+                                          end_date, group_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (rule_id, rule['name'], rule['priority'], rule['mode'], rule['video_id'], rule['start_time'],
+          rule['end_time'], ''.join(str(d) for d in rule['days']), rule['start_date'], rule['end_date'],
+          rule.get('group_id')))
+    rule_id = cur.lastrowid if rule_id is None else rule_id
+    conn.execute('DELETE FROM schedule_items WHERE schedule_id = ?', (rule_id,))
+    conn.executemany('INSERT INTO schedule_items (schedule_id, position, video_id) VALUES (?, ?, ?)',
+                     [(rule_id, position, video_id) for position, video_id in enumerate(rule['playlist'])])
+    return rule_id
+
+def save_schedule(rule, rule_id=None):
+    """
+    Adds a rule (normalized by shared.schedule.normalize_rule, plus an
+    optional `group_id`), or replaces rule `rule_id`. Returns its id, or
+    None if `rule_id` doesn't exist.
+    """
+    with _cache_lock, _connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        if rule_id is not None and not conn.execute('SELECT 1 FROM schedules WHERE id = ?', (rule_id,)).fetchone():
+            conn.rollback()
+            return None
+        rule_id = _write_schedule(conn, rule_id, rule)
+        version = _bump_manifest_version(conn, ('schedule', None))
+        conn.commit()
+        _invalidate('schedules')
+        _publish_manifest_version(version)
+    return rule_id
+
+def delete_schedule(rule_id):
+    """Returns False if there is no such rule."""
+    with _cache_lock, _connection() as conn:
+        if not conn.execute('DELETE FROM schedules WHERE id = ?', (rule_id,)).rowcount:
+            conn.rollback()
+            return False
+        conn.execute('DELETE FROM schedule_items WHERE schedule_id = ?', (rule_id,))
+        version = _bump_manifest_version(conn, ('schedule', None))
+        conn.commit()
+        _invalidate('schedules')
+        _publish_manifest_version(version)
+    return True
+
+def get_clients():
+    with _connection() as conn:
+        rows = conn.execute('SELECT * FROM clients ORDER BY client_id').fetchall()
+    clients = [dict(r) for r in rows]
+    for c in clients:
+        c['sync'] = json.loads(c['sync']) if c['sync'] else None
+    return clients
+
+def save_clients(clients):
+    """
+    Upserts a batch of client status rows in one transaction. Heartbeats are
+    not part of the manifest, so this neither touches the cache nor bumps
+    the manifest version. A row only replaces an older heartbeat, since
+    worker processes flush independently.
+    """
+    if not clients:
+        return
+    rows = [dict(c, sync=json.dumps(c['sync']) if c.get('sync') else None) for c in clients]
+    with _connection() as conn:
+        conn.executemany('''
+            INSERT INTO clients (client_id, address, last_seen, current_video, position, player_state, sync)
+            VALUES (:client_id, :address, :last_seen, :current_video, :position, :player_state, :sync)
+            ON CONFLICT(client_id) DO UPDATE SET
+                address = excluded.address, last_seen = excluded.last_seen,
+                current_video = excluded.current_video, position = excluded.position,
+                player_state = excluded.player_state, sync = excluded.sync
+            WHERE excluded.last_seen >= clients.last_seen
+        ''', rows)
+        conn.commit()
+
+def create_transcode_job(video_id):
+    with _connection() as conn:
+        conn.execute('INSERT OR REPLACE INTO transcode_jobs (video_id, status, progress, updated) VALUES (?, ?, 0, ?)',
+                     (video_id, 'queued', time.time()))
+        conn.commit()
+
+def claim_transcode_job(limit, stale_after):
+    """
+    Moves the oldest queued job to running and returns its video id, unless
+    `limit` jobs are already running (in any worker process; ones silent
+    for `stale_after` seconds don't count). None if there is nothing to do.
+    """
+    now = time.time()
+    with _connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')  # count and claim as one step across processes
+        running = conn.execute("SELECT COUNT(*) FROM transcode_jobs WHERE status = 'running' AND updated >= ?",
+                               (now - stale_after,)).fetchone()[0]
+        row = None
+        if running < limit:
+            row = conn.execute("SELECT video_id FROM transcode_jobs WHERE status = 'queued' "
+                               "ORDER BY updated, video_id LIMIT 1").fetchone()
+        if row:
+            conn.execute("UPDATE transcode_jobs SET status = 'running', updated = ? WHERE video_id = ?",
+                         (now, row['video_id']))
+        conn.commit()
+    return row['video_id'] if row else None
+
+def update_transcode_job(video_id, **fields):
+    """Sets any of status, progress, error and detail (JSON-encoded)."""
+    if 'detail' in fields:
+        fields['detail'] = json.dumps(fields['detail'])
+    fields['updated'] = time.time()
+    with _connection() as conn:
+        conn.execute(f"UPDATE transcode_jobs SET {', '.join(f'{k} = ?' for k in fields)} WHERE video_id = ?",
+                     (*fields.values(), video_id))
+        conn.commit()
+
+def _transcode_job(row):
+    job = dict(row)
+    job['detail'] = json.loads(job['detail']) if job['detail'] else None
+    return job
+
+def get_transcode_jobs():
+    with _connection() as conn:
+        rows = conn.execute('SELECT * FROM transcode_jobs ORDER BY updated DESC').fetchall()
+    return [_transcode_job(r) for r in rows]
+
+def get_transcode_job(video_id):
+    with _connection() as conn:
+        row = conn.execute('SELECT * FROM transcode_jobs WHERE video_id = ?', (video_id,)).fetchone()
+    return _transcode_job(row) if row else None
+
+def requeue_transcode_jobs(stale_after):
+    """
+    Requeues running jobs that stopped reporting progress (their process
+    died) and returns the ids of all queued jobs.
+    """
+    with _connection() as conn:
+        conn.execute("UPDATE transcode_jobs SET status = 'queued', progress = 0 WHERE status = 'running' AND updated < ?",
+                     (time.time() - stale_after,))
+        conn.commit()
+        rows = conn.execute("SELECT video_id FROM transcode_jobs WHERE status = 'queued'").fetchall()
+    return [r['video_id'] for r in rows]
+
+def delete_transcode_job(video_id):
+    with _connection() as conn:
+        conn.execute('DELETE FROM transcode_jobs WHERE video_id = ?', (video_id,))
+        conn.commit()
+
+def create_upload(upload_id, filename, size, chunk_size, sha256=None, fingerprint=None):
+    with _connection() as conn:
+        conn.execute('''
+            INSERT INTO uploads (upload_id, filename, size, chunk_size, sha256, fingerprint, created)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (upload_id, filename, size, chunk_size, sha256, fingerprint, time.time()))
+        conn.commit()
+
+def get_upload(upload_id):
+    with _connection() as conn:
+        row = conn.execute('SELECT * FROM uploads WHERE upload_id = ?', (upload_id,)).fetchone()
+    return dict(row) if row else None
+
+def find_upload(filename, size, sha256=None, fingerprint=None):
+    """
+    Returns the newest unfinished upload of this file, so a dropped upload
+    can resume. Name and size alone don't identify a file, so the hash or
+    the client's fingerprint has to match as well.
+    """
+    if not sha256 and not fingerprint:
+        return None
+    with _connection() as conn:
+        row = conn.execute('''
+            SELECT * FROM uploads WHERE filename = ? AND size = ? AND sha256 IS ? AND fingerprint IS ?
+            ORDER BY created DESC LIMIT 1
+        ''', (filename, size, sha256, fingerprint)).fetchone()
+    return dict(row) if row else None
+
+def get_stale_uploads(older_than):
+    with _connection() as conn:
+        rows = conn.execute('SELECT * FROM uploads WHERE created < ?', (older_than,)).fetchall()
+    return [dict(r) for r in rows]
+
+def mark_upload_chunk(upload_id, idx):
+    with _connection() as conn:
+        conn.execute('INSERT OR IGNORE INTO upload_chunks (upload_id, idx) VALUES (?, ?)', (upload_id, idx))
+        conn.commit()
+
+def get_upload_chunks(upload_id):
+    with _connection() as conn:
+        rows = conn.execute('SELECT idx FROM upload_chunks WHERE upload_id = ? ORDER BY idx', (upload_id,)).fetchall()
+    return [r['idx'] for r in rows]
+
+def delete_upload(upload_id):
+    with _connection() as conn:
+        conn.execute('DELETE FROM upload_chunks WHERE upload_id = ?', (upload_id,))
+        conn.execute('DELETE FROM uploads WHERE upload_id = ?', (upload_id,))
+        conn.commit()
@@ -0,0 +1,126 @@
+"""
+Content-addressed media store.
+
+Uploaded videos are stored in UPLOAD_FOLDER as `<sha256><ext>` blobs; the
+`videos` table keeps the display filename plus size, hash and blob name.
+Re-uploading different content under the same name therefore yields a new
+blob (and clients refetch it) instead of silently overwriting the old file,
+and identical content is stored once.
+"""
+import hashlib
+import json
+import os
+import threading
+
+import database
+
+HASH_READ_SIZE = 1024 * 1024
+# Clients fetching from peers verify each piece against these hashes
+PIECE_SIZE = int(os.environ.get('MEDIA_PIECE_SIZE', 4 * 1024 * 1024))
+PIECES_DIR = '.pieces'  # sidecar piece-hash files, next to the blobs
+
+_pieces_lock = threading.Lock()
+
+
+def blob_name(sha256, filename):
+    return sha256 + os.path.splitext(filename)[1].lower()
+
+
+def blob_url(blob):
+    return f'/media/{blob}'
+
+
+def hash_file(path):
+    """Returns (size, sha256) of a file on disk."""
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(HASH_READ_SIZE)
+            if not data:
+                break
+            hasher.update(data)
+            size += len(data)
+    return size, hasher.hexdigest()
+
+
+def store(upload_folder, src_path, sha256, filename):
+    """
+    Moves a verified file into the store under its content address and
+    returns the blob name. If the blob already exists the source is dropped.
+    """
+    blob = blob_name(sha256, filename)
+    dest = os.path.join(upload_folder, blob)
+    if os.path.exists(dest):
+        os.remove(src_path)
+    else:
+        os.replace(src_path, dest)
+    return blob
+
+
+def release(upload_folder, blob):
+    """Deletes a blob once no video row references it any more."""
+    if not blob or database.count_videos_with_blob(blob):
+        return
+    for path in (os.path.join(upload_folder, blob), _pieces_path(upload_folder, blob)):
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # File might be gone already
+
+
+def _pieces_path(upload_folder, blob):
+    return os.path.join(upload_folder, PIECES_DIR, blob + '.json')
+
+
+def _read_pieces(path):
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return cached if cached.get('piece_size') == PIECE_SIZE else None
+
+
+def piece_hashes(upload_folder, blob):
+    """
+    Returns {'piece_size', 'pieces': [sha256 per piece]} for a blob. Computed
+    on first request (one read of the file) and kept in a sidecar file.
+    """
+    path = _pieces_path(upload_folder, blob)
+    cached = _read_pieces(path)
+    if cached:
+        return cached
+    with _pieces_lock:
+        cached = _read_pieces(path)  # computed while we waited
+        if cached:
+            return cached
+        pieces = []
+        with open(os.path.join(upload_folder, blob), 'rb') as f:
+            for piece in iter(lambda: f.read(PIECE_SIZE), b''):
+                pieces.append(hashlib.sha256(piece).hexdigest())
+        result = {'piece_size': PIECE_SIZE, 'pieces': pieces}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'  # other worker processes may race us
+        with open(tmp, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp, path)
+        return result
+
+
+def migrate_legacy_files(upload_folder):
+    """
+    Moves videos stored by filename (before the content-addressed store)
+    to their blob names and records their size and hash.
+    """
+    moved = {}  # old uploads could add the same filename twice
+    for video in database.get_all_videos():
+        if video.get('blob'):
+            continue
+        if video['filename'] not in moved:
+            path = os.path.join(upload_folder, video['filename'])
+            if not os.path.exists(path):
+                continue
+            size, sha256 = hash_file(path)
+            moved[video['filename']] = (size, sha256, store(upload_folder, path, sha256, video['filename']))
+        database.update_video_media(video['id'], *moved[video['filename']])
@@ -0,0 +1,126 @@
+"""
+Media metadata and dashboard thumbnails.
+
+After an upload a background worker probes the original (duration,
+resolution, codec, bitrate) into the videos table and renders a poster
+frame and a sprite sheet of SPRITE_COLUMNS x SPRITE_ROWS frames into
+THUMBS_DIR next to the media store. Files are named by content hash, so
+they are served with immutable cache headers and the dashboard only ever
+downloads them once. Videos without metadata (uploaded before this existed)
+are picked up at start.
+"""
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import transcode
+
+THUMBS_DIR = '.thumbs'
+POSTER_WIDTH = 480
+SPRITE_COLUMNS, SPRITE_ROWS = 5, 2
+SPRITE_TILE = (160, 90)  # letterboxed, so every tile has the same size
+POSTER_AT = 0.1  # fraction of the way in, past black intros
+
+_pool = None
+_pool_lock = threading.Lock()
+_upload_folder = None
+_enabled = False
+
+
+def thumbs_path(upload_folder):
+    return os.path.join(upload_folder, THUMBS_DIR)
+
+
+def _ffmpeg(args):
+    subprocess.run(transcode.FFMPEG + ['-nostdin', '-y', '-v', 'error'] + args,
+                   capture_output=True, timeout=300, check=True)
+
+
+def _render(src, sha256, duration):
+    """Writes the poster (and sprite, if the duration is known); returns their names."""
+    folder = thumbs_path(_upload_folder)
+    os.makedirs(folder, exist_ok=True)
+    poster, sprite = f'{sha256}.jpg', f'{sha256}-sprite.jpg'
+
+    seek = ['-ss', f'{duration * POSTER_AT:.2f}'] if duration else []
+    tmp = os.path.join(folder, f'.{poster}.{os.getpid()}.tmp.jpg')
+    _ffmpeg(seek + ['-i', src, '-frames:v', '1', '-vf', f'scale={POSTER_WIDTH}:-2', '-q:v', '4', tmp])
+    os.replace(tmp, os.path.join(folder, poster))
+    if not duration:
+        return poster, None
+
+    width, height = SPRITE_TILE
+    frames = SPRITE_COLUMNS * SPRITE_ROWS
+    tmp = os.path.join(folder, f'.{sprite}.{os.getpid()}.tmp.jpg')
+    # Keyframes only: no full decode of long videos
+    _ffmpeg(['-skip_frame', 'nokey', '-i', src, '-vf',
+             f'fps={frames / duration:.6f},'
+             f'scale={width}:{height}:force_original_aspect_ratio=decrease,'
+             f'pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,'
+             f'tile={SPRITE_COLUMNS}x{SPRITE_ROWS}',
+             '-frames:v', '1', '-q:v', '5', tmp])
+    os.replace(tmp, os.path.join(folder, sprite))
+    return poster, sprite
+
+
+def _process(video_id):
+    video = database.get_video(video_id)
+    if video is None or not video['blob']:
+        return
+    src = os.path.join(_upload_folder, video['blob'])
+    fields = {'probed': time.time()}
+    try:
+        info = transcode.probe(src)
+        fields.update({k: info[k] for k in ('duration', 'width', 'height', 'codec', 'bitrate')})
+        folder = thumbs_path(_upload_folder)
+        poster, sprite = f"{video['sha256']}.jpg", f"{video['sha256']}-sprite.jpg"
+        if not os.path.exists(os.path.join(folder, poster)):  # duplicates share thumbnails
+            poster, sprite = _render(src, video['sha256'], info['duration'])
+        elif not os.path.exists(os.path.join(folder, sprite)):
+            sprite = None
+        fields.update(thumbnail=poster, sprite=sprite)
+    except Exception as e:
+        logging.warning(f"No metadata/thumbnail for {video['filename']}: {e}")
+    database.set_video_metadata(video_id, **fields)
+
+
+def release(upload_folder, sha256):
+    """Deletes a video's thumbnails once no video has that content any more."""
+    if not sha256 or database.get_video_by_sha256(sha256):
+        return
+    for name in (f'{sha256}.jpg', f'{sha256}-sprite.jpg'):
+        try:
+            os.remove(os.path.join(thumbs_path(upload_folder), name))
+        except OSError:
+            pass
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnails')
+        return _pool
+
+
+def submit(video_id):
+    if _enabled:
+        _executor().submit(_process, video_id)
+
+
+def start(upload_folder):
+    """Enables the worker if ffprobe is installed and backfills older videos."""
+    global _upload_folder, _enabled
+    _upload_folder = upload_folder
+    if shutil.which(transcode.FFPROBE[0]) is None:
+        logging.info(f"{transcode.FFPROBE[0]} not found; no thumbnails or durations")
+        return
+    _enabled = True
+    for video in database.get_all_videos():
+        if video['probed'] is None:
+            submit(video['id'])
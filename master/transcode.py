@@ -0,0 +1,217 @@
+"""
+Transcodes uploads the Pis can't hardware-decode.
+
+The player decodes H.264/HEVC in hardware (v4l2m2m) at up to 1920x1080 and
+8-bit 4:2:0; anything else (VP9, ProRes, 4K, 10-bit...) falls back to
+software decode and drops frames. After an upload the video is probed with
+ffprobe and, if needed, converted with ffmpeg by a small background pool.
+The rendition is stored in the media store next to the original and the
+manifest points screens at it; the dashboard still offers the original.
+
+Job state lives in the `transcode_jobs` table, so progress can be read from
+any worker process and jobs interrupted by a restart are picked up again.
+Jobs are claimed from the table, which caps running encodes at
+TRANSCODE_WORKERS across all worker processes: a process that finds the
+cap reached leaves the job queued for whichever one finishes first.
+"""
+import json
+import logging
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import media
+
+FFMPEG = shlex.split(os.environ.get('FFMPEG', 'ffmpeg'))
+FFPROBE = shlex.split(os.environ.get('FFPROBE', 'ffprobe'))
+TRANSCODE_ENABLED = os.environ.get('TRANSCODE', '1') != '0'
+TRANSCODE_WORKERS = int(os.environ.get('TRANSCODE_WORKERS', 1))  # across all worker processes; ffmpeg already uses every core
+
+# What the screens decode in hardware (see shared/player.py)
+PLAYABLE_CODECS = {'h264', 'hevc'}
+PLAYABLE_PIX_FMTS = {'yuv420p', 'yuvj420p'}
+MAX_WIDTH, MAX_HEIGHT = 1920, 1080
+
+# The rendition: H.264 High@4.1, fitted inside 1920x1080, AAC audio
+RENDITION_EXT = '.mp4'
+VIDEO_ARGS = ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '20',
+              '-profile:v', 'high', '-level', '4.1', '-pix_fmt', 'yuv420p',
+              '-vf', f'scale={MAX_WIDTH}:{MAX_HEIGHT}:force_original_aspect_ratio=decrease:force_divisible_by=2']
+AUDIO_ARGS = ['-c:a', 'aac', '-b:a', '160k']
+
+PROGRESS_INTERVAL = 2  # seconds between progress writes
+STALE_AFTER = 60  # a running job that hasn't reported for this long died with its process
+
+_pool = None
+_pool_lock = threading.Lock()
+_upload_folder = None
+_enabled = False  # set by start() when TRANSCODE is on and ffprobe/ffmpeg are installed
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def probe(path):
+    """
+    Returns {'codec', 'width', 'height', 'pix_fmt', 'duration', 'bitrate'}
+    of the first video stream (None where unknown).
+    """
+    try:
+        out = subprocess.run(FFPROBE + ['-v', 'error', '-of', 'json', '-show_format',
+                                        '-show_streams', '-select_streams', 'v:0', path],
+                             capture_output=True, timeout=60, check=True).stdout
+        info = json.loads(out)
+    except FileNotFoundError:
+        raise TranscodeError(f'{FFPROBE[0]} not found')
+    except (subprocess.SubprocessError, ValueError) as e:
+        raise TranscodeError(f'probe failed: {e}')
+    streams = info.get('streams') or []
+    if not streams:
+        raise TranscodeError('no video stream')
+    stream, fmt = streams[0], info.get('format') or {}
+
+    def number(value, kind=float):
+        try:
+            return kind(value)
+        except (TypeError, ValueError):
+            return None
+
+    return {
+        'codec': stream.get('codec_name'),
+        'width': number(stream.get('width'), int),
+        'height': number(stream.get('height'), int),
+        'pix_fmt': stream.get('pix_fmt'),
+        'duration': number(fmt.get('duration')) or number(stream.get('duration')),
+        'bitrate': number(fmt.get('bit_rate'), int),
+    }
+
+
+def needs_transcode(info):
+    """Why a probed video won't play well on a screen, or None if it will."""
+    if info['codec'] not in PLAYABLE_CODECS:
+        return f"codec {info['codec']}"
+    if info['pix_fmt'] not in PLAYABLE_PIX_FMTS:
+        return f"pixel format {info['pix_fmt']}"
+    if (info['width'] or 0) > MAX_WIDTH or (info['height'] or 0) > MAX_HEIGHT:
+        return f"resolution {info['width']}x{info['height']}"
+    return None
+
+
+def _run_ffmpeg(video_id, src, dest, duration):
+    """Runs the conversion, writing progress to the job as it goes."""
+    cmd = FFMPEG + ['-nostdin', '-y', '-v', 'error', '-i', src,
+                    '-map', '0:v:0', '-map', '0:a:0?'] + VIDEO_ARGS + AUDIO_ARGS + [
+           '-movflags', '+faststart', '-progress', 'pipe:1', '-nostats', dest]
+    # stderr goes to a file: only stdout (progress) is read while it runs,
+    # and a full stderr pipe would block ffmpeg
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errors, text=True)
+        last_report = 0
+        done = None  # seconds of output written so far
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            # One block per update, ending in progress=; out_time_us is in microseconds
+            if key == 'out_time_us' and value.isdigit():
+                done = int(value) / 1e6
+            elif key == 'progress' and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                # Also marks the job alive when the duration is unknown
+                fields = {'progress': min(done / duration, 0.99)} if duration and done is not None else {}
+                database.update_transcode_job(video_id, **fields)
+        if process.wait() != 0:
+            errors.seek(max(errors.tell() - 500, 0))
+            tail = errors.read().decode(errors='replace').strip()
+            raise TranscodeError(f'ffmpeg exited with {process.returncode}: {tail}')
+
+
+def _work():
+    """Runs queued jobs while this master is under its encode limit."""
+    while True:
+        video_id = database.claim_transcode_job(TRANSCODE_WORKERS, STALE_AFTER)
+        if video_id is None:
+            return  # nothing queued, or other workers are at the limit
+        _transcode(video_id)
+
+
+def _transcode(video_id):
+    video = database.get_video(video_id)
+    if video is None or not video['blob']:
+        database.delete_transcode_job(video_id)
+        return
+    src = os.path.join(_upload_folder, video['blob'])
+    tmp = os.path.join(_upload_folder, '.partial', f'{uuid.uuid4().hex}{RENDITION_EXT}')
+    try:
+        info = probe(src)
+        reason = needs_transcode(info)
+        if reason is None:
+            database.update_transcode_job(video_id, status='skipped', progress=1, detail=info)
+            return
+        logging.info(f"Transcoding {video['filename']} ({reason})")
+        database.update_transcode_job(video_id, detail={**info, 'reason': reason})
+        os.makedirs(os.path.dirname(tmp), exist_ok=True)
+        _run_ffmpeg(video_id, src, tmp, info['duration'])
+
+        size, sha256 = media.hash_file(tmp)
+        name = os.path.splitext(video['filename'])[0] + RENDITION_EXT
+        blob = media.store(_upload_folder, tmp, sha256, name)
+        if not database.set_video_rendition(video_id, size, sha256, blob):
+            media.release(_upload_folder, blob)  # deleted while we worked
+            database.delete_transcode_job(video_id)
+            return
+        database.update_transcode_job(video_id, status='done', progress=1)
+        logging.info(f"Transcoded {video['filename']}")
+    except Exception as e:
+        logging.error(f"Transcoding {video['filename']} failed: {e}")
+        database.update_transcode_job(video_id, status='failed', error=str(e))
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=TRANSCODE_WORKERS, thread_name_prefix='transcode')
+        return _pool
+
+
+def submit(video_id):
+    """
+    Queues a new upload for probing and, if needed, transcoding. Returns
+    False when transcoding is off or ffprobe/ffmpeg are missing.
+    """
+    if not _enabled:
+        return False
+    database.create_transcode_job(video_id)
+    _executor().submit(_work)
+    return True
+
+
+def cancel(video_id):
+    """Drops the job of a deleted video (a running conversion finds out when done)."""
+    database.delete_transcode_job(video_id)
+
+
+def start(upload_folder):
+    """Enables the pool if ffprobe and ffmpeg are installed and resumes jobs left by a restart."""
+    global _upload_folder, _enabled
+    _upload_folder = upload_folder
+    if not TRANSCODE_ENABLED:
+        return
+    missing = [tool[0] for tool in (FFPROBE, FFMPEG) if shutil.which(tool[0]) is None]
+    if missing:
+        logging.info(f"{' and '.join(missing)} not found; uploads are not transcoded")
+        return
+    _enabled = True
+    if database.requeue_transcode_jobs(STALE_AFTER):
+        for _ in range(TRANSCODE_WORKERS):
+            _executor().submit(_work)
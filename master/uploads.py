@@ -0,0 +1,261 @@
+"""
+Resumable chunked uploads.
+
+The dashboard splits a file into fixed-size chunks and PUTs them by index,
+several at a time. Each chunk is streamed straight into a sparse part file
+next to the library with pwrite() at its offset, so nothing is spooled to a
+temp file and copied again. A running SHA-256 follows the contiguous prefix
+of received chunks; finalize checks it, rejects duplicates and renames the
+part file into the content-addressed media store.
+
+Sessions and received chunks live in SQLite so an interrupted upload can be
+resumed (init with the same filename, size and sha256 or client fingerprint
+returns the existing session).
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+import database
+import media
+
+CHUNK_SIZE = 8 * 1024 * 1024
+MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 16 * 1024 ** 3))
+STALE_AFTER = 24 * 3600  # unfinished uploads older than this are discarded
+READ_SIZE = 1024 * 1024
+
+_hash_lock = threading.Lock()
+_hashers = {}
+
+
+class UploadError(Exception):
+    """Raised for client errors; `status` is the HTTP status to return."""
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+class _RunningHash:
+    def __init__(self):
+        self.hasher = hashlib.sha256()
+        self.next_idx = 0
+        self.busy = False
+
+
+def part_path(upload_folder, upload_id):
+    return os.path.join(upload_folder, '.partial', f'{upload_id}.part')
+
+
+def _num_chunks(upload):
+    return (upload['size'] + upload['chunk_size'] - 1) // upload['chunk_size']
+
+
+def _chunk_length(upload, idx):
+    return min(upload['chunk_size'], upload['size'] - idx * upload['chunk_size'])
+
+
+def get_upload(upload_id):
+    upload = database.get_upload(upload_id)
+    if upload is None:
+        raise UploadError('Upload not found', 404)
+    return upload
+
+
+def _reject_duplicate(sha256):
+    existing = database.get_video_by_sha256(sha256)
+    if existing:
+        raise UploadError('Duplicate video', 409, id=existing['id'], filename=existing['filename'])
+
+
+def cleanup_stale(upload_folder):
+    for upload in database.get_stale_uploads(time.time() - STALE_AFTER):
+        abort_upload(upload_folder, upload['upload_id'])
+
+
+def describe(upload):
+    return {
+        'upload_id': upload['upload_id'],
+        'filename': upload['filename'],
+        'size': upload['size'],
+        'chunk_size': upload['chunk_size'],
+        'received': database.get_upload_chunks(upload['upload_id']),
+    }
+
+
+def init_upload(upload_folder, filename, size, sha256=None, fingerprint=None):
+    """
+    Starts (or resumes) an upload. When the client already knows the
+    content hash, duplicates are rejected before any bytes are sent.
+    `fingerprint` identifies the file for resuming when it doesn't.
+    """
+    if size <= 0:
+        raise UploadError('Empty file')
+    if size > MAX_UPLOAD_SIZE:
+        raise UploadError(f'File exceeds the {MAX_UPLOAD_SIZE} byte limit', 413)
+    if sha256:
+        _reject_duplicate(sha256)
+
+    cleanup_stale(upload_folder)
+    existing = database.find_upload(filename, size, sha256, fingerprint)
+    if existing and os.path.exists(part_path(upload_folder, existing['upload_id'])):
+        return describe(existing)
+
+    upload_id = uuid.uuid4().hex
+    path = part_path(upload_folder, upload_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.truncate(size)  # sparse; chunks land at their final offsets
+    database.create_upload(upload_id, filename, size, CHUNK_SIZE, sha256, fingerprint)
+    return describe(database.get_upload(upload_id))
+
+
+def _advance_hash(upload_folder, upload, state, received):
+    """Feeds chunks that are now contiguous into the running hash (from page cache)."""
+    path = part_path(upload_folder, upload['upload_id'])
+    with open(path, 'rb') as f:
+        while state.next_idx in received:
+            f.seek(state.next_idx * upload['chunk_size'])
+            remaining = _chunk_length(upload, state.next_idx)
+            while remaining:
+                data = f.read(min(READ_SIZE, remaining))
+                if not data:
+                    raise UploadError('Part file truncated', 500)
+                state.hasher.update(data)
+                remaining -= len(data)
+            state.next_idx += 1
+
+
+def _catch_up(upload_folder, upload):
+    upload_id = upload['upload_id']
+    with _hash_lock:
+        state = _hashers.get(upload_id)
+        if state is None or state.busy:
+            return
+        state.busy = True
+    try:
+        _advance_hash(upload_folder, upload, state, set(database.get_upload_chunks(upload_id)))
+    finally:
+        with _hash_lock:
+            state.busy = False
+
+
+def write_chunk(upload_folder, upload_id, idx, stream):
+    """Streams one chunk from `stream` into place, hashing inline when it is next in order."""
+    upload = get_upload(upload_id)
+    if idx < 0 or idx >= _num_chunks(upload):
+        raise UploadError('Chunk index out of range')
+    expected = _chunk_length(upload, idx)
+
+    with _hash_lock:
+        state = _hashers.setdefault(upload_id, _RunningHash())
+        inline = state.next_idx == idx and not state.busy
+        if inline:
+            state.busy = True
+    hasher = state.hasher.copy() if inline else None
+
+    try:
+        fd = os.open(part_path(upload_folder, upload_id), os.O_WRONLY)
+        try:
+            offset = idx * upload['chunk_size']
+            written = 0
+            while written < expected:
+                data = stream.read(min(READ_SIZE, expected - written))
+                if not data:
+                    break
+                os.pwrite(fd, data, offset + written)
+                if hasher:
+                    hasher.update(data)
+                written += len(data)
+            if written != expected or stream.read(1):
+                raise UploadError(f'Chunk {idx} must be exactly {expected} bytes')
+        finally:
+            os.close(fd)
+        database.mark_upload_chunk(upload_id, idx)
+        if inline:
+            state.hasher = hasher
+            state.next_idx = idx + 1
+    finally:
+        if inline:
+            with _hash_lock:
+                state.busy = False
+
+    _catch_up(upload_folder, upload)
+    return describe(upload)
+
+
+def finalize_upload(upload_folder, upload_id):
+    """
+    Verifies the upload is complete, checks its hash and moves it into the
+    media store. Returns the new video's fields for database.add_video().
+    """
+    upload = get_upload(upload_id)
+    received = set(database.get_upload_chunks(upload_id))
+    missing = [i for i in range(_num_chunks(upload)) if i not in received]
+    if missing:
+        raise UploadError('Upload incomplete', 409, missing=missing[:100])
+
+    _catch_up(upload_folder, upload)
+    with _hash_lock:
+        state = _hashers.pop(upload_id, None)
+    if state is None or state.busy or state.next_idx != _num_chunks(upload):
+        # Running hash lost (restart or another worker): hash from disk
+        state = _RunningHash()
+        _advance_hash(upload_folder, upload, state, received)
+    sha256 = state.hasher.hexdigest()
+
+    path = part_path(upload_folder, upload_id)
+    try:
+        if upload['sha256'] and upload['sha256'] != sha256:
+            raise UploadError('Checksum mismatch', 422, sha256=sha256)
+        _reject_duplicate(sha256)
+    except UploadError:
+        abort_upload(upload_folder, upload_id)
+        raise
+
+    blob = media.store(upload_folder, path, sha256, upload['filename'])
+    database.delete_upload(upload_id)
+    return {'filename': upload['filename'], 'size': upload['size'], 'sha256': sha256, 'blob': blob}
+
+
+def abort_upload(upload_folder, upload_id):
+    with _hash_lock:
+        _hashers.pop(upload_id, None)
+    try:
+        os.remove(part_path(upload_folder, upload_id))
+    except OSError:
+        pass
+    database.delete_upload(upload_id)
+
+
+def store_stream(upload_folder, filename, stream):
+    """
+    Single-request upload path: copies `stream` to a part file while hashing
+    and only moves it into the media store if it is not a duplicate.
+    Returns the new video's fields for database.add_video().
+    """
+    path = part_path(upload_folder, uuid.uuid4().hex)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, 'wb') as f:
+            while True:
+                data = stream.read(READ_SIZE)
+                if not data:
+                    break
+                size += len(data)
+                if size > MAX_UPLOAD_SIZE:
+                    raise UploadError(f'File exceeds the {MAX_UPLOAD_SIZE} byte limit', 413)
+                hasher.update(data)
+                f.write(data)
+        sha256 = hasher.hexdigest()
+        _reject_duplicate(sha256)
+    except Exception:
+        os.remove(path)
+        raise
+    blob = media.store(upload_folder, path, sha256, filename)
+    return {'filename': filename, 'size': size, 'sha256': sha256, 'blob': blob}
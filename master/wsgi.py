@@ -0,0 +1,65 @@
+"""
+Production entry point for the master.
+
+    python master/wsgi.py --workers 4 [--threads 64] [--bind 0.0.0.0:5000]
+
+runs the app under gunicorn with several worker processes (gthread workers,
+since every screen holds an /api/events stream open on a thread). Media is
+sent with sendfile(), including resumed Range requests. Any other WSGI
+server can load `wsgi:app` with master/ on the Python path; run it from the
+directory that holds signage.db, as with app.py.
+"""
+import argparse
+import fcntl
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Workers share signage.db: have the database layer pick up commits made by
+# other processes. Must be set before database is imported.
+os.environ.setdefault('SIGNAGE_MULTIPROCESS', '1')
+
+import database
+
+DEFAULT_WORKERS = 2 * (os.cpu_count() or 1) + 1
+DEFAULT_THREADS = 64  # open event streams + downloads per worker
+
+
+def load_app():
+    """
+    Imports the app, which creates/migrates the schema and media store.
+    Workers do that one at a time under a file lock.
+    """
+    with open(database.DB_PATH + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        from app import app
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the signage master under gunicorn.')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS)
+    parser.add_argument('--bind', default=f"0.0.0.0:{os.environ.get('PORT', 5000)}")
+    args = parser.parse_args()
+
+    from gunicorn.app.wsgiapp import run
+    sys.argv = [
+        'gunicorn',
+        '--workers', str(args.workers),
+        '--worker-class', 'gthread',
+        '--threads', str(args.threads),
+        '--bind', args.bind,
+        '--pythonpath', os.path.dirname(os.path.abspath(__file__)),
+        'wsgi:app',
+    ]
+    run()
+
+
+if __name__ == '__main__':
+    main()
+else:
+    # Loaded by the server in each worker (never in gunicorn's arbiter, so
+    # no connections or threads are inherited across fork)
+    app = load_app()
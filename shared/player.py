@@ -5,8 +5,214 @@ import logging
 import json
 import socket
 import platform
+import shlex
+import threading
+import atexit
+
+# mpv executable; may carry arguments (e.g. MPV_BIN="python bench/fake_mpv.py")
+MPV_BIN = shlex.split(os.environ.get("MPV_BIN", "mpv"), posix=platform.system() != "Windows")
+MPV_STARTUP_TIMEOUT = float(os.environ.get("MPV_STARTUP_TIMEOUT", 10))
+# Headless output modes, tried in order; the one that worked is cached on
+# disk so later boots start with it instead of probing the others again
+MPV_MODES = ("gpu-fast", "gpu-safe", "drm")
+MPV_MODE_CACHE = os.environ.get("MPV_MODE_CACHE", os.path.expanduser("~/.cache/pi-signage/mpv-mode"))
+# After a probe succeeds, re-check the log once after this long, since
+# some DRM failures are only logged once the first frame is committed
+MPV_PROBE_GRACE = 0.3
+MPV_LOG_TAIL = 4000  # bytes read from the end of the mpv log
+MPV_LOG_ERRORS = (
+    "Failed to commit atomic request",
+    "failed to set mode",
+    "Permission denied",
+    "No connected connectors found",
+)
+# Keep a second, idle mpv running so a restart swaps it in instead of cold starting
+MPV_WARM_STANDBY = os.environ.get("MPV_WARM_STANDBY", "0") == "1"
+
+class MpvIpc:
+    """
+    Long-lived JSON IPC connection to mpv.
+
+    Commands are tagged with a `request_id` so several threads can share one
+    connection; a reader thread matches replies to requests and dispatches
+    async events (`end-file`, `idle`, `property-change`, ...) to callbacks.
+    Callbacks run on the reader thread: they must not block, and may only
+    send commands with wait=False.
+
+    Windows named pipes opened as files can't be read and written from two
+    threads at once, so there replies are read inline by the caller and
+    events are only delivered as they arrive between replies, once the
+    caller has released the pipe.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._sock = None
+        self._pipe = None
+        self._write_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._pending = {}  # request_id -> [threading.Event, reply]
+        self._handlers = {}  # event name -> [callback]
+        self._observers = {}  # observe id -> (property name, callback)
+        self._windows = platform.system() == 'Windows'
+
+    @property
+    def connected(self):
+        return self._sock is not None or self._pipe is not None
+
+    def connect(self, timeout=0.0):
+        """Connects, retrying until `timeout` seconds pass. Returns True on success."""
+        deadline = time.monotonic() + timeout
+        while not self.connected:
+            try:
+                self._open()
+            except OSError:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.05)
+        # Observers are per connection in mpv; (re)register them
+        for oid, (name, _) in list(self._observers.items()):
+            self.command(["observe_property", oid, name], wait=False)
+        return True
+
+    def _open(self):
+        if self._windows:
+            self._pipe = open(self.path, 'r+b', buffering=0)
+            return
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        threading.Thread(target=self._read_loop, args=(sock,), daemon=True).start()
+
+    def close(self):
+        sock, pipe = self._sock, self._pipe
+        self._sock = self._pipe = None
+        for conn in (sock, pipe):
+            if conn is not None:
+                try:
+                    conn.close()
+                except OSError:
+                    pass
+        self._fail_pending()
+
+    def _fail_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for waiter in pending.values():
+            waiter[0].set()
+
+    def _read_loop(self, sock):
+        reader = sock.makefile('rb')
+        try:
+            for line in reader:
+                self._dispatch(line)
+        except (OSError, ValueError):
+            pass
+        finally:
+            if self._sock is sock:
+                self._sock = None
+                self._fail_pending()
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _dispatch(self, line, events=None):
+        """
+        Handles one line from mpv and returns the request_id it answers.
+        Events are appended to `events` instead when given, for reads done
+        under the write lock: their callbacks may send commands themselves.
+        """
+        try:
+            msg = json.loads(line)
+        except ValueError:
+            return None
+        if 'event' in msg:
+            if events is not None:
+                events.append(msg)
+            else:
+                self._event(msg)
+            return None
+        rid = msg.get('request_id')
+        with self._lock:
+            waiter = self._pending.pop(rid, None)
+        if waiter:
+            waiter[1] = msg
+            waiter[0].set()
+        return rid
+
+    def _event(self, msg):
+        callbacks = list(self._handlers.get(msg['event'], ()))
+        if msg['event'] == 'property-change' and msg.get('id') in self._observers:
+            callbacks.append(self._observers[msg['id']][1])
+        for cb in callbacks:
+            try:
+                cb(msg)
+            except Exception as e:
+                logging.debug(f"mpv event callback failed: {e}")
+
+    def command(self, args, wait=True, timeout=1.5):
+        """
+        Sends one command. With wait=True returns mpv's reply dict (None on
+        timeout/disconnect); with wait=False returns True once written.
+        """
+        if not self.connected and not self.connect():
+            return None
+        with self._lock:
+            rid = self._next_id
+            self._next_id += 1
+            waiter = [threading.Event(), None]
+            if wait:
+                self._pending[rid] = waiter
+        payload = (json.dumps({"command": args, "request_id": rid}) + "\n").encode()
+        events = []
+        try:
+            with self._write_lock:
+                if self._windows:
+                    self._pipe.write(payload)
+                    while wait:
+                        line = self._pipe.readline()
+                        if not line:
+                            raise OSError("mpv pipe closed")
+                        if self._dispatch(line, events) == rid:
+                            break
+                else:
+                    self._sock.sendall(payload)
+        except (OSError, AttributeError, ValueError):
+            self.close()
+            return None
+        finally:
+            for msg in events:
+                self._event(msg)
+        if not wait:
+            return True
+        if not waiter[0].wait(timeout):
+            with self._lock:
+                self._pending.pop(rid, None)
+            return None
+        return waiter[1]
+
+    def on_event(self, name, callback):
+        """Calls `callback(msg)` for every mpv event called `name` (e.g. 'end-file')."""
+        self._handlers.setdefault(name, []).append(callback)
+
+    def observe_property(self, name, callback):
+        """Calls `callback(msg)` whenever property `name` changes; survives reconnects."""
+        oid = len(self._observers) + 1
+        self._observers[oid] = (name, callback)
+        if self.connected:
+            self.command(["observe_property", oid, name], wait=False)
+        return oid
 
 class Player:
+    # Properties mirrored from mpv events instead of being polled every tick
+    OBSERVED_PROPERTIES = ("idle-active", "pause")
+
     def __init__(self):
         self.process = None
         self.current_video = None
@@ -19,14 +225,65 @@ class Player:
             self.ipc_path = r'\\.\pipe\mpv-signage'
         else:
             self.ipc_path = '/tmp/mpv-socket'
+        self.ipc_path = os.environ.get("MPV_IPC_PATH", self.ipc_path)
+        self._base_ipc_path = self.ipc_path
+        self.mode = None  # headless output mode in use (None when windowed)
+
+        # Warm standby: (process, ipc path, mode) of an idle spare mpv
+        self._standby = None
+        self._standby_starting = None
+        self._standby_stopped = False  # torn down at exit; start no more
+        self._standby_lock = threading.Lock()
+        if MPV_WARM_STANDBY:
+            atexit.register(self._kill_standby)
 
-    def _build_mpv_cmd(self, mode: str):
+        # Gapless playlist mode: [(path, rotation), ...] in mpv's order
+        self.playlist = None
+        self.playlist_pos = None
+
+        self.ipc = MpvIpc(self.ipc_path)
+        self._props = {}
+        self._use_events = platform.system() != 'Windows'
+        for name in self.OBSERVED_PROPERTIES:
+            self.ipc.observe_property(name, self._on_property_change)
+        self.ipc.observe_property("playlist-pos", self._on_playlist_pos)
+        self._loads = 0  # file-loaded events seen, so preload() can tell the new file is open
+        self.ipc.on_event("file-loaded", self._on_file_loaded)
+
+    def _on_file_loaded(self, msg):
+        self._loads += 1
+
+    def _on_property_change(self, msg):
+        self._props[msg['name']] = msg.get('data')
+
+    def _on_playlist_pos(self, msg):
+        """Tracks the playing entry and applies its rotation as it starts."""
+        pos = msg.get('data')
+        self.playlist_pos = pos
+        if not self.playlist or pos is None or not 0 <= pos < len(self.playlist):
+            return
+        path, rotation = self.playlist[pos]
+        self.current_video = path
+        if rotation != self.rotation:
+            # Runs on the IPC reader thread, so don't wait for the reply
+            self.ipc.command(["set_property", "video-rotate", str(rotation)], wait=False)
+            self.rotation = rotation
+
+    def on_event(self, name, callback):
+        """Subscribe to mpv events (see MpvIpc.on_event)."""
+        self.ipc.on_event(name, callback)
+
+    def observe_property(self, name, callback):
+        """Subscribe to mpv property changes (see MpvIpc.observe_property)."""
+        return self.ipc.observe_property(name, callback)
+
+    def _build_mpv_cmd(self, mode: str, ipc_path=None, log_path=None):
         # Base flags (common)
         cmd = [
-            "mpv",
+            *MPV_BIN,
             "--idle",
             "--fs",
-            f"--input-ipc-server={self.ipc_path}",
+            f"--input-ipc-server={ipc_path or self.ipc_path}",
             "--force-window=yes",
             "--no-terminal",
         
@@ -50,8 +307,10 @@ class Player:
             "--audio-device=alsa/hdmi:CARD=vc4hdmi0,DEV=0",
             "--audio-channels=stereo",
             "--gapless-audio=yes",
+            # Open/demux the next playlist entry before the current one ends
+            "--prefetch-playlist=yes",
         
-            f"--log-file=/tmp/mpv-signage-{mode}.log",
+            f"--log-file={log_path or self._log_path(mode)}",
         ]
         if mode == "gpu-fast":
             cmd += [
@@ -73,60 +332,140 @@ class Player:
 
         return cmd
 
+    def _build_windowed_cmd(self, ipc_path=None):
+        return [
+            *MPV_BIN,
+            "--idle",
+            "--fs",
+            f"--input-ipc-server={ipc_path or self.ipc_path}",
+            "--force-window=yes",
+            "--osd-level=0",
+            "--no-terminal",
+            "--prefetch-playlist=yes",
+            "--hwdec=auto",
+        ]
+
+    @staticmethod
+    def _log_path(mode, suffix=""):
+        return f"/tmp/mpv-signage-{mode}{suffix}.log"
+
+    @staticmethod
+    def _is_headless():
+        if platform.system() == "Windows":
+            return False
+        return (os.environ.get("DISPLAY") is None) and (os.environ.get("WAYLAND_DISPLAY") is None)
+
     def _mpv_log_has_errors(self, mode: str) -> bool:
-        log_path = f"/tmp/mpv-signage-{mode}.log"
+        log_path = self._log_path(mode)
         try:
-            if not os.path.exists(log_path):
-                return False
-            with open(log_path, "r", errors="ignore") as f:
-                tail = f.read()[-4000:]  # last few KB
-            bad = [
-                "Failed to commit atomic request",
-                "failed to set mode",
-                "Permission denied",
-                "No connected connectors found",
-            ]
-            return any(s in tail for s in bad)
+            with open(log_path, "rb") as f:
+                # Only the tail matters; don't read a long log from the start
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - MPV_LOG_TAIL))
+                tail = f.read().decode(errors="ignore")
+            return any(s in tail for s in MPV_LOG_ERRORS)
         except Exception:
             return False
 
-    def _start_mpv_with_fallback(self):
+    def _load_cached_mode(self):
+        try:
+            with open(MPV_MODE_CACHE) as f:
+                mode = f.read().strip()
+        except OSError:
+            return None
+        return mode if mode in MPV_MODES else None
+
+    def _save_cached_mode(self, mode):
+        try:
+            os.makedirs(os.path.dirname(MPV_MODE_CACHE), exist_ok=True)
+            tmp = MPV_MODE_CACHE + ".tmp"
+            with open(tmp, "w") as f:
+                f.write(mode)
+            os.replace(tmp, MPV_MODE_CACHE)
+        except OSError as e:
+            logging.debug(f"Could not cache mpv mode: {e}")
+
+    @staticmethod
+    def _remove_stale_ipc(path):
         # Remove stale IPC socket if mpv crashed previously
         try:
-            if os.path.exists(self.ipc_path):
-                os.remove(self.ipc_path)
+            if os.path.exists(path) and platform.system() != "Windows":
+                os.remove(path)
         except Exception:
             pass
 
-        for mode in ("gpu-fast", "gpu-safe", "drm"):
+    def _wait_ready(self, process, ipc, timeout=MPV_STARTUP_TIMEOUT):
+        """
+        Polls mpv's IPC with a short backoff until it answers a request.
+        mpv only serves commands once initialisation (including the forced
+        window) is done, so a reply means it is ready. False if it exited
+        or timed out.
+        """
+        deadline = time.monotonic() + timeout
+        delay = 0.01
+        while True:
+            if process.poll() is not None:
+                return False
+            if (ipc.connected or ipc.connect()) and ipc.command(["get_property", "idle-active"], timeout=0.5) is not None:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
+    def _quit_process(self, process, ipc):
+        try:
+            ipc.command(["quit"], wait=False)
+            process.wait(timeout=2)
+        except Exception:
+            try:
+                process.kill()
+            except Exception:
+                pass
+        ipc.close()
+
+    def _start_mpv_with_fallback(self):
+        self._remove_stale_ipc(self.ipc_path)
+
+        cached = self._load_cached_mode()
+        modes = ([cached] if cached else []) + [m for m in MPV_MODES if m != cached]
+        for mode in modes:
             cmd = self._build_mpv_cmd(mode)
             logging.info(f"Starting player process ({mode}): {' '.join(cmd)}")
 
+            started = time.monotonic()
             self.process = subprocess.Popen(cmd)
-            time.sleep(1.0)  # give mpv time to init and write logs
 
-            # If mpv died immediately, try next mode
-            if self.process.poll() is not None:
-                logging.warning(f"mpv exited early in mode {mode}, trying fallback...")
+            # If mpv died or never answered, try next mode
+            if not self._wait_ready(self.process, self.ipc):
+                logging.warning(f"mpv did not come up in mode {mode}, trying fallback...")
+                self._quit_process(self.process, self.ipc)
+                self.process = None
                 continue
 
-            # If mpv is running but log shows known DRM failures, restart with next mode
-            if self._mpv_log_has_errors(mode):
+            # If mpv is running but log shows known DRM failures, restart with next mode.
+            # A cached mode worked before, so it skips the grace re-check.
+            has_errors = self._mpv_log_has_errors(mode)
+            if not has_errors and mode != cached:
+                time.sleep(MPV_PROBE_GRACE)
+                has_errors = self._mpv_log_has_errors(mode)
+            if has_errors:
                 logging.warning(f"mpv reported DRM errors in mode {mode}, restarting with fallback...")
-                try:
-                    self._send(["quit"])
-                    self.process.wait(timeout=2)
-                except Exception:
-                    try:
-                        self.process.kill()
-                    except Exception:
-                        pass
+                self._quit_process(self.process, self.ipc)
                 self.process = None
                 continue
 
             # Success
+            logging.info(f"mpv ready in mode {mode} after {time.monotonic() - started:.2f}s")
+            self.mode = mode
+            if mode != cached:
+                self._save_cached_mode(mode)
             return
 
+        try:
+            os.remove(MPV_MODE_CACHE)
+        except OSError:
+            pass
         raise RuntimeError("Failed to start mpv in all modes (gpu-fast, gpu-safe, drm).")
 
     def _start_mpv(self):
@@ -134,65 +473,123 @@ class Player:
         if self.process and self.process.poll() is None:
             return
 
-        cmd = [
-            "mpv",
-            "--idle",
-            "--fs",
-            f"--input-ipc-server={self.ipc_path}",
-            "--force-window=yes",
-            "--osd-level=0",
-            "--no-terminal",
-        ]
+        # Any previous connection belonged to a dead process
+        self.ipc.close()
+        self._props.clear()
+        self.playlist = None
+        self.playlist_pos = None
 
-        if platform.system() != "Windows":
-            is_headless = (os.environ.get("DISPLAY") is None) and (os.environ.get("WAYLAND_DISPLAY") is None)
-            if is_headless:
-                try:
-                    self._start_mpv_with_fallback()
-                    return
-                except Exception as e:
-                    logging.error(f"Critical error starting mpv with fallback: {e}")
-                    return
-            else:
-                cmd += ["--hwdec=auto"]
+        if self._promote_standby():
+            return
+        self.ipc.path = self.ipc_path = self._base_ipc_path
+
+        if self._is_headless():
+            try:
+                self._start_mpv_with_fallback()
+            except Exception as e:
+                logging.error(f"Critical error starting mpv with fallback: {e}")
+                return
         else:
-            cmd += ["--hwdec=auto"]
+            cmd = self._build_windowed_cmd()
+            logging.info(f"Starting player process: {' '.join(cmd)}")
+            try:
+                self._remove_stale_ipc(self.ipc_path)
+                started = time.monotonic()
+                self.process = subprocess.Popen(cmd)
+                self.mode = None
+                if self._wait_ready(self.process, self.ipc):
+                    logging.info(f"mpv ready after {time.monotonic() - started:.2f}s")
+                else:
+                    logging.warning("mpv did not answer on IPC yet")
+            except Exception as e:
+                logging.error(f"Critical error starting mpv: {e}")
+                return
+        self._spawn_standby()
 
-        logging.info(f"Starting player process: {' '.join(cmd)}")
-        try:
-            self.process = subprocess.Popen(cmd)
-            time.sleep(3)
-        except Exception as e:
-            logging.error(f"Critical error starting mpv: {e}")
+    def _standby_cmd(self, mode, ipc_path):
+        if mode is None:
+            cmd = self._build_windowed_cmd(ipc_path)
+        else:
+            cmd = self._build_mpv_cmd(mode, ipc_path, self._log_path(mode, "-standby"))
+        # No window until it is promoted, so it doesn't compete for the display
+        return ["--force-window=no" if a == "--force-window=yes" else a for a in cmd]
 
+    def _spawn_standby(self):
+        """Starts an idle spare mpv in the background (MPV_WARM_STANDBY=1)."""
+        if not MPV_WARM_STANDBY:
+            return
+        path = self._base_ipc_path
+        if self.ipc_path == path:
+            path += "-standby"
+        mode = self.mode
+
+        def run():
+            self._remove_stale_ipc(path)
+            try:
+                process = subprocess.Popen(self._standby_cmd(mode, path))
+            except Exception as e:
+                logging.warning(f"Could not start standby mpv: {e}")
+                return
+            with self._standby_lock:
+                stopped = self._standby_stopped
+                if not stopped:
+                    self._standby_starting = process
+            if stopped:
+                process.kill()
+                return
+            probe = MpvIpc(path)
+            ready = self._wait_ready(process, probe)
+            probe.close()
+            with self._standby_lock:
+                stopped = self._standby_stopped
+                self._standby_starting = None
+                if ready and not stopped and self._standby is None:
+                    self._standby = (process, path, mode)
+                    return
+            if not ready and not stopped:
+                logging.warning("Standby mpv did not come up")
+            process.kill()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _promote_standby(self):
+        """Swaps the warm standby in as the active player. True on success."""
+        with self._standby_lock:
+            standby, self._standby = self._standby, None
+        if standby is None:
+            return False
+        process, path, mode = standby
+        self.ipc.path = self.ipc_path = path
+        if process.poll() is not None or not self.ipc.connect(timeout=0.5):
+            logging.warning("Standby mpv is gone, cold starting")
+            process.kill()
+            return False
+        self.process = process
+        self.mode = mode
+        self.ipc.command(["set_property", "force-window", "yes"])
+        logging.info("Switched to warm standby mpv")
+        self._spawn_standby()
+        return True
+
+    def _kill_standby(self):
+        with self._standby_lock:
+            self._standby_stopped = True
+            standby, self._standby = self._standby, None
+            starting, self._standby_starting = self._standby_starting, None
+        for process in (standby and standby[0], starting):
+            if process:
+                process.kill()
 
     def _send(self, cmd_args, wait=False, retries=3):
-        """Reliable IPC command delivery."""
+        """Reliable IPC command delivery over the persistent connection."""
         self._start_mpv()
-        payload = json.dumps({"command": cmd_args}) + "\n"
         
         for attempt in range(retries):
-            try:
-                if platform.system() == 'Windows':
-                    # Named Pipes on Windows work well with binary file I/O
-                    with open(self.ipc_path, 'r+b', buffering=0) as f:
-                        f.write(payload.encode())
-                        if wait:
-                            res = f.readline().decode()
-                            return json.loads(res)
-                else:
-                    # Unix Sockets for Linux/macOS
-                    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
-                        s.settimeout(1.5)
-                        s.connect(self.ipc_path)
-                        s.sendall(payload.encode())
-                        if wait:
-                            res = s.recv(4096).decode()
-                            return json.loads(res)
-                return {"error": "success", "data": True}
-            except Exception as e:
-                logging.debug(f"IPC attempt {attempt+1} failed: {e}")
-                time.sleep(0.5)
+            if self.ipc.connected or self.ipc.connect(timeout=0.5):
+                res = self.ipc.command(cmd_args, wait=wait)
+                if res is not None:
+                    return res if wait else {"error": "success", "data": True}
+            logging.debug(f"IPC attempt {attempt+1} failed")
         
         return None
 
@@ -205,13 +602,18 @@ class Player:
 
     def is_idle(self):
         """Returns True if MPV is sitting in idle mode (file finished)."""
+        if self._use_events and self.ipc.connected and "idle-active" in self._props:
+            return self._props["idle-active"] is True
         return self.get_property("idle-active") is True
 
     def play(self, video_path, rotation=0, loop=True):
         """Loads and plays a video seamlessly."""
         self._start_mpv()
+        self.playlist = None
+        self.playlist_pos = None
         
         # 1. Switch file
+        self._send(["set_property", "loop-playlist", "no"])
         self._send(["loadfile", video_path, "replace"])
         
         # 2. Configure playback properties
@@ -223,6 +625,116 @@ class Player:
         self.rotation = rotation
         self.is_paused = False
 
+    def play_playlist(self, items):
+        """
+        Plays [(path, rotation), ...] as one looping mpv playlist. mpv
+        prefetches the next entry and advances by itself, so transitions are
+        gapless; rotation is applied per entry from playlist-pos events.
+
+        Calling it again with the same paths only updates rotations. If the
+        entry on screen is still in the new list it keeps playing and the
+        rest of the list is rebuilt around it.
+        """
+        self._start_mpv()
+        items = list(items)
+        paths = [p for p, _ in items]
+        running = self.playlist is not None and self.is_playing()
+
+        if running and self._cyclic_order(paths) == [p for p, _ in self.playlist]:
+            rotations = dict(items)
+            self.playlist = [(p, rotations[p]) for p, _ in self.playlist]
+            self._on_playlist_pos({'data': self.playlist_pos})
+            return
+
+        current = self.current_video if running else None
+        self._send(["set_property", "loop-file", "no"])
+        self._send(["set_property", "loop-playlist", "inf"])
+        if current in paths:
+            # Keep the current entry, queue the others after it in order
+            k = paths.index(current)
+            ordered = items[k:] + items[:k]
+            self._send(["playlist-clear"])  # removes everything but the current entry
+            self.playlist = ordered
+            self.playlist_pos = 0
+            for path, _ in ordered[1:]:
+                self._send(["loadfile", path, "append"])
+            self._on_playlist_pos({'data': 0})
+        else:
+            self.playlist = items
+            self.playlist_pos = None
+            self.set_rotation(items[0][1])
+            self._send(["loadfile", paths[0], "replace"])
+            for path in paths[1:]:
+                self._send(["loadfile", path, "append"])
+            self.current_video = paths[0]
+        self.is_paused = False
+
+    def preload(self, items, index=0, position=0.0, timeout=2.0):
+        """
+        Loads [(path, rotation), ...] paused, looping (the file alone or the
+        whole list), at entry `index` and `position` seconds, so playback
+        can begin at an agreed instant with set_pause(False). Returns False
+        if mpv didn't have the file open within `timeout` seconds.
+        """
+        self._start_mpv()
+        items = list(items)
+        self._send(["set_property", "pause", "yes"])
+        self.is_paused = True
+        self._send(["set_property", "speed", 1.0])
+        looped = len(items) == 1
+        self._send(["set_property", "loop-file", "inf" if looped else "no"])
+        self._send(["set_property", "loop-playlist", "no" if looped else "inf"])
+        self.playlist = None if looped else items
+        self.playlist_pos = None
+        path, rotation = items[index]
+        self.set_rotation(rotation)
+        loads = self._loads
+        self._send(["loadfile", items[0][0], "replace"])
+        for item_path, _ in items[1:]:
+            self._send(["loadfile", item_path, "append"])
+        if index:
+            self._send(["set_property", "playlist-pos", index])
+        self.current_video = path
+
+        # Seeking only works once the file is open; until the new one is,
+        # the outgoing file still answers and would take the seek
+        deadline = time.monotonic() + timeout
+        while not (self._loads > loads and self.get_property("playlist-pos") == index
+                   and self.get_property("path") == path and self.get_property("time-pos") is not None):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        if position:
+            self.seek(position)
+        return True
+
+    def seek(self, position):
+        """Jumps to `position` seconds into the current file (frame-exact)."""
+        self._send(["seek", position, "absolute+exact"], wait=True)
+
+    def set_speed(self, speed):
+        """Playback speed; small changes nudge playback ahead or back without a jump."""
+        self._send(["set_property", "speed", speed])
+
+    def _cyclic_order(self, paths):
+        """`paths` rotated to start where the current mpv playlist starts."""
+        first = self.playlist[0][0]
+        if first not in paths:
+            return paths
+        k = paths.index(first)
+        return paths[k:] + paths[:k]
+
+    def current_playlist_item(self):
+        """The (path, rotation) mpv is on in playlist mode, from events (or polled on Windows)."""
+        if not self.playlist:
+            return None
+        if not self._use_events:
+            self._on_playlist_pos({'data': self.get_property("playlist-pos")})
+        pos = self.playlist_pos
+        if pos is None or not 0 <= pos < len(self.playlist):
+            return None
+        return self.playlist[pos]
+
     def set_pause(self, pause):
         """Remote pause/play."""
         state = "yes" if pause else "no"
@@ -244,6 +756,10 @@ class Player:
             except:
                 self.process.kill()
             self.process = None
+        self.ipc.close()
+        self._props.clear()
+        self.playlist = None
+        self.playlist_pos = None
 
     def is_playing(self):
         """Checks if video data is actively being processed."""
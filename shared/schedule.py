@@ -0,0 +1,156 @@
+"""
+Dayparting: which content the schedule puts on the screens at a given time.
+
+A rule shows `mode` ('single' with `video_id`, or 'playlist' with its own
+`playlist` of video ids) on the weekdays in `days` (0 = Monday) from
+`start_time` to `end_time` ('HH:MM', local time; an end at or before the
+start runs past midnight into the next day), optionally only for windows
+starting between `start_date` and `end_date` ('YYYY-MM-DD', inclusive).
+Where rules overlap the highest `priority` wins, then the lowest id. Outside
+every rule the screens show the dashboard's own mode.
+
+The master publishes the rules in the manifest and each screen evaluates
+them against its own clock, so it switches on the second even while the
+master is unreachable. A Schedule keeps the winning rule together with the
+time that next changes, so until then a lookup is a single comparison.
+"""
+import datetime
+import time
+
+MODES = ('single', 'playlist')
+LOOKAHEAD_DAYS = 8  # covers a weekly pattern; past that we just look again
+DAY = datetime.timedelta(days=1)
+
+# Where Schedule.current() gets the time; tests swap in a fake clock
+clock = time.time
+
+
+def parse_time(value):
+    """'HH:MM' -> minutes after midnight."""
+    try:
+        hours, minutes = (int(part) for part in str(value).split(':'))
+    except ValueError:
+        raise ValueError(f'Invalid time {value!r}, expected HH:MM')
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f'Invalid time {value!r}, expected HH:MM')
+    return hours * 60 + minutes
+
+
+def parse_date(value):
+    if value in (None, ''):
+        return None
+    try:
+        return datetime.date.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f'Invalid date {value!r}, expected YYYY-MM-DD')
+
+
+def normalize_rule(data):
+    """
+    A validated rule from API input (without `id`); `days` defaults to
+    every day and `priority` to 0. Raises ValueError.
+    """
+    mode = data.get('mode')
+    if mode not in MODES:
+        raise ValueError(f'mode must be one of {", ".join(MODES)}')
+    try:
+        days = sorted({int(d) for d in data.get('days', range(7))})
+        priority = int(data.get('priority', 0))
+        video_id = int(data['video_id']) if mode == 'single' else None
+        playlist = [int(i) for i in data.get('playlist', [])] if mode == 'playlist' else []
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Invalid days, priority, video_id or playlist')
+    if not days or not all(0 <= d < 7 for d in days):
+        raise ValueError('days must list weekdays 0 (Monday) to 6')
+    rule = {
+        'name': str(data.get('name') or ''),
+        'priority': priority,
+        'mode': mode,
+        'video_id': video_id,
+        'playlist': playlist,
+        'days': days,
+    }
+    for key in ('start_time', 'end_time'):
+        minutes = parse_time(data.get(key))
+        rule[key] = f'{minutes // 60:02}:{minutes % 60:02}'
+    start_date, end_date = parse_date(data.get('start_date')), parse_date(data.get('end_date'))
+    if start_date and end_date and end_date < start_date:
+        raise ValueError('end_date is before start_date')
+    rule['start_date'] = start_date and start_date.isoformat()
+    rule['end_date'] = end_date and end_date.isoformat()
+    return rule
+
+
+class Schedule:
+    """The active rule at any time for a list of rules (as in the manifest)."""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self._parsed = []
+        for rule in rules:
+            start = parse_time(rule['start_time'])
+            length = (parse_time(rule['end_time']) - start) % 1440 or 1440
+            self._parsed.append((rule, start, length, set(rule['days']),
+                                 parse_date(rule['start_date']) or datetime.date.min,
+                                 parse_date(rule['end_date']) or datetime.date.max))
+        self._cached = (0, 0, None)  # valid from, valid until, rule
+
+    def _windows(self, first_day, last_day):
+        """(start, end, rule) in epoch seconds for windows starting on those days."""
+        windows = []
+        for rule, start, length, days, start_date, end_date in self._parsed:
+            day = max(first_day, start_date)
+            while day <= min(last_day, end_date):
+                if day.weekday() in days:
+                    # Local wall-clock times, so windows follow DST changes
+                    begin = datetime.datetime.combine(day, datetime.time()) + datetime.timedelta(minutes=start)
+                    windows.append((begin.timestamp(),
+                                    (begin + datetime.timedelta(minutes=length)).timestamp(), rule))
+                day += DAY
+        return windows
+
+    def _winner(self, windows, now):
+        best = None
+        for start, end, rule in windows:
+            if start <= now < end and (best is None or (rule['priority'], -rule['id']) > (best['priority'], -best['id'])):
+                best = rule
+        return best
+
+    def evaluate(self, now):
+        """(rule active at `now` or None, when that next changes) without the cache."""
+        today = datetime.date.fromtimestamp(now)
+        horizon = today + datetime.timedelta(days=LOOKAHEAD_DAYS)
+        windows = self._windows(today - DAY, horizon)  # yesterday's may run past midnight
+        active = self._winner(windows, now)
+        # Only boundaries where a different rule (or none) takes over count
+        for boundary in sorted({t for start, end, _ in windows for t in (start, end) if t > now}):
+            if self._winner(windows, boundary) is not active:
+                return active, boundary
+        return active, datetime.datetime.combine(horizon, datetime.time()).timestamp()
+
+    def active_since(self, now):
+        """
+        When the rule active at `now` took over (looking back at most
+        LOOKAHEAD_DAYS), e.g. to start a video wall's timeline there.
+        None when no rule is active.
+        """
+        today = datetime.date.fromtimestamp(now)
+        windows = self._windows(today - datetime.timedelta(days=LOOKAHEAD_DAYS), today)
+        active = self._winner(windows, now)
+        if active is None:
+            return None
+        since = None
+        for boundary in sorted({t for start, end, _ in windows for t in (start, end) if t <= now}, reverse=True):
+            if self._winner(windows, boundary) is not active:
+                break
+            since = boundary
+        return since
+
+    def current(self, now=None):
+        """(active rule or None, time of the next transition), cached until then."""
+        now = clock() if now is None else now
+        valid_from, valid_until, rule = self._cached
+        if not valid_from <= now < valid_until:
+            rule, valid_until = self.evaluate(now)
+            self._cached = (now, valid_until, rule)
+        return rule, valid_until
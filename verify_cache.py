@@ -0,0 +1,107 @@
+"""
+Checks the client video cache under a disk quota: the cache never grows past
+it, videos that leave the manifest stay cached and come back without a
+download, the least recently played one is evicted first, and what a screen
+needs now (or is showing) is never evicted for something it needs later.
+
+    python verify_cache.py
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'bench'))
+from bench_e2e import Harness
+from checks import check, wait_until
+from client.agent import apply_manifest
+from client.sync import SyncWorker
+
+CLIP = 64 * 1024  # bench_e2e's upload size
+QUOTA = CLIP * 7 // 2  # room for three and a half clips
+
+
+def run():
+    h = Harness(tempfile.mkdtemp(prefix='signage-cache-'), 0)
+    try:
+        h.start_master()
+        ids = h.upload_videos(8)
+        h.session.post(f'{h.url}/api/playlist', json={'video_ids': ids}).raise_for_status()
+        model = {'version': None, 'group': None, 'state': {}, 'videos': {}, 'playlist': [], 'schedule': []}
+        apply_manifest(model, requests.get(f'{h.url}/api/manifest', params={'view': 'client'}).json())
+        v = [model['videos'][i] for i in ids]
+
+        directory = os.path.join(h.workdir, 'cache')
+        os.makedirs(directory)
+        sync = SyncWorker(h.url, directory, quota=QUOTA, min_free=0)
+        sync.start()
+
+        def cached():
+            return sorted(v.index(video) for video in v if os.path.exists(sync.path(video)))
+
+        def settle(*ready):
+            if not wait_until(lambda: all(sync.is_ready(video) for video in ready)
+                              and not sync.progress()['active']):
+                raise AssertionError(f'not ready: {sync.progress()}')
+
+        # Sample the cache's size throughout
+        peak = [0]
+        done = threading.Event()
+
+        def sample():
+            while not done.is_set():
+                peak[0] = max(peak[0], sync._usage())
+                time.sleep(0.005)
+        threading.Thread(target=sample, daemon=True).start()
+
+        print('Filling the cache...')
+        sync.update(v[:3], [video['id'] for video in v[:3]])
+        settle(*v[:3])
+        check('three clips downloaded', (cached(), sync.misses), ([0, 1, 2], 3))
+        for i in (1, 2, 0):  # clip 1 played longest ago
+            sync.touch(v[i])
+            time.sleep(0.01)
+
+        print('Evicting under the quota...')
+        sync.update(v[3:4], [v[3]['id']])
+        settle(v[3])
+        check('unlisted clips stay cached, the least recently played is evicted', cached(), [0, 2, 3])
+        sync.update([v[0], v[3]], [v[0]['id'], v[3]['id']])
+        settle(v[0], v[3])
+        check('a clip that comes back is a cache hit', (sync.hits, sync.misses), (1, 4))
+        sync.touch(v[3])  # now on screen
+
+        print('Protecting what plays soon...')
+        sync.update([v[3], v[4], v[6]], [v[3]['id'], v[4]['id'], v[6]['id']])
+        settle(v[3], v[4], v[6])
+        check('unwanted clips made room', cached(), [3, 4, 6])
+        # Clip 7 plays now, 3 and 4 next; clip 6 is only in the library
+        sync.update([v[3], v[4], v[6], v[7]], [v[7]['id'], v[3]['id'], v[4]['id']])
+        settle(v[7])
+        check('library clip evicted for the current one', cached(), [3, 4, 7])
+        wait_until(lambda: sync.progress()['cache']['no_room'])
+        cache = sync.progress()['cache']
+        check('the library clip waits for space', (cache['no_room'], sync.is_ready(v[6])), (1, False))
+        check('playlist clips kept', [sync.is_ready(v[i]) for i in (3, 4, 7)], [True, True, True])
+        # Clip 4 is on screen but otherwise only in the library; 5 plays now
+        sync.touch(v[4])
+        sync.update([v[3], v[4], v[5], v[7]], [v[5]['id'], v[7]['id'], v[3]['id']])
+        settle(v[5])
+        check('the clip on screen is never evicted', cached(), [4, 5, 7])
+
+        done.set()
+        check('never over the quota', peak[0] <= QUOTA, True)
+        print(f'      peak {peak[0]} of {QUOTA} bytes, {cache["files"]} files, hit rate {cache["hit_rate"]}, '
+              f'{cache["evicted"]} evicted')
+    finally:
+        h.stop()
+
+
+if __name__ == '__main__':
+    run()
+    print('Cache Verified.')
@@ -0,0 +1,136 @@
+"""
+Checks screen groups: each group's screens get their own mode, video,
+playlist and schedule in a manifest that lists only the videos they need,
+deltas leave out other groups' changes, and a screen that changes groups
+(or whose group is deleted) gets the new group's content.
+
+    python verify_groups.py
+"""
+import io
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'bench'))
+from checks import check, master_client
+from client.agent import apply_manifest
+
+
+def manifest(web, client_id, since=None):
+    params = {'view': 'client', 'client_id': client_id}
+    if since is None:
+        return web.get('/api/manifest', query_string=params).get_json()
+    return web.get('/api/manifest/delta', query_string=dict(params, since=since)).get_json()
+
+
+class Screen:
+    """An agent's manifest model, kept up to date with deltas."""
+
+    def __init__(self, web, client_id):
+        self.web = web
+        self.client_id = client_id
+        self.model = {'version': None, 'group': None, 'state': {}, 'videos': {}, 'playlist': [], 'schedule': []}
+        apply_manifest(self.model, manifest(web, client_id))
+
+    def refresh(self):
+        """Applies the next delta (or full manifest) and returns it."""
+        data = manifest(self.web, self.client_id, self.model['version'])
+        apply_manifest(self.model, data)
+        return data
+
+    @property
+    def videos(self):
+        return sorted(self.model['videos'])
+
+
+def run():
+    _, database, master, web = master_client('signage-groups-')
+
+    print('Groups and membership...')
+    for i in range(1, 41):
+        web.post('/api/upload', data={'file': (io.BytesIO(b'clip %d' % i), f'clip{i}.mp4')})
+    lobby = web.post('/api/groups', json={'name': 'Lobby'}).get_json()['id']
+    cafe = web.post('/api/groups', json={'name': 'Cafeteria'}).get_json()['id']
+    check('duplicate name rejected', web.post('/api/groups', json={'name': 'Lobby'}).status_code, 400)
+    check('unknown group rejected', web.post('/api/clients/lobby-1/group', json={'group_id': 99}).status_code, 404)
+    for client_id, group_id in (('lobby-1', lobby), ('lobby-2', lobby), ('cafe-1', cafe)):
+        web.post('/api/clients/%s/group' % client_id, json={'group_id': group_id})
+    groups = web.get('/api/groups').get_json()['groups']
+    check('members listed', [g['clients'] for g in groups], [['lobby-1', 'lobby-2'], ['cafe-1']])
+
+    print('Per-group content...')
+    web.post('/api/apply', json={'group_id': lobby, 'mode': 'single', 'current_video_id': 1})
+    web.post('/api/apply', json={'group_id': cafe, 'mode': 'playlist', 'video_ids': [2, 3]})
+    web.post('/api/apply', json={'mode': 'single', 'current_video_id': 4, 'video_ids': [5]})
+    check('unknown group state rejected', web.post('/api/state', json={'group_id': 99, 'paused': True}).status_code, 400)
+    screens = {name: Screen(web, name) for name in ('lobby-1', 'cafe-1', 'other')}
+    check('lobby: single clip 1', (screens['lobby-1'].model['group'], screens['lobby-1'].model['state']['mode'],
+                                   screens['lobby-1'].model['state']['current_single_id']), ('Lobby', 'single', '1'))
+    check('lobby syncs only clip 1', screens['lobby-1'].videos, [1])
+    check('cafeteria: playlist of 2 and 3', (screens['cafe-1'].model['state']['mode'],
+                                             screens['cafe-1'].model['playlist'], screens['cafe-1'].videos),
+          ('playlist', [2, 3], [2, 3]))
+    check('screens in no group: global settings', (screens['other'].model['group'], screens['other'].videos),
+          (None, [4, 5]))
+    by_group = web.get('/api/manifest', query_string={'view': 'client', 'group_id': cafe}).get_json()
+    check('?group_id= gives the same manifest', by_group['playlist'], [2, 3])
+    check('unknown ?group_id=', web.get('/api/manifest', query_string={'group_id': 99}).status_code, 404)
+    version = database.get_manifest_version()
+    check('client manifests cached per group', {g: entry[0] for g, entry in master._client_manifests.items()},
+          {lobby: version, cafe: version, None: version})
+    lobby_manifest = manifest(web, 'lobby-1')
+    with master.app.test_request_context(query_string={'view': 'client'}):
+        library = master._manifest_videos(database.get_all_videos())
+    rows = [[v[k] for k in master.CLIENT_VIDEO_FIELDS] for v in library]
+    print(f'      lobby manifest {len(json.dumps(lobby_manifest))} bytes, with the whole {len(library)}-clip '
+          f'library {len(json.dumps(dict(lobby_manifest, video_table={"rows": rows})))}')
+
+    print('Deltas only carry the group\'s changes...')
+    web.post('/api/state', json={'group_id': cafe, 'paused': True})
+    web.post('/api/rotate/2', json={'rotation': 90})
+    delta = screens['lobby-1'].refresh()
+    check('lobby delta: no cafeteria pause, no clip 2', ('paused' in delta, delta['videos']), (False, []))
+    delta = screens['cafe-1'].refresh()
+    check('cafeteria delta: paused, clip 2 rotated', (delta['paused'], [v['rotation'] for v in delta['videos']]),
+          (True, [90]))
+    web.post('/api/restart')
+    check('restart reaches every group', all('restart_id' in s.refresh() for s in screens.values()), True)
+
+    web.post('/api/playlist', json={'group_id': cafe, 'ops': [{'op': 'insert', 'video_id': 6}]})
+    data = screens['cafe-1'].refresh()
+    check('new playlist item: full manifest with clip 6', ('video_table' in data, screens['cafe-1'].videos),
+          (True, [2, 3, 6]))
+    check('lobby untouched', screens['lobby-1'].refresh()['videos'], [])
+
+    print('Group schedules and walls...')
+    rule = {'name': 'lobby news', 'mode': 'single', 'video_id': 7, 'start_time': '08:00', 'end_time': '09:00',
+            'group_id': lobby}
+    check('rule for an unknown group rejected', web.post('/api/schedule', json=dict(rule, group_id=99)).status_code, 400)
+    web.post('/api/schedule', json=rule)
+    web.post('/api/schedule', json=dict(rule, name='everyone', video_id=8, group_id=None))
+    for screen in screens.values():
+        screen.refresh()
+    check('lobby gets its rule and everyone\'s', ([r['name'] for r in screens['lobby-1'].model['schedule']],
+                                                 screens['lobby-1'].videos), (['lobby news', 'everyone'], [1, 7, 8]))
+    check('cafeteria only everyone\'s', [r['name'] for r in screens['cafe-1'].model['schedule']], ['everyone'])
+    web.post('/api/state', json={'group_id': cafe, 'wall_sync': True})
+    check('wall timeline for the cafeteria only', (screens['cafe-1'].refresh().get('sync_start') is not None,
+                                                   'sync_start' in screens['other'].refresh()), (True, False))
+
+    print('Moving screens...')
+    web.post('/api/clients/lobby-1/group', json={'group_id': cafe})
+    data = screens['lobby-1'].refresh()
+    check('moved screen gets the cafeteria manifest', (data['group'], screens['lobby-1'].videos), ('Cafeteria', [2, 3, 6, 8]))
+    check('deleted group', web.delete(f'/api/groups/{lobby}').status_code, 200)
+    lobby_2 = Screen(web, 'lobby-2')
+    check('its screens fall back to the global settings', (lobby_2.model['group'], lobby_2.videos), (None, [4, 5, 8]))
+    check('its rules are gone', [r['name'] for r in web.get('/api/schedule').get_json()['rules']], ['everyone'])
+    web.post('/api/delete/3')
+    check('deleted clip leaves the cafeteria playlist', screens['cafe-1'].refresh()['playlist'], [2, 6])
+
+
+if __name__ == '__main__':
+    run()
+    print('Groups Verified.')
@@ -3,6 +3,24 @@ import requests
 import time
 import os
 import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench'))
+from bench_e2e import Harness, measure_latency
+
+MAX_LATENCY_MS = 1000
+
+def measure_action_latency():
+    h = Harness(tempfile.mkdtemp(prefix='signage-verify-'), 2)
+    try:
+        h.start_master()
+        ids = h.upload_videos(1)
+        h.set_state(mode='single', current_video_id=ids[0], paused=False)
+        h.start_agents()
+        h.wait_for_agents()
+        return measure_latency(h, ids[0], 10)
+    finally:
+        h.stop()
 
 def run_verification():
     print("Starting Master Node...")
@@ -28,8 +46,14 @@ def run_verification():
         else:
             print("Dashboard Now Playing Failed.")
 
-        # 3. Latency Check (Conceptual)
-        print("Latency is now set to 0.5s in agent.py (verified by code inspection).")
+        # 3. Latency Check: dashboard action -> command at a stub mpv
+        print("Measuring Action Latency (master + 2 agents on a fake mpv)...")
+        result = measure_action_latency()
+        print(f"Latency p50={result['all']['p50']}ms p99={result['all']['p99']}ms missed={result['missed']}")
+        if result['missed'] == 0 and result['all']['p99'] < MAX_LATENCY_MS:
+            print("Latency Verified.")
+        else:
+            print("Latency Check Failed.")
 
     except Exception as e:
         print(f"Verification Failed: {e}")
@@ -0,0 +1,71 @@
+"""
+Checks playlist edits and batched dashboard changes: insert/remove/move ops
+give the expected order, /api/apply writes state and playlist as a single
+manifest version, and a request with any invalid op changes nothing.
+
+    python verify_playlist.py
+"""
+import io
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'bench'))
+from checks import check, master_client
+
+
+def run():
+    _, database, _, web = master_client('signage-playlist-')
+    for i in range(1, 7):
+        web.post('/api/upload', data={'file': (io.BytesIO(b'clip %d' % i), f'clip{i}.mp4')})
+
+    def playlist():
+        return [item['id'] for item in web.get('/api/playlist').get_json()['items']]
+
+    def edit(*ops):
+        return web.post('/api/playlist', json={'ops': list(ops)})
+
+    print('Playlist ops...')
+    web.post('/api/playlist', json={'video_ids': [1, 2, 3]})
+    check('replaced', playlist(), [1, 2, 3])
+    edit({'op': 'insert', 'video_id': 4})
+    check('insert at the end', playlist(), [1, 2, 3, 4])
+    edit({'op': 'insert', 'video_id': 5, 'position': 0})
+    check('insert at a position', playlist(), [5, 1, 2, 3, 4])
+    edit({'op': 'remove', 'position': 2})
+    check('remove', playlist(), [5, 1, 3, 4])
+    edit({'op': 'move', 'from': 0, 'to': 3})
+    check('move forward', playlist(), [1, 3, 4, 5])
+    edit({'op': 'move', 'from': 2, 'to': 0}, {'op': 'insert', 'video_id': 6, 'position': 1})
+    check('several ops in order', playlist(), [4, 6, 1, 3, 5])
+
+    print('Invalid ops change nothing...')
+    version = database.get_manifest_version()
+    for label, op in (('unknown op', {'op': 'shuffle'}),
+                      ('remove out of range', {'op': 'remove', 'position': 6}),
+                      ('move out of range', {'op': 'move', 'from': 0, 'to': 9}),
+                      ('insert without a video', {'op': 'insert'}),
+                      ('insert past the end', {'op': 'insert', 'video_id': 2, 'position': 7})):
+        check(label, edit({'op': 'insert', 'video_id': 2}, op).status_code, 400)
+    check('playlist and version unchanged', (playlist(), database.get_manifest_version()),
+          ([4, 6, 1, 3, 5], version))
+
+    print('Batched changes...')
+    res = web.post('/api/apply', json={'mode': 'playlist', 'paused': True, 'video_ids': [2, 1]})
+    check('state and playlist as one version', res.get_json()['version'], version + 1)
+    check('both written', (database.get_state()['mode'], database.get_state()['paused'], playlist()),
+          ('playlist', 'true', [2, 1]))
+    delta = web.get('/api/manifest/delta', query_string={'view': 'client', 'since': version}).get_json()
+    check('one delta carries both', (delta['version'], delta['mode'], delta['paused'], 'playlist' in delta),
+          (version + 1, 'playlist', True, True))
+    res = web.post('/api/apply', json={'mode': 'single', 'paused': False,
+                                       'ops': [{'op': 'insert', 'video_id': 3}, {'op': 'remove', 'position': 9}]})
+    check('failing op rejects the batch', res.status_code, 400)
+    check('state, playlist and version unchanged',
+          (database.get_state()['mode'], database.get_state()['paused'], playlist(), database.get_manifest_version()),
+          ('playlist', 'true', [2, 1], version + 1))
+
+
+if __name__ == '__main__':
+    run()
+    print('Playlist Verified.')
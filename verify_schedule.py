@@ -0,0 +1,203 @@
+"""
+Checks the dayparting engine (shared/schedule.py) against a fake clock:
+transitions land on the exact second, lookups between transitions don't
+re-evaluate the rules, and the master publishes the rules in the manifest
+and its deltas so an agent can follow them without the master.
+
+    python verify_schedule.py
+"""
+import datetime
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'bench'))
+from checks import check, master_client
+from shared import schedule
+from client.agent import apply_manifest
+
+
+class FakeClock:
+    """Stands in for time.time(); moved by hand."""
+
+    def __init__(self, when):
+        self.now = when
+
+    def set(self, when):
+        self.now = when
+
+    def __call__(self):
+        return self.now
+
+
+def at(text):
+    """'2026-10-19 06:00:00' (local time) -> epoch seconds."""
+    return datetime.datetime.strptime(text, '%Y-%m-%d %H:%M:%S').timestamp()
+
+
+def use_timezone(name):
+    os.environ['TZ'] = name
+    time.tzset()
+
+
+RULES = [
+    # Menus on weekday mornings, promos every evening, a late Friday show
+    # past midnight and a holiday that overrides everything for a day
+    {'name': 'menu', 'priority': 0, 'mode': 'single', 'video_id': 1,
+     'start_time': '06:00', 'end_time': '11:00', 'days': [0, 1, 2, 3, 4]},
+    {'name': 'promo', 'priority': 0, 'mode': 'playlist', 'playlist': [2, 3],
+     'start_time': '17:00', 'end_time': '22:00'},
+    {'name': 'late', 'priority': 5, 'mode': 'single', 'video_id': 3,
+     'start_time': '22:00', 'end_time': '02:00', 'days': [4]},
+    {'name': 'holiday', 'priority': 10, 'mode': 'single', 'video_id': 2,
+     'start_time': '00:00', 'end_time': '00:00', 'start_date': '2026-10-26', 'end_date': '2026-10-26'},
+]
+
+
+def engine_rules():
+    return [dict(schedule.normalize_rule(rule), id=i) for i, rule in enumerate(RULES, 1)]
+
+
+def verify_engine():
+    print('Engine (UTC)...')
+    use_timezone('UTC')
+    clock = FakeClock(at('2026-10-19 05:59:59'))  # a Monday
+    schedule.clock = clock
+    s = schedule.Schedule(engine_rules())
+
+    def expect(when, name, until):
+        clock.set(at(when))
+        rule, next_change = s.current()
+        check(f'{when} -> {name} until {until}', (rule and rule['name'], next_change), (name, at(until)))
+
+    expect('2026-10-19 05:59:59', None, '2026-10-19 06:00:00')
+    expect('2026-10-19 06:00:00', 'menu', '2026-10-19 11:00:00')
+    expect('2026-10-19 11:00:00', None, '2026-10-19 17:00:00')
+    expect('2026-10-19 21:59:59', 'promo', '2026-10-19 22:00:00')
+    expect('2026-10-19 22:00:00', None, '2026-10-20 06:00:00')
+    # Friday: the late show takes over from the promo and runs into Saturday
+    expect('2026-10-23 21:30:00', 'promo', '2026-10-23 22:00:00')
+    expect('2026-10-23 22:00:00', 'late', '2026-10-24 02:00:00')
+    expect('2026-10-24 01:59:59', 'late', '2026-10-24 02:00:00')
+    expect('2026-10-24 02:00:00', None, '2026-10-24 17:00:00')  # no menu at weekends
+    # The holiday hides Monday's menu and promo
+    expect('2026-10-25 22:00:00', None, '2026-10-26 00:00:00')
+    expect('2026-10-26 09:00:00', 'holiday', '2026-10-27 00:00:00')
+    expect('2026-10-27 00:00:00', None, '2026-10-27 06:00:00')
+
+    print('Caching...')
+    calls = []
+    evaluate = s.evaluate
+    s.evaluate = lambda now: calls.append(now) or evaluate(now)
+    clock.set(at('2026-10-20 06:00:00'))
+    for second in range(5 * 3600):  # every second of Tuesday's menu
+        clock.set(at('2026-10-20 06:00:00') + second)
+        s.current()
+    check('one evaluation for 5 hours of lookups', len(calls), 1)
+    clock.set(at('2026-10-20 11:00:00'))
+    check('re-evaluated at the transition', (s.current()[0], len(calls)), (None, 2))
+    clock.set(at('2026-10-20 07:00:00'))  # clock stepped back (NTP)
+    check('re-evaluated when the clock goes back', (s.current()[0]['name'], len(calls)), ('menu', 3))
+
+    print('Empty and far-off schedules...')
+    clock.set(at('2026-10-19 12:00:00'))
+    check('no rules: nothing until the horizon', schedule.Schedule([]).current(),
+          (None, at('2026-10-27 00:00:00')))
+    later = [dict(schedule.normalize_rule({'mode': 'single', 'video_id': 1, 'start_time': '08:00',
+                                           'end_time': '09:00', 'start_date': '2026-12-24'}), id=1)]
+    check('rule starting in two months: look again at the horizon', schedule.Schedule(later).current(),
+          (None, at('2026-10-27 00:00:00')))
+
+
+def verify_dst():
+    print('DST (Europe/Berlin)...')
+    use_timezone('Europe/Berlin')
+    rules = [dict(schedule.normalize_rule({'mode': 'single', 'video_id': 1,
+                                           'start_time': '01:00', 'end_time': '04:00'}), id=1)]
+    s = schedule.Schedule(rules)
+    start = at('2026-03-29 01:00:00')  # clocks go forward at 02:00
+    check('spring forward: 01:00-04:00 lasts 2 hours', s.current(start)[1] - start, 2 * 3600)
+    start = at('2026-10-25 01:00:00')  # clocks go back at 03:00
+    check('fall back: 01:00-04:00 lasts 4 hours', s.current(start)[1] - start, 4 * 3600)
+
+
+def verify_validation():
+    print('Validation...')
+    bad = [
+        {'mode': 'loop', 'start_time': '06:00', 'end_time': '07:00'},
+        {'mode': 'single', 'start_time': '06:00', 'end_time': '07:00'},
+        {'mode': 'single', 'video_id': 1, 'start_time': '25:00', 'end_time': '07:00'},
+        {'mode': 'single', 'video_id': 1, 'start_time': '06:00', 'end_time': '07:00', 'days': [7]},
+        {'mode': 'single', 'video_id': 1, 'start_time': '06:00', 'end_time': '07:00',
+         'start_date': '2026-10-20', 'end_date': '2026-10-19'},
+    ]
+    for rule in bad:
+        try:
+            schedule.normalize_rule(rule)
+        except ValueError as e:
+            print(f'  ok  rejected: {e}')
+        else:
+            raise AssertionError(f'accepted {rule}')
+    check('times normalized', schedule.normalize_rule({'mode': 'single', 'video_id': '1', 'start_time': '6:5',
+                                                       'end_time': '07:00'})['start_time'], '06:05')
+
+
+def verify_master():
+    print('Master API and manifest...')
+    use_timezone('UTC')
+    web = master_client('signage-schedule-')[3]
+
+    clock = FakeClock(at('2026-10-19 05:59:59'))
+    schedule.clock = clock
+    for i in range(3):
+        upload = web.post('/api/upload', data={'file': (io.BytesIO(b'clip %d' % i), f'clip{i}.mp4')})
+        check(f'uploaded clip{i}', upload.status_code, 200)
+
+    check('unknown video rejected', web.post('/api/schedule', json=dict(RULES[0], video_id=99)).status_code, 400)
+    check('bad time rejected', web.post('/api/schedule', json=dict(RULES[0], end_time='11')).status_code, 400)
+    for rule in RULES:
+        check(f"added {rule['name']}", web.post('/api/schedule', json=rule).status_code, 200)
+
+    manifest = web.get('/api/manifest', query_string={'view': 'client'}).get_json()
+    check('rules in the client manifest', [r['name'] for r in manifest['schedule']],
+          [r['name'] for r in RULES])
+    check('rules in the dashboard manifest', len(web.get('/api/manifest').get_json()['schedule']), len(RULES))
+    status = web.get('/api/schedule').get_json()
+    check('master: nothing active yet', (status['active'], status['until']), (None, at('2026-10-19 06:00:00')))
+    clock.set(at('2026-10-19 06:00:00'))
+    check('master: menu at 06:00', web.get('/api/schedule').get_json()['active'], 1)
+
+    # An agent holding this manifest follows the schedule on its own
+    model = {'version': None, 'state': {}, 'videos': {}, 'playlist': [], 'schedule': []}
+    apply_manifest(model, manifest)
+    offline = schedule.Schedule(model['schedule'])
+    check('agent without master: promo at 17:00', offline.current(at('2026-10-19 17:00:00'))[0]['playlist'], [2, 3])
+
+    version = model['version']
+    web.post('/api/state', json={'paused': True})
+    delta = web.get('/api/manifest/delta', query_string={'since': version, 'view': 'client'}).get_json()
+    check('state-only delta leaves the schedule out', 'schedule' in delta, False)
+    apply_manifest(model, delta)
+
+    check('replacing a missing rule', web.put('/api/schedule/99', json=RULES[0]).status_code, 404)
+    check('replaced promo', web.put('/api/schedule/2', json=dict(RULES[1], end_time='23:00')).status_code, 200)
+    check('deleted late show', web.delete('/api/schedule/3').status_code, 200)
+    check('deleting it again', web.delete('/api/schedule/3').status_code, 404)
+    web.post('/api/delete/3')  # in the promo's playlist
+    delta = web.get('/api/manifest/delta', query_string={'since': model['version'], 'view': 'client'}).get_json()
+    apply_manifest(model, delta)
+    promo = next(r for r in model['schedule'] if r['name'] == 'promo')
+    check('delta carries the edited schedule', (len(model['schedule']), promo['end_time'], promo['playlist']),
+          (3, '23:00', [2]))
+    check('agent model matches the master', model['schedule'], web.get('/api/schedule').get_json()['rules'])
+
+
+if __name__ == '__main__':
+    verify_engine()
+    verify_dst()
+    verify_validation()
+    verify_master()
+    print('Schedule Verified.')
@@ -0,0 +1,100 @@
+"""
+Checks resumable chunked uploads: chunks sent out of order assemble into the
+right file, a re-selected file resumes where it stopped while another file
+with the same name and size starts over, and bad chunks, hash mismatches
+and duplicates are rejected.
+
+    python verify_uploads.py
+"""
+import hashlib
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'bench'))
+from checks import check, master_client
+
+CHUNK = 1024  # small chunks so a few KB make several
+
+
+def fingerprint(name, content, modified):
+    return f'{name}:{len(content)}:{modified}'
+
+
+def run():
+    workdir, database, _, web = master_client('signage-uploads-')
+    media = os.path.join(workdir, 'media')
+    import uploads
+    uploads.CHUNK_SIZE = CHUNK
+
+    def init(name, content, **extra):
+        return web.post('/api/upload/init', json=dict(filename=name, size=len(content), **extra))
+
+    def put(upload_id, idx, content):
+        return web.put(f'/api/upload/{upload_id}/{idx}', data=content[idx * CHUNK:(idx + 1) * CHUNK])
+
+    def finalize(upload_id):
+        return web.post(f'/api/upload/{upload_id}/finalize')
+
+    print('Out-of-order chunks...')
+    content = os.urandom(CHUNK * 4 + 100)
+    session = init('a.mp4', content, fingerprint=fingerprint('a.mp4', content, 1)).get_json()
+    check('chunk size and nothing received', (session['chunk_size'], session['received']), (CHUNK, []))
+    for idx in (3, 0, 4, 2, 1):
+        put(session['upload_id'], idx, content)
+    res = finalize(session['upload_id']).get_json()
+    video = database.get_video(res['id'])
+    with open(os.path.join(media, video['blob']), 'rb') as f:
+        stored = f.read()
+    check('assembled file and hash', (stored == content, video['sha256']),
+          (True, hashlib.sha256(content).hexdigest()))
+
+    print('Resuming...')
+    content = os.urandom(CHUNK * 3)
+    first = init('b.mp4', content, fingerprint=fingerprint('b.mp4', content, 2)).get_json()
+    put(first['upload_id'], 0, content)
+    put(first['upload_id'], 2, content)
+    again = init('b.mp4', content, fingerprint=fingerprint('b.mp4', content, 2)).get_json()
+    check('same file resumes with its chunks', (again['upload_id'], again['received']),
+          (first['upload_id'], [0, 2]))
+    other = os.urandom(CHUNK * 3)
+    fresh = init('b.mp4', other, fingerprint=fingerprint('b.mp4', other, 3)).get_json()
+    check('other file with the same name and size starts over',
+          (fresh['upload_id'] != first['upload_id'], fresh['received']), (True, []))
+    check('no fingerprint or hash: no resume', init('b.mp4', content).get_json()['received'], [])
+    put(first['upload_id'], 1, content)
+    res = finalize(first['upload_id']).get_json()
+    check('resumed upload stored', database.get_video(res['id'])['sha256'], hashlib.sha256(content).hexdigest())
+
+    print('Rejections...')
+    check('non-numeric size', web.post('/api/upload/init', json={'filename': 'c.mp4', 'size': 'big'}).status_code, 400)
+    check('empty file', init('c.mp4', b'').status_code, 400)
+    content = os.urandom(CHUNK * 2)
+    upload_id = init('c.mp4', content, fingerprint='c').get_json()['upload_id']
+    check('short chunk', web.put(f'/api/upload/{upload_id}/0', data=content[:10]).status_code, 400)
+    check('chunk out of range', web.put(f'/api/upload/{upload_id}/5', data=content[:CHUNK]).status_code, 400)
+    put(upload_id, 0, content)
+    res = finalize(upload_id)
+    check('incomplete upload', (res.status_code, res.get_json()['missing']), (409, [1]))
+
+    wrong = init('d.mp4', content, sha256=hashlib.sha256(b'something else').hexdigest()).get_json()
+    for idx in range(2):
+        put(wrong['upload_id'], idx, content)
+    res = finalize(wrong['upload_id'])
+    check('hash mismatch', (res.status_code, res.get_json()['sha256']), (422, hashlib.sha256(content).hexdigest()))
+    check('mismatched upload discarded', web.get(f'/api/upload/{wrong["upload_id"]}').status_code, 404)
+
+    existing = database.get_video(1)
+    res = init('copy.mp4', content, sha256=existing['sha256'])
+    check('duplicate rejected before any bytes', (res.status_code, res.get_json()['id']), (409, 1))
+    with open(os.path.join(media, existing['blob']), 'rb') as f:
+        original = f.read()
+    dup = init('copy.mp4', original, fingerprint='copy').get_json()
+    for idx in range((len(original) + CHUNK - 1) // CHUNK):
+        put(dup['upload_id'], idx, original)
+    check('duplicate without a hash rejected at finalize', finalize(dup['upload_id']).status_code, 409)
+
+
+if __name__ == '__main__':
+    run()
+    print('Uploads Verified.')